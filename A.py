@@ -1,24 +1,45 @@
-
-
 # ============================================================================
-# 1. INSTALL DEPENDENCIES
+# 1. DEPENDENCIES
 # ============================================================================
 
-print("Installing Google Agent Development Kit (ADK)...")
-import subprocess
-import sys
+# Everything comes from requirements.txt - nothing is installed at import time.
+# google.adk itself takes several seconds to import, so it is only imported
+# when the first agent/runner/service is actually needed (see AgentRegistry).
+
+from __future__ import annotations
 
-subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "google-adk", "python-dotenv"], check=False)
-print("✅ Installation complete!")
+import os
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+from context_window import ContextWindow
+from http_pool import HttpPool, pooled_gemini
+from memory_ingest import MemoryIngestor
+from prefix_cache import PrefixCache
+from search_cache import SearchCache
+from resilience import CircuitOpen, Resilience, RetryPolicy
+from scheduler import ModelScheduler, SchedulerBusy, scheduled_model
+from specialist_cache import SemanticCache
+from usage import QuotaExceeded, SqliteUsageLedger, UsageLedger
+
+if TYPE_CHECKING:
+    from google.adk.agents import LlmAgent
+    from google.adk.runners import Runner
+    from google.adk.tools import ToolContext
 
 # ============================================================================
 # 2. SETUP GEMINI API KEY
 # ============================================================================
 
-import os
-from dotenv import load_dotenv
-from pathlib import Path
-
 # Load environment variables from .env file in the same directory as this script
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path, override=True)
@@ -26,64 +47,440 @@ load_dotenv(dotenv_path=env_path, override=True)
 # <<< PUT YOUR API KEY HERE ONCE >>>
 # HARD_CODED_API_KEY = ""  # <-- replace "" with your Gemini API key string
 
-try:
-    # Try Kaggle secrets first (for Kaggle notebooks)
-    from kaggle_secrets import UserSecretsClient
-    GOOGLE_API_KEY = UserSecretsClient().get_secret("GOOGLE_API_KEY")
-    os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
-    print("✅ Gemini API key setup complete! (from Kaggle Secrets)")
-except Exception:
-    GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
-
-    if not GOOGLE_API_KEY:
-        print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
-        print("Set it before running:")
-        print("  Windows: set GOOGLE_API_KEY=your_key_here")
-        print("  Mac/Linux: export GOOGLE_API_KEY=your_key_here")
-   
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
+
+
+def setup_api_key() -> str:
+    """Resolve GOOGLE_API_KEY (Kaggle secrets first, then the environment)."""
+    global GOOGLE_API_KEY
+
+    try:
+        # Try Kaggle secrets first (for Kaggle notebooks)
+        from kaggle_secrets import UserSecretsClient
+        GOOGLE_API_KEY = UserSecretsClient().get_secret("GOOGLE_API_KEY")
+        os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+        print("✅ Gemini API key setup complete! (from Kaggle Secrets)")
+    except Exception:
+        GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
+
+        if not GOOGLE_API_KEY:
+            print("❌ ERROR: GOOGLE_API_KEY environment variable not set!")
+            print("Set it before running:")
+            print("  Windows: set GOOGLE_API_KEY=your_key_here")
+            print("  Mac/Linux: export GOOGLE_API_KEY=your_key_here")
+    return GOOGLE_API_KEY
+
 # ============================================================================
-# 3. IMPORT ADK COMPONENTS
+# 3. CONFIGURATION
 # ============================================================================
 
-from google.adk.agents import LlmAgent
-from google.adk.models.google_llm import Gemini
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.adk.memory import InMemoryMemoryService
-from google.adk.tools import load_memory, google_search
-from google.genai import types
+APP_NAME = "PersonalDevelopmentEcosystem"
+USER_ID = "student_user"
+MODEL_NAME = "gemini-2.5-flash"
+
+# ask_many fan-out: per-specialist deadline (seconds) and how many run at once
+SPECIALIST_TIMEOUT = float(os.environ.get("PDE_SPECIALIST_TIMEOUT", "60"))
+MAX_PARALLEL_SPECIALISTS = int(os.environ.get("PDE_MAX_PARALLEL_SPECIALISTS", "4"))
+
+# whole-turn deadline for /chat (seconds), and how much of it specialists leave
+# for CommandCore to write its reply from whatever they managed to return
+TURN_TIMEOUT = float(os.environ.get("PDE_TURN_TIMEOUT", "120"))
+TURN_RESERVE = float(os.environ.get("PDE_TURN_RESERVE", "10"))
+
+# pass-through (off by default): a specialist CommandCore delegates to streams
+# its answer straight to the client while it is generating (see
+# relay_specialists). With synthesis turned off as well, a turn that consulted
+# exactly one specialist ends with that answer instead of another CommandCore
+# model call rephrasing it - the reply is then the specialist's own words.
+SPECIALIST_PASSTHROUGH = os.environ.get("PDE_SPECIALIST_PASSTHROUGH", "0") == "1"
+COMMANDCORE_SYNTHESIS = os.environ.get("PDE_COMMANDCORE_SYNTHESIS", "1") == "1"
+
+# semantic answer cache in front of query_specialist: seconds each specialist's
+# answers stay fresh (0 = never cached, the answer depends on the student)
+SPECIALIST_CACHE_TTLS = {
+    "Opportune": 30 * 60,      # deadlines and openings change quickly
+    "InfoScout": 6 * 3600,
+    "PathMatch": 24 * 3600,
+    "MistakeMonitor": 0,
+    "MentalLift": 0,
+    "Evaluator": 0,
+}
+# specialists whose answers don't depend on who asks: shared between users,
+# as long as the sub-session had no history yet. The others' cached answers
+# are only reused for the same user.
+SPECIALIST_CACHE_SHARED = {"Opportune", "InfoScout"}
+SPECIALIST_CACHE_THRESHOLD = float(os.environ.get("PDE_SPECIALIST_CACHE_THRESHOLD", "0.85"))
+SPECIALIST_CACHE_SIZE = int(os.environ.get("PDE_SPECIALIST_CACHE_SIZE", "512"))
+
+# multi-worker mode (uvicorn --workers N): sessions, memory and per-session
+# locks shared by every worker process on the box. On by default when
+# WEB_CONCURRENCY (uvicorn's default worker count) is above 1. The model
+# scheduler and the caches stay per process, so PDE_MAX_MODEL_CALLS and
+# PDE_MODEL_RPS apply to each worker (see shared_locks.py). A turn waits
+# at most PDE_SESSION_LOCK_TIMEOUT seconds for another worker's lock.
+SHARED_STATE = os.environ.get(
+    "PDE_SHARED_STATE", "1" if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 else "0"
+) == "1"
+LOCK_DIR = os.environ.get("PDE_LOCK_DIR", str(Path(__file__).parent / "data" / "locks"))
+SESSION_LOCK_TIMEOUT = float(os.environ.get("PDE_SESSION_LOCK_TIMEOUT", "120"))
+
+# session backend: "memory" (bounded, per process) or "sqlite" (durable, shared
+# by every worker on the box - see session_store.SqliteSessionService)
+SESSION_BACKEND = os.environ.get("PDE_SESSION_BACKEND", "sqlite" if SHARED_STATE else "memory")
+SESSION_DB_PATH = os.environ.get("PDE_SESSION_DB", str(Path(__file__).parent / "data" / "sessions.db"))
+
+# memory backend: "vector" (ranked retrieval from a per-user vector index, see
+# memory_store.VectorMemoryService), "sqlite" (keyword match, shared) or
+# "memory" (ADK's in-process keyword store). New events are added to it in the
+# background, in debounced batches (memory_ingest.py).
+MEMORY_BACKEND = os.environ.get("PDE_MEMORY_BACKEND", "vector")
+MEMORY_DB_PATH = os.environ.get("PDE_MEMORY_DB", str(Path(__file__).parent / "data" / "memory.db"))
+MEMORY_TOP_K = int(os.environ.get("PDE_MEMORY_TOP_K", "5"))
+MEMORY_MIN_SCORE = float(os.environ.get("PDE_MEMORY_MIN_SCORE", "0.15"))
+MEMORY_DIMS = int(os.environ.get("PDE_MEMORY_DIMS", "256"))
+# a user's memories switch from exact search to IVF at this many
+MEMORY_IVF_THRESHOLD = int(os.environ.get("PDE_MEMORY_IVF_THRESHOLD", "100000"))
+MEMORY_PROBE_FRACTION = float(os.environ.get("PDE_MEMORY_PROBE_FRACTION", "0.5"))
+# users whose memories stay loaded in the index, and how long an idle user's stay
+MEMORY_MAX_PARTITIONS = int(os.environ.get("PDE_MEMORY_MAX_PARTITIONS", "10000"))
+MEMORY_IDLE_SECONDS = float(os.environ.get("PDE_MEMORY_IDLE_SECONDS", "3600"))
+# a session's new events are written once it has been quiet this long (or
+# MEMORY_INGEST_MAX_DELAY after the first), in batches of up to this many
+MEMORY_INGEST_DEBOUNCE = float(os.environ.get("PDE_MEMORY_INGEST_DEBOUNCE", "2"))
+MEMORY_INGEST_MAX_DELAY = float(os.environ.get("PDE_MEMORY_INGEST_MAX_DELAY", "10"))
+MEMORY_INGEST_BATCH = int(os.environ.get("PDE_MEMORY_INGEST_BATCH", "512"))
+
+# token accounting and budgets (see usage.py): tokens per user per window and
+# per session, 0 = no limit. "sqlite" shares the totals between workers.
+USAGE_BACKEND = os.environ.get("PDE_USAGE_BACKEND", "sqlite" if SHARED_STATE else "memory")
+USAGE_DB_PATH = os.environ.get("PDE_USAGE_DB", str(Path(__file__).parent / "data" / "usage.db"))
+USAGE_USER_TOKENS = int(os.environ.get("PDE_USAGE_USER_TOKENS", "0"))
+USAGE_SESSION_TOKENS = int(os.environ.get("PDE_USAGE_SESSION_TOKENS", "0"))
+USAGE_WINDOW_SECONDS = float(os.environ.get("PDE_USAGE_WINDOW", "86400"))
+# USD per million prompt / cached prompt / completion tokens, for the cost
+# figures in /usage (gemini-2.5-flash list prices)
+USAGE_PRICES = (
+    float(os.environ.get("PDE_PRICE_PROMPT", "0.30")),
+    float(os.environ.get("PDE_PRICE_CACHED", "0.03")),
+    float(os.environ.get("PDE_PRICE_COMPLETION", "2.50")),
+)
+
+# session store bounds (see session_store.BoundedSessionService)
+SESSION_MAX_SESSIONS = int(os.environ.get("PDE_SESSION_MAX_SESSIONS", "10000"))
+SESSION_TTL_SECONDS = float(os.environ.get("PDE_SESSION_TTL_SECONDS", str(6 * 3600)))
+SESSION_MAX_EVENTS = int(os.environ.get("PDE_SESSION_MAX_EVENTS", "200"))
+
+# model call scheduler (see scheduler.py): concurrent Gemini calls, global
+# requests/second (0 = no rate limit) and how much may queue before 429s
+MAX_MODEL_CALLS = int(os.environ.get("PDE_MAX_MODEL_CALLS", "8"))
+MODEL_RATE = float(os.environ.get("PDE_MODEL_RPS", "5"))
+MODEL_BURST = float(os.environ.get("PDE_MODEL_BURST", "10"))
+MODEL_QUEUE_SIZE = int(os.environ.get("PDE_MODEL_QUEUE", "256"))
+MODEL_QUEUE_PER_USER = int(os.environ.get("PDE_MODEL_QUEUE_PER_USER", "16"))
+MODEL_MAX_WAIT = float(os.environ.get("PDE_MODEL_MAX_WAIT", "30"))
+
+# HTTP-level retries inside the Gemini client (429 / 5xx), exponential
+# backoff with jitter - exposed as `retry_config`, built on first use
+RETRY_ATTEMPTS = int(os.environ.get("PDE_RETRY_ATTEMPTS", "5"))
+RETRY_INITIAL_DELAY = float(os.environ.get("PDE_RETRY_INITIAL_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("PDE_RETRY_MAX_DELAY", "30"))
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# one pre-warmed HTTP(/2) connection pool for every agent's model calls (see
+# http_pool.py). PDE_GEMINI_BASE_URL / PDE_HTTP_CA_BUNDLE point it at another
+# endpoint, e.g. a local stub.
+HTTP_POOL_ENABLED = os.environ.get("PDE_HTTP_POOL", "1") == "1"
+HTTP_POOL_SIZE = int(os.environ.get("PDE_HTTP_POOL_SIZE", "20"))
+HTTP2_ENABLED = os.environ.get("PDE_HTTP2", "1") == "1"
+HTTP_KEEPALIVE_SECONDS = float(os.environ.get("PDE_HTTP_KEEPALIVE", "300"))
+HTTP_KEEPWARM_SECONDS = float(os.environ.get("PDE_HTTP_KEEPWARM", "240"))
+HTTP_WARM_CONNECTIONS = int(os.environ.get("PDE_HTTP_WARM_CONNECTIONS", "2"))
+GEMINI_BASE_URL = os.environ.get("PDE_GEMINI_BASE_URL") or None
+HTTP_CA_BUNDLE = os.environ.get("PDE_HTTP_CA_BUNDLE") or None
+
+# around each model call (see resilience.py): transport-error retries,
+# hedging past an agent's p95 and a per-agent circuit breaker
+TRANSPORT_RETRY_ATTEMPTS = int(os.environ.get("PDE_TRANSPORT_RETRY_ATTEMPTS", "3"))
+HEDGE_ENABLED = os.environ.get("PDE_HEDGE", "1") == "1"
+HEDGE_QUANTILE = float(os.environ.get("PDE_HEDGE_QUANTILE", "0.95"))
+HEDGE_BUDGET = float(os.environ.get("PDE_HEDGE_BUDGET", "0.1"))
+BREAKER_THRESHOLD = int(os.environ.get("PDE_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("PDE_BREAKER_RESET_SECONDS", "30"))
+
+# history sent with each model call (see context_window.py): turns kept
+# verbatim, older ones summarised, and a per-agent prompt token budget
+CONTEXT_KEEP_TURNS = int(os.environ.get("PDE_CONTEXT_KEEP_TURNS", "6"))
+CONTEXT_DEFAULT_BUDGET = int(os.environ.get("PDE_CONTEXT_BUDGET", "4000"))
+CONTEXT_BUDGETS = {
+    "CommandCore": int(os.environ.get("PDE_CONTEXT_BUDGET_COMMANDCORE", "8000")),
+}
+
+# context caching of each agent's static instruction + tools (see
+# prefix_cache.py); Gemini only caches prefixes of at least ~1024 tokens
+PREFIX_CACHE_ENABLED = os.environ.get("PDE_PREFIX_CACHE", "1") == "1"
+PREFIX_CACHE_TTL = float(os.environ.get("PDE_PREFIX_CACHE_TTL", "3600"))
+PREFIX_CACHE_MIN_TOKENS = int(os.environ.get("PDE_PREFIX_CACHE_MIN_TOKENS", "1024"))
+
+# web searches made by specialists are cached and coalesced (search_cache.py)
+SEARCH_CACHE_TTL = float(os.environ.get("PDE_SEARCH_CACHE_TTL", "1800"))
+SEARCH_CACHE_SIZE = int(os.environ.get("PDE_SEARCH_CACHE_SIZE", "2048"))
+SEARCH_USER_ID = "web_search"
 
 # ============================================================================
 # 4. HELPER FUNCTION FOR SESSION MANAGEMENT
 # ============================================================================
 
+class SessionLocks:
+    """
+    One asyncio.Lock per (user_id, session_id).
+
+    Held for the whole of a runner turn so two concurrent requests for the
+    same session can't interleave their events. Locks are only weakly
+    referenced and disappear once no turn holds or waits on them.
+    """
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    def get(self, user_id: str, session_id: str, parent: Optional[str] = None) -> asyncio.Lock:
+        # `parent` only matters across processes (shared_locks.py)
+        key = (user_id, session_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+
+async def _commit_session_writes(user_id: str, session_id: str) -> None:
+    # the next worker to lock this session must see this turn's events
+    flush = getattr(registry.session_service, "flush_session", None)
+    if flush is not None:
+        await flush(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+
+if SHARED_STATE:
+    from shared_locks import SharedSessionLocks
+    session_locks = SharedSessionLocks(
+        LOCK_DIR, timeout=SESSION_LOCK_TIMEOUT, on_release=_commit_session_writes
+    )
+else:
+    session_locks = SessionLocks()
+
+model_scheduler = ModelScheduler(
+    max_in_flight=MAX_MODEL_CALLS,
+    rate=MODEL_RATE,
+    burst=MODEL_BURST,
+    max_queue=MODEL_QUEUE_SIZE,
+    max_queue_per_user=MODEL_QUEUE_PER_USER,
+    max_wait=MODEL_MAX_WAIT,
+)
+
+# hedge only with spare scheduler capacity, so duplicates never queue real work
+model_resilience = Resilience(
+    retry=RetryPolicy(attempts=TRANSPORT_RETRY_ATTEMPTS),
+    breaker_threshold=BREAKER_THRESHOLD,
+    breaker_reset=BREAKER_RESET_SECONDS,
+    hedge=HEDGE_ENABLED,
+    hedge_quantile=HEDGE_QUANTILE,
+    hedge_budget=HEDGE_BUDGET,
+    can_hedge=model_scheduler.has_capacity,
+)
+
+context_window = ContextWindow(
+    keep_turns=CONTEXT_KEEP_TURNS,
+    budgets=CONTEXT_BUDGETS,
+    default_budget=CONTEXT_DEFAULT_BUDGET,
+)
+
+http_pool = HttpPool(
+    base_url=GEMINI_BASE_URL,
+    max_connections=HTTP_POOL_SIZE,
+    keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    http2=HTTP2_ENABLED,
+    verify=HTTP_CA_BUNDLE or True,
+    warm_connections=HTTP_WARM_CONNECTIONS,
+    keepwarm=HTTP_KEEPWARM_SECONDS,
+)
+
+prefix_cache = PrefixCache(
+    ttl=PREFIX_CACHE_TTL,
+    refresh_margin=min(300.0, PREFIX_CACHE_TTL / 4),
+    min_tokens=PREFIX_CACHE_MIN_TOKENS,
+    enabled=PREFIX_CACHE_ENABLED,
+)
+
+_retry_config = None
+
+
+def build_retry_config():
+    """types.HttpRetryOptions for every Gemini model (cached; imports google.genai)."""
+    global _retry_config
+    if _retry_config is None:
+        from google.genai import types
+
+        _retry_config = types.HttpRetryOptions(
+            attempts=RETRY_ATTEMPTS,
+            initial_delay=RETRY_INITIAL_DELAY,
+            max_delay=RETRY_MAX_DELAY,
+            exp_base=2,
+            jitter=1,
+            http_status_codes=RETRY_STATUS_CODES,
+        )
+    return _retry_config
+
+# loop.time() by which the current turn must be answered (None: no deadline)
+_turn_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "pde_turn_deadline", default=None
+)
+
+
+@contextlib.contextmanager
+def turn_deadline(seconds: Optional[float]):
+    """Give the turn running inside this block `seconds` to finish (None: no limit)."""
+    deadline = None if seconds is None else asyncio.get_running_loop().time() + seconds
+    token = _turn_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        with contextlib.suppress(ValueError):
+            _turn_deadline.reset(token)
+
+
+def time_left(reserve: float = 0.0) -> Optional[float]:
+    """Seconds left of the current turn's deadline minus `reserve`, or None."""
+    deadline = _turn_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - reserve - asyncio.get_running_loop().time()
+
+
+class SpecialistRelay:
+    """
+    Where the current turn's specialist answers go as they are generated.
+
+    `send(agent, text)` is awaited with each chunk, so a slow client slows
+    the specialist down rather than piling up text. `answered` lists the
+    specialists whose complete answer went out. Set `stream` to False to
+    take each answer in one piece instead of model chunks.
+    """
+
+    def __init__(self, send: Callable[[str, str], Awaitable[None]], synthesize: bool, stream: bool = True):
+        self.send = send
+        self.synthesize = synthesize
+        self.stream = stream
+        self.answered: list[str] = []
+
+
+_specialist_relay: contextvars.ContextVar[Optional[SpecialistRelay]] = contextvars.ContextVar(
+    "pde_specialist_relay", default=None
+)
+
+
+@contextlib.contextmanager
+def relay_specialists(
+    send: Callable[[str, str], Awaitable[None]],
+    synthesize: bool = COMMANDCORE_SYNTHESIS,
+    stream: bool = True,
+):
+    """Relay the answers of specialists consulted inside this block (one at a time) to `send`."""
+    relay = SpecialistRelay(send, synthesize, stream)
+    token = _specialist_relay.set(relay)
+    try:
+        yield relay
+    finally:
+        with contextlib.suppress(ValueError):
+            _specialist_relay.reset(token)
+
+
+def relayed_reply(segments: list[tuple[bool, str]]) -> str:
+    """
+    The reply text of a turn from its (relayed, text) segments in order:
+    everything CommandCore said, plus the relayed specialist answers it
+    didn't go on to synthesize.
+    """
+    kept, synthesized = [], False
+    for relayed, text in reversed(segments):
+        if not relayed:
+            synthesized = True
+        elif synthesized:
+            continue
+        kept.append(text)
+    return "".join(reversed(kept))
+
+
+async def _write_memories(events: list) -> None:
+    service = registry.memory_service
+    if hasattr(service, "add_events_to_memory"):
+        await service.add_events_to_memory(events)
+        return
+    # ADK's services only take whole sessions
+    for app_name, user_id, session_id in {event[:3] for event in events}:
+        session = await registry.session_service.get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id
+        )
+        if session is not None:
+            await service.add_session_to_memory(session)
+
+# follows every event the session service appends (see build_session_service)
+memory_ingestor = MemoryIngestor(
+    _write_memories,
+    debounce=MEMORY_INGEST_DEBOUNCE,
+    max_delay=MEMORY_INGEST_MAX_DELAY,
+    max_batch=MEMORY_INGEST_BATCH,
+    ignore_users=[SEARCH_USER_ID],
+)
+
+# token totals per user / session / agent, and the budgets (see usage.py)
+_usage_options = dict(
+    user_tokens=USAGE_USER_TOKENS,
+    session_tokens=USAGE_SESSION_TOKENS,
+    window=USAGE_WINDOW_SECONDS,
+    prices=USAGE_PRICES,
+)
+usage_ledger = (
+    SqliteUsageLedger(USAGE_DB_PATH, **_usage_options) if USAGE_BACKEND == "sqlite"
+    else UsageLedger(**_usage_options)
+)
+
+specialist_cache = SemanticCache(
+    SPECIALIST_CACHE_TTLS,
+    threshold=SPECIALIST_CACHE_THRESHOLD,
+    max_entries=SPECIALIST_CACHE_SIZE,
+    shared=SPECIALIST_CACHE_SHARED,
+)
+
+
+async def get_or_create_session(user_id: str, session_id: str, app_name: str = APP_NAME):
+    """
+    Return a handle for the session, creating it on first use.
+
+    Goes through the store's per-process handle cache (see
+    session_store.SessionHandleCache), so it's one dict lookup for a known
+    session and safe to call concurrently for the same id.
+    """
+    return await registry.session_service.get_or_create_session(
+        app_name=app_name,
+        user_id=user_id,
+        session_id=session_id,
+    )
+
 async def run_session(
     runner_instance: Runner,
     user_queries: list[str] | str,
-    session_id: str = "default"
+    session_id: str = "default",
+    user_id: str = USER_ID
 ):
     """
     Helper function to run queries in a session and display responses.
     """
+    from google.genai import types
+
     print(f"\n{'='*70}")
     print(f"Session: {session_id}")
     print(f"{'='*70}")
 
-    # Create or retrieve existing session
-    try:
-        session = await session_service.create_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=session_id
-        )
-        print("✅ New session created")
-    except Exception:
-        session = await session_service.get_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=session_id
-        )
-        print("✅ Retrieved existing session")
+    session = await get_or_create_session(user_id, session_id)
+    print("✅ Retrieved existing session" if session.events else "✅ New session created")
 
     if isinstance(user_queries, str):
         user_queries = [user_queries]
@@ -95,24 +492,25 @@ async def run_session(
             parts=[types.Part(text=query)]
         )
 
-        full_response_text = ""
+        chunks: list[str] = []
         print("🤖 Agent: ", end="")
 
-        async for event in runner_instance.run_async(
-            user_id=USER_ID,
-            session_id=session.id,
-            new_message=query_content
-        ):
-            # Collect any streaming text
-            if (
-                event.content
-                and event.content.parts
-                and event.content.parts[0].text
+        with model_scheduler.context(user_id):
+            async for event in runner_instance.run_async(
+                user_id=user_id,
+                session_id=session.id,
+                new_message=query_content
             ):
-                chunk = event.content.parts[0].text
-                full_response_text += chunk
+                # Collect any streaming text
+                if (
+                    event.content
+                    and event.content.parts
+                    and event.content.parts[0].text
+                ):
+                    chunks.append(event.content.parts[0].text)
 
         # After the loop, print whatever was collected
+        full_response_text = "".join(chunks)
         if full_response_text.strip():
             print(full_response_text.strip())
         else:
@@ -120,28 +518,242 @@ async def run_session(
 
 
 # ============================================================================
-# 5. CONFIGURATION & INITIALIZATION
+# 5. AGENT REGISTRY (LAZY CONSTRUCTION)
 # ============================================================================
 
-retry_config = None
+class AgentRegistry:
+    """
+    Builds agents, runners and the shared services on first use.
+
+    Each entry in `specs` describes one agent (instruction, tools and optional
+    sub-agents). Nothing is constructed - and google.adk is not imported -
+    until an agent, runner or service is asked for, so importing this module
+    is cheap. `warm_up()` builds everything ahead of time (e.g. in a
+    background thread once the server is already accepting traffic), and
+    `build_times` records how long each build took.
+
+    `model_factory(name)` may be set before anything is built to give agents
+    a model other than Gemini(MODEL_NAME) - the benchmarks use it to run
+    the whole pipeline against a local fake. With a `scheduler`, every
+    agent's model calls wait for a slot in it (see scheduler.py), and with
+    `resilience` they get retries, hedging and a breaker (resilience.py).
+    A `context_window` compacts the history each call sends and a
+    `prefix_cache` sends static instructions as cached content. With an
+    `http_pool`, all Gemini models share its connections (http_pool.py).
+    A `usage` ledger's budgets are checked before each model call is queued.
+    """
 
-memory_service = InMemoryMemoryService()
-session_service = InMemorySessionService()
+    def __init__(
+        self,
+        specs: dict[str, dict[str, Any]],
+        scheduler: Optional[ModelScheduler] = None,
+        resilience: Optional[Resilience] = None,
+        context_window: Optional[ContextWindow] = None,
+        prefix_cache: Optional[PrefixCache] = None,
+        http_pool: Optional[HttpPool] = None,
+        usage: Optional[UsageLedger] = None,
+    ):
+        self.specs = specs
+        self.scheduler = scheduler
+        self.resilience = resilience
+        self.context_window = context_window
+        self.prefix_cache = prefix_cache
+        self.http_pool = http_pool
+        self.usage = usage
+        self.model_factory: Optional[Callable[[str], Any]] = None
+        self.build_times: dict[str, float] = {}
+        self._agents: dict[str, LlmAgent] = {}
+        self._runners: dict[str, Runner] = {}
+        self._session_service = None
+        self._memory_service = None
+        # warm-up runs in a worker thread while requests may build on the loop
+        self._lock = threading.RLock()
+
+    @property
+    def session_service(self):
+        if self._session_service is None:
+            with self._lock:
+                if self._session_service is None:
+                    started = time.perf_counter()
+                    self._session_service = build_session_service()
+                    self.build_times["session_service"] = time.perf_counter() - started
+        return self._session_service
+
+    @property
+    def memory_service(self):
+        if self._memory_service is None:
+            with self._lock:
+                if self._memory_service is None:
+                    started = time.perf_counter()
+                    self._memory_service = build_memory_service()
+                    self.build_times["memory_service"] = time.perf_counter() - started
+        return self._memory_service
+
+    def agent(self, name: str) -> LlmAgent:
+        agent = self._agents.get(name)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(name)
+                if agent is None:
+                    agent = self._build_agent(name)
+                    self._agents[name] = agent
+        return agent
+
+    def runner(self, name: str) -> Runner:
+        runner = self._runners.get(name)
+        if runner is None:
+            with self._lock:
+                runner = self._runners.get(name)
+                if runner is None:
+                    runner = self._build_runner(name)
+                    self._runners[name] = runner
+        return runner
+
+    async def arunner(self, name: str) -> Runner:
+        """Like runner(), but a first-time build happens off the event loop."""
+        runner = self._runners.get(name)
+        if runner is None:
+            runner = await asyncio.to_thread(self.runner, name)
+        return runner
+
+    def session_stats(self) -> dict:
+        """The session store's stats(), or {} while it hasn't been built."""
+        service = self._session_service
+        return service.stats() if service is not None and hasattr(service, "stats") else {}
+
+    def memory_stats(self) -> dict:
+        """The memory service's stats(), or {} while it hasn't been built."""
+        service = self._memory_service
+        return service.stats() if service is not None and hasattr(service, "stats") else {}
+
+    async def shutdown(self) -> None:
+        """Flush and close whatever the services hold open (called on server shutdown)."""
+        for service in (self._session_service, self._memory_service, self.prefix_cache, self.http_pool):
+            close = getattr(service, "close", None)
+            if close is not None:
+                await close()
+
+    def warm_up(self, names: list[str] | None = None) -> dict[str, float]:
+        """Build the given runners (default: all of them) and return build times."""
+        for name in names or list(self.specs):
+            self.runner(name)
+        return dict(self.build_times)
+
+    def _build_agent(self, name: str) -> LlmAgent:
+        if name not in self.specs:
+            raise KeyError(f"Unknown agent: {name}")
+        spec = self.specs[name]
+
+        started = time.perf_counter()
+        if not GOOGLE_API_KEY:
+            setup_api_key()
+        from google.adk.agents import LlmAgent
+        from google.adk.models.google_llm import Gemini
+
+        if self.model_factory:
+            model = self.model_factory(name)
+        elif self.http_pool is not None:
+            model = pooled_gemini(self.http_pool, model=MODEL_NAME, retry_options=build_retry_config())
+        else:
+            model = Gemini(model=MODEL_NAME, retry_options=build_retry_config())
+        if self.scheduler is not None:
+            model = scheduled_model(model, self.scheduler, name, self.resilience, self.prefix_cache, self.usage)
+
+        agent = LlmAgent(
+            model=model,
+            name=name,
+            instruction=spec["instruction"],
+            tools=spec["tools"]() if spec.get("tools") else [],
+            before_model_callback=self.context_window.before_model if self.context_window else None,
+        )
+        self.build_times[f"agent:{name}"] = time.perf_counter() - started
 
-APP_NAME = "PersonalDevelopmentEcosystem"
-USER_ID = "student_user"
+        if spec.get("sub_agents"):
+            agent.sub_agents = [self.agent(sub) for sub in spec["sub_agents"]]
+        return agent
+
+    def _build_runner(self, name: str) -> Runner:
+        agent = self.agent(name)
+
+        started = time.perf_counter()
+        from google.adk.runners import Runner
+
+        runner = Runner(
+            agent=agent,
+            app_name=APP_NAME,
+            session_service=self.session_service,
+            memory_service=self.memory_service
+        )
+        self.build_times[f"runner:{name}"] = time.perf_counter() - started
+        return runner
+
+
+def build_session_service():
+    """Create the session service selected by PDE_SESSION_BACKEND."""
+    if SESSION_BACKEND == "sqlite":
+        from session_store import SqliteSessionService
+        service = SqliteSessionService(SESSION_DB_PATH)
+    elif SESSION_BACKEND == "memory":
+        from session_store import BoundedSessionService
+        service = BoundedSessionService(
+            max_sessions=SESSION_MAX_SESSIONS,
+            ttl_seconds=SESSION_TTL_SECONDS,
+            max_events=SESSION_MAX_EVENTS,
+        )
+    else:
+        raise ValueError(f"Unknown PDE_SESSION_BACKEND: {SESSION_BACKEND!r}")
+    service.event_listeners.append(memory_ingestor.observe)
+    return service
+
+
+def build_memory_service():
+    """Create the memory service selected by PDE_MEMORY_BACKEND."""
+    if MEMORY_BACKEND == "vector":
+        from memory_store import VectorMemoryService
+        return VectorMemoryService(
+            MEMORY_DB_PATH,
+            dims=MEMORY_DIMS,
+            top_k=MEMORY_TOP_K,
+            min_score=MEMORY_MIN_SCORE,
+            ivf_threshold=MEMORY_IVF_THRESHOLD,
+            probe_fraction=MEMORY_PROBE_FRACTION,
+            max_partitions=MEMORY_MAX_PARTITIONS,
+            idle_seconds=MEMORY_IDLE_SECONDS,
+        )
+    if MEMORY_BACKEND == "sqlite":
+        from memory_store import SqliteMemoryService
+        return SqliteMemoryService(MEMORY_DB_PATH)
+    if MEMORY_BACKEND == "memory":
+        from google.adk.memory import InMemoryMemoryService
+        return InMemoryMemoryService()
+    raise ValueError(f"Unknown PDE_MEMORY_BACKEND: {MEMORY_BACKEND!r}")
+
+
+def _builtin_search_tools() -> list:
+    from google.adk.tools import google_search as builtin_google_search
+    return [builtin_google_search]
+
+
+def _search_tools() -> list:
+    # the cached wrapper (section 7), not the built-in: see search_cache.py
+    return [google_search]
+
+
+def _memory_tools() -> list:
+    # searches the calling user's long-term memory (registry.memory_service)
+    from google.adk.tools import load_memory
+    return [load_memory]
 
-print("✅ Configuration and services initialized!")
+
+def _search_and_memory_tools() -> list:
+    return _search_tools() + _memory_tools()
 
 # ============================================================================
 # 6. DEFINE ALL SPECIALIST AGENTS
 # ============================================================================
 
 # --- AGENT 1: PathMatch ---
-pathmatch_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="PathMatch",
-    instruction="""You are PathMatch, an expert career counselor and interest discovery specialist.
+pathmatch_instructions = """You are PathMatch, an expert career counselor and interest discovery specialist.
 
 Your purpose: Help students discover their true passions through intelligent questioning.
 
@@ -165,13 +777,9 @@ Key principles:
 
 Remember: Your goal is clarity. By the end, they should feel "Yes! This is exactly what I want to do!"
 """
-)
 
 # --- AGENT 2: InfoScout ---
-infoscout_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="InfoScout",
-    instruction="""You are InfoScout, an expert research assistant and information analyst.
+infoscout_instructions = """You are InfoScout, an expert research assistant and information analyst.
 
 YOUR MISSION:
 Help students find reliable, up-to-date information by conducting thorough research and analysis.
@@ -203,15 +811,10 @@ RESPONSE FORMAT:
 - End with "Need more details on any aspect?"
 
 Remember: You're helping students learn, so be thorough but understandable!
-""",
-    tools=[google_search]
-)
+"""
 
 # --- AGENT 3: Opportune ---
-opportune_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="Opportune",
-    instruction="""You are Opportune, a proactive opportunity finder and career development assistant.
+opportune_instructions = """You are Opportune, a proactive opportunity finder and career development assistant.
 
 YOUR MISSION:
 Help students discover and seize opportunities that match their interests, skills, and goals.
@@ -252,16 +855,10 @@ PERSONALITY:
 - Supportive about rejections
 
 Remember: Every opportunity is a chance to grow, even if they don't win!
-""",
-
-    tools=[google_search]
-)
+"""
 
 # --- AGENT 4: MistakeMonitor ---
-mistakemonitor_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="MistakeMonitor",
-    instruction="""You are MistakeMonitor, an expert error analyst and learning accelerator.
+mistakemonitor_instructions = """You are MistakeMonitor, an expert error analyst and learning accelerator.
 
 YOUR MISSION:
 Transform every mistake into a powerful learning opportunity through detailed, compassionate analysis.
@@ -279,7 +876,7 @@ YOUR ANALYSIS PROCESS:
 4. **Explain Clearly**: Break down the issue in simple terms
 5. **Provide Solution**: Step-by-step correction
 6. **Prevent Recurrence**: Share tips to avoid similar errors
-7. **Track Patterns**: Note if this is a recurring issue (use memory)
+7. **Track Patterns**: Note if this is a recurring issue (search past mistakes with load_memory)
 
 RESPONSE FORMAT:
 **Error Identified**: [Brief description]
@@ -307,22 +904,16 @@ TONE & APPROACH:
 - **Encouraging**: Celebrate progress and effort
 
 SPECIAL FEATURES:
-- Use memory to track recurring mistakes
+- Use load_memory to track recurring mistakes
 - Identify learning patterns
 - Suggest targeted practice
 - Celebrate when previously problematic areas improve
 
 Remember: Every bug is a teacher, every error is an opportunity!
-""",
-    tools =[google_search]
-
-)
+"""
 
 # --- AGENT 5: MentalLift ---
-mentallift_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="MentalLift",
-    instruction="""You are MentalLift, a compassionate wellness and motivation coach.
+mentallift_instructions = """You are MentalLift, a compassionate wellness and motivation coach.
 
 YOUR MISSION:
 Support students' emotional well-being, maintain motivation, and build resilience through challenges.
@@ -382,22 +973,17 @@ IMPORTANT GUARDRAILS:
 - Keep confidentiality and privacy respected
 
 MEMORY INTEGRATION:
+- Call load_memory with a short query to recall this student's past conversations
 - Remember their past struggles and victories
 - Notice patterns in their challenges
 - Celebrate growth from previous sessions
 - Reference their resilience when they doubt themselves
 
 Remember: Mental wellness is as important as intellectual growth. You're their champion! 🏆
-""",
-    tools=[google_search]
-
-)
+"""
 
 # --- AGENT 6: Evaluator ---
-evaluator_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="Evaluator",
-    instruction="""You are Evaluator, a strategic planning and performance tracking specialist.
+evaluator_instructions = """You are Evaluator, a strategic planning and performance tracking specialist.
 
 YOUR MISSION:
 Help students understand their progress, identify growth areas, and create clear strategic roadmaps for continuous improvement.
@@ -491,115 +1077,391 @@ EVALUATION PRINCIPLES:
 - Self-awareness is the foundation for improvement
 
 Remember: Your job is to help them see clearly where they are, inspire them with where they can go, and give them a practical path to get there! 🗺️
-""",
-    tools=[google_search]
-)
+"""
 
-print("✅ All 6 specialist agents created successfully!")
+SPECIALIST_NAMES = [
+    "PathMatch",
+    "InfoScout",
+    "Opportune",
+    "MistakeMonitor",
+    "MentalLift",
+    "Evaluator",
+]
 
 # ============================================================================
-# 7. INITIALIZE RUNNERS
+# 7. DEFINE ROUTING TOOLS
 # ============================================================================
 
-pathmatch_runner = Runner(
-    agent=pathmatch_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
-)
-infoscout_runner = Runner(
-    agent=infoscout_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
-)
-opportune_runner = Runner(
-    agent=opportune_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
-)
-mistakemonitor_runner = Runner(
-    agent=mistakemonitor_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
-)
-mentallift_runner = Runner(
-    agent=mentallift_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
-)
-evaluator_runner = Runner(
-    agent=evaluator_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
-)
-
-print("✅ All runners initialized!")
-
-# ============================================================================
-# 7.5. DEFINE ROUTING TOOLS
-# ============================================================================
+async def query_specialist(
+    runner_instance: Runner,
+    prompt: str,
+    user_id: str = USER_ID,
+    parent_session_id: str | None = None,
+    relay: SpecialistRelay | None = None,
+) -> str:
+    """
+    Helper to query a specialist agent and get the text response.
+
+    The specialist's sub-session belongs to the calling user and is scoped to
+    the parent (CommandCore) session, so different users and different
+    conversations never share specialist history. Answers to near-duplicate
+    prompts come from `specialist_cache` when the specialist allows it; a
+    cached answer is still recorded in the sub-session, so the specialist's
+    next run sees the exchange.
+    Inside a `turn_deadline`, the run is cut off `TURN_RESERVE` seconds
+    before the turn's deadline and returns what it has by then.
+    With a `relay`, the answer also goes to the client chunk by chunk as the
+    model streams it. Tokens are charged to the user and the parent session
+    (see usage.py); QuotaExceeded propagates and ends the turn.
+    """
+    from google.genai import types
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+
+    name = runner_instance.agent.name
+    scope = parent_session_id or user_id
+    sub_session_id = f"{scope}-{name}"
+    with metrics.span("specialist", agent=name, user_id=user_id) as span:
+        cached = history = None
+        if specialist_cache.enabled(name):
+            # an answer given with earlier exchanges in view only fits this conversation
+            history = sub_session_id if await has_history(user_id, sub_session_id) else None
+            cached = specialist_cache.get(name, prompt, user_id, history)
+        if cached is not None:
+            span.attributes["cache"] = "hit"
+            metrics.SPECIALIST_CALLS.inc(agent=name, outcome="cache_hit")
+            async with session_locks.get(user_id, sub_session_id, parent_session_id):
+                await get_or_create_session(user_id, sub_session_id)
+                await append_exchange(user_id, sub_session_id, name, prompt, cached, "cached")
+            if relay is not None:
+                await relay.send(name, cached)
+                relay.answered.append(name)
+            return cached
+
+        # don't even open the sub-session while this specialist's backend is failing
+        breaker = model_resilience.breaker(name)
+        if breaker.is_open():
+            span.status = "circuit_open"
+            metrics.SPECIALIST_CALLS.inc(agent=name, outcome="circuit_open")
+            return f"[{name} is temporarily unavailable, try again in {breaker.retry_after():.0f}s]"
+
+        # leave the rest of the turn's deadline to CommandCore's own reply
+        budget = time_left(TURN_RESERVE)
+        if budget is not None and budget <= 0:
+            span.status = "no_time"
+            metrics.SPECIALIST_CALLS.inc(agent=name, outcome="no_time")
+            return f"[{name} was skipped: not enough time left in this turn]"
+
+        started = time.perf_counter()
+        async with session_locks.get(user_id, sub_session_id, parent_session_id):
+            with metrics.STAGE_SECONDS.time(stage="session_lookup", agent=name):
+                session = await get_or_create_session(user_id, sub_session_id)
+
+            content = types.Content(role="user", parts=[types.Part(text=prompt)])
+            streaming = relay is not None and relay.stream
+            run_config = RunConfig(streaming_mode=StreamingMode.SSE) if streaming else None
+            chunks: list[str] = []
+            relayed: list[str] = []
+            streamed_partial = False
+
+            # We need to catch potential errors during the sub-agent run
+            try:
+                async with asyncio.timeout(budget):
+                    async for event in metrics.track_run(name, runner_instance.run_async(
+                        user_id=user_id,
+                        session_id=session.id,
+                        new_message=content,
+                        run_config=run_config,
+                    )):
+                        await usage_ledger.record(user_id, scope, name, event)
+                        if not (event.content and event.content.parts and event.content.parts[0].text):
+                            continue
+                        text = event.content.parts[0].text
+                        if event.partial:
+                            # SSE mode: the chunks, then one event repeating them all
+                            streamed_partial = True
+                            relayed.append(text)
+                            await relay.send(name, text)
+                            continue
+                        chunks.append(text)
+                        if streaming and not streamed_partial:
+                            relayed.append(text)
+                            await relay.send(name, text)
+                        streamed_partial = False
+            except TimeoutError:
+                # the run was cancelled; pass on whatever it had said so far
+                span.status = "timeout"
+                metrics.SPECIALIST_CALLS.inc(agent=name, outcome="timeout")
+                partial = ("".join(chunks) or "".join(relayed)).strip()
+                if partial:
+                    return f"{partial}\n[{name} ran out of time; this answer may be incomplete]"
+                return f"[{name} ran out of time before answering]"
+            except SchedulerBusy as e:
+                span.status = "rejected"
+                metrics.SPECIALIST_CALLS.inc(agent=name, outcome="rejected")
+                return f"[{name} is busy right now, try again in {e.retry_after:.0f}s]"
+            except CircuitOpen as e:
+                span.status = "circuit_open"
+                metrics.SPECIALIST_CALLS.inc(agent=name, outcome="circuit_open")
+                return f"[{name} is temporarily unavailable, try again in {e.retry_after:.0f}s]"
+            except QuotaExceeded:
+                # CommandCore's next call would be refused too
+                span.status = "quota"
+                metrics.SPECIALIST_CALLS.inc(agent=name, outcome="quota")
+                raise
+            except Exception as e:
+                span.status = f"error: {type(e).__name__}"
+                metrics.SPECIALIST_CALLS.inc(agent=name, outcome="error")
+                return f"[Error consulting {name}: {str(e)}]"
+
+        full_response = "".join(chunks)
+        metrics.SPECIALIST_CALLS.inc(agent=name, outcome="ok")
+        specialist_cache.put(name, prompt, full_response, time.perf_counter() - started, user_id, history)
+        if relay is not None:
+            if not streaming:
+                await relay.send(name, full_response)
+            relay.answered.append(name)
+        return full_response
+
+async def has_history(user_id: str, session_id: str) -> bool:
+    """Whether the session exists and has any events."""
+    from google.adk.sessions.base_session_service import GetSessionConfig
+
+    session = await registry.session_service.get_session(
+        app_name=APP_NAME, user_id=user_id, session_id=session_id,
+        config=GetSessionConfig(num_recent_events=1),
+    )
+    return session is not None and bool(session.events)
+
+async def append_exchange(user_id: str, session_id: str, author: str, message: str, reply: str, kind: str) -> None:
+    """Record a user message and `author`'s reply in a session as one invocation (if it exists)."""
+    from google.adk.events import Event
+    from google.adk.sessions.base_session_service import GetSessionConfig
+    from google.genai import types
+
+    session_service = registry.session_service
+    # appending needs the session, not its history
+    session = await session_service.get_session(
+        app_name=APP_NAME, user_id=user_id, session_id=session_id,
+        config=GetSessionConfig(num_recent_events=1),
+    )
+    if session is None:
+        return
+    invocation_id = f"e-{kind}-{Event.new_id()}"
+    await session_service.append_event(session, Event(
+        author="user",
+        invocation_id=invocation_id,
+        content=types.Content(role="user", parts=[types.Part(text=message)]),
+    ))
+    await session_service.append_event(session, Event(
+        author=author,
+        invocation_id=invocation_id,
+        content=types.Content(role="model", parts=[types.Part(text=reply)]),
+    ))
+
+async def answer_directly(name: str, message: str, user_id: str, session_id: str) -> str:
+    """
+    Answer a whole turn with one specialist, without going through CommandCore.
+
+    Used when the pre-router (router.py) is confident about the intent. The
+    exchange is still recorded in the CommandCore session so later turns that
+    do go through CommandCore see it. The reply is recorded as CommandCore's:
+    the runner resumes whichever agent authored the last event, and the next
+    turn must start at CommandCore again. Inside `relay_specialists` the
+    answer streams out as it is generated.
+    """
+    reply = await query_specialist(
+        registry.runner(name),
+        message,
+        user_id=user_id,
+        parent_session_id=session_id,
+        relay=_specialist_relay.get(),
+    )
+    await append_exchange(user_id, session_id, "CommandCore", message, reply, "prerouted")
+    return reply
+
+def _sole_call(tool_context: ToolContext) -> bool:
+    """Whether the tool call in `tool_context` was the only one in its model response."""
+    for event in reversed(tool_context.session.events):
+        calls = event.get_function_calls()
+        if any(call.id == tool_context.function_call_id for call in calls):
+            return len(calls) == 1
+    return False
+
+async def consult_specialist(name: str, question: str, tool_context: ToolContext | None = None) -> str:
+    """
+    Query a specialist by name on behalf of the user/session that invoked the tool.
 
-async def query_specialist(runner_instance: Runner, prompt: str) -> str:
-    """Helper to query a specialist agent and get the text response."""
-    sub_session_id = f"{USER_ID}-{runner_instance.agent.name}"
+    Inside `relay_specialists`, a specialist that is the only call in
+    CommandCore's response streams its answer to the client. Without
+    synthesis, that answer ends the turn: CommandCore isn't called again to
+    rephrase it.
+    """
+    if tool_context is None:
+        return await query_specialist(registry.runner(name), question)
+    session = tool_context.session
+    relay = _specialist_relay.get()
+    if relay is not None and not _sole_call(tool_context):
+        # parallel answers would interleave; CommandCore combines them instead
+        relay = None
+    reply = await query_specialist(
+        registry.runner(name),
+        question,
+        user_id=session.user_id,
+        parent_session_id=session.id,
+        relay=relay,
+    )
+    if relay is not None and not relay.synthesize and name in relay.answered:
+        tool_context.actions.skip_summarization = True
+    return reply
+
+search_instructions = """You are WebSearch, a search tool used by other assistants.
+Search the web with google_search for the query you are given and reply with a
+short factual digest of the most relevant results: key facts, names, dates,
+deadlines and figures, each with the site it came from. No advice, no opinions,
+no follow-up questions."""
+
+
+async def _search_with_agent(query: str) -> dict:
+    """Run one grounded search through SearchAgent in a throwaway session."""
+    from google.genai import types
+
+    # google_search is a Gemini built-in, so a search is a model call of its
+    # own. It is charged to the turn whose search missed the cache (whoever
+    # joins it later gets it for free): that turn's budget must allow it, and
+    # its model call queues in model_scheduler under that turn's user.
+    turn = usage_ledger.turn()
+    if turn is not None:
+        await usage_ledger.check(*turn)
+    user_id, session_id = turn or (SEARCH_USER_ID, None)
+
+    runner = await registry.arunner("SearchAgent")
+    session_service = registry.session_service
+    session = await session_service.create_session(app_name=APP_NAME, user_id=SEARCH_USER_ID)
+    parts: list[str] = []
+    sources: dict[str, str] = {}
     try:
-        session = await session_service.create_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=sub_session_id
-        )
-    except Exception:
-        session = await session_service.get_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=sub_session_id
+        async for event in metrics.track_run("SearchAgent", runner.run_async(
+            user_id=SEARCH_USER_ID,
+            session_id=session.id,
+            new_message=types.Content(role="user", parts=[types.Part(text=query)]),
+        )):
+            await usage_ledger.record(user_id, session_id, "SearchAgent", event)
+            if event.content and event.content.parts and not event.partial:
+                parts.extend(part.text for part in event.content.parts if part.text)
+            grounding = event.grounding_metadata
+            for chunk in (grounding.grounding_chunks or []) if grounding else []:
+                if chunk.web and chunk.web.uri:
+                    sources[chunk.web.uri] = chunk.web.title or chunk.web.uri
+    finally:
+        await session_service.delete_session(
+            app_name=APP_NAME, user_id=SEARCH_USER_ID, session_id=session.id
         )
+    return {
+        "query": query,
+        "summary": "".join(parts).strip(),
+        "sources": [{"title": title, "url": url} for url, title in sources.items()],
+    }
 
-    content = types.Content(role="user", parts=[types.Part(text=prompt)])
-    full_response = ""
-    
-    # We need to catch potential errors during the sub-agent run
+
+search_cache = SearchCache(_search_with_agent, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE)
+
+
+async def google_search(query: str) -> dict:
+    """Search the web with Google and return a digest of the top results and their sources."""
     try:
-        async for event in runner_instance.run_async(
-            user_id=USER_ID,
-            session_id=session.id,
-            new_message=content
-        ):
-            if event.content and event.content.parts and event.content.parts[0].text:
-                full_response += event.content.parts[0].text
+        return await search_cache.search(query)
+    except SchedulerBusy as e:
+        return {"query": query, "error": f"search is busy, try again in {e.retry_after:.0f}s"}
     except Exception as e:
-        return f"[Error consulting {runner_instance.agent.name}: {str(e)}]"
-
-    return full_response
+        return {"query": query, "error": f"search failed: {e}"}
 
-async def ask_pathmatch(question: str):
+# ADK fills in `tool_context` (the calling session) by parameter name. It stays
+# unannotated because ADK resolves tool annotations at runtime and google.adk
+# is only imported lazily here.
+async def ask_pathmatch(question: str, tool_context=None):
     """Consult PathMatch, the interest discovery specialist, with a specific question."""
-    return await query_specialist(pathmatch_runner, question)
+    return await consult_specialist("PathMatch", question, tool_context)
 
-async def ask_infoscout(question: str):
+async def ask_infoscout(question: str, tool_context=None):
     """Consult InfoScout, the research assistant, to find information."""
-    return await query_specialist(infoscout_runner, question)
+    return await consult_specialist("InfoScout", question, tool_context)
 
-async def ask_opportune(question: str):
+async def ask_opportune(question: str, tool_context=None):
     """Consult Opportune to find competitions, jobs, or scholarships."""
-    return await query_specialist(opportune_runner, question)
+    return await consult_specialist("Opportune", question, tool_context)
 
-async def ask_mistakemonitor(question: str):
+async def ask_mistakemonitor(question: str, tool_context=None):
     """Consult MistakeMonitor to analyze errors or bugs."""
-    return await query_specialist(mistakemonitor_runner, question)
+    return await consult_specialist("MistakeMonitor", question, tool_context)
 
-async def ask_mentallift(question: str):
+async def ask_mentallift(question: str, tool_context=None):
     """Consult MentalLift for emotional support or motivation."""
-    return await query_specialist(mentallift_runner, question)
+    return await consult_specialist("MentalLift", question, tool_context)
 
-async def ask_evaluator(question: str):
+async def ask_evaluator(question: str, tool_context=None):
     """Consult Evaluator to track progress or create roadmaps."""
-    return await query_specialist(evaluator_runner, question)
+    return await consult_specialist("Evaluator", question, tool_context)
+
+async def ask_many(
+    specialists: list[str],
+    question: str,
+    tool_context=None
+) -> dict:
+    """
+    Consult several specialists at once with the same question.
+
+    Args:
+        specialists: Specialist names, e.g. ["MistakeMonitor", "InfoScout", "MentalLift"].
+        question: The question every selected specialist should answer.
+
+    Returns:
+        "answers" maps each specialist that replied to its answer; "failed"
+        maps each specialist that timed out or errored to the reason.
+    """
+    known = {name.lower(): name for name in SPECIALIST_NAMES}
+    answers: dict[str, str] = {}
+    failed: dict[str, str] = {}
+
+    selected: list[str] = []
+    for requested in specialists:
+        name = known.get(requested.strip().lower())
+        if name is None:
+            failed[requested] = "unknown specialist"
+        elif name not in selected:
+            selected.append(name)
+
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_SPECIALISTS)
+
+    async def consult(name: str) -> None:
+        # each runs in a task of its own: no pass-through, CommandCore combines the answers
+        _specialist_relay.set(None)
+        async with semaphore:
+            try:
+                answers[name] = await asyncio.wait_for(
+                    consult_specialist(name, question, tool_context),
+                    SPECIALIST_TIMEOUT,
+                )
+            except (QuotaExceeded, CircuitOpen, SchedulerBusy):
+                # not this specialist's failure: the turn ends and main.py answers 429/503
+                raise
+            except asyncio.TimeoutError:
+                failed[name] = f"timed out after {SPECIALIST_TIMEOUT:g}s"
+            except Exception as e:
+                failed[name] = str(e) or type(e).__name__
+
+    consults = [asyncio.create_task(consult(name)) for name in selected]
+    try:
+        await asyncio.gather(*consults)
+    finally:
+        # after a rejection, the others would only be refused in turn
+        for task in consults:
+            task.cancel()
+
+    # in the order they were asked for, not the order they finished
+    return {
+        "answers": {name: answers[name] for name in selected if name in answers},
+        "failed": failed,
+    }
 
 
 # ============================================================================
@@ -636,6 +1498,7 @@ When user asks about:
 - "I'm struggling/demotivated" → MentalLift (support)
 - "How am I doing?" → Evaluator (progress)
 - Multiple needs → Orchestrate team collaboration
+  (use ask_many to consult independent specialists in parallel)
 
 ORCHESTRATION EXAMPLES:
 
@@ -657,6 +1520,7 @@ COMMUNICATION STYLE:
 - Empowering: Focus on student agency and growth
 
 MEMORY INTEGRATION:
+- Call load_memory with a short query to recall this student's past conversations
 - Remember their journey: interests, goals, challenges
 - Reference past conversations to show continuity
 - Build on previous insights
@@ -672,51 +1536,83 @@ Remember: You're not just an AI - you're a team of specialists working in perfec
 """
 
 
-commandcore_agent = LlmAgent(
-    model=Gemini(model="gemini-2.5-flash"),
-    name="CommandCore",
-    instruction=commandcore_instructions,
-    tools=[
+def _commandcore_tools() -> list[Callable]:
+    return [
         ask_pathmatch,
         ask_infoscout,
         ask_opportune,
         ask_mistakemonitor,
         ask_mentallift,
-        ask_evaluator
+        ask_evaluator,
+        ask_many,
+        *_memory_tools(),
     ]
-)
 
-commandcore_agent.sub_agents = [
-    pathmatch_agent,
-    infoscout_agent,
-    opportune_agent,
-    mistakemonitor_agent,
-    mentallift_agent,
-    evaluator_agent
-]
 
-commandcore_runner = Runner(
-    agent=commandcore_agent,
-    app_name=APP_NAME,
-    session_service=session_service,
-    memory_service=memory_service
+AGENT_SPECS: dict[str, dict[str, Any]] = {
+    "SearchAgent": {"instruction": search_instructions, "tools": _builtin_search_tools},
+    "PathMatch": {"instruction": pathmatch_instructions},
+    "InfoScout": {"instruction": infoscout_instructions, "tools": _search_tools},
+    "Opportune": {"instruction": opportune_instructions, "tools": _search_tools},
+    "MistakeMonitor": {"instruction": mistakemonitor_instructions, "tools": _search_and_memory_tools},
+    "MentalLift": {"instruction": mentallift_instructions, "tools": _search_and_memory_tools},
+    "Evaluator": {"instruction": evaluator_instructions, "tools": _search_tools},
+    "CommandCore": {
+        "instruction": commandcore_instructions,
+        "tools": _commandcore_tools,
+        "sub_agents": SPECIALIST_NAMES,
+    },
+}
+
+registry = AgentRegistry(
+    AGENT_SPECS,
+    scheduler=model_scheduler,
+    resilience=model_resilience,
+    context_window=context_window,
+    prefix_cache=prefix_cache,
+    http_pool=http_pool if HTTP_POOL_ENABLED else None,
+    usage=usage_ledger,
 )
 
-print("✅ CommandCore (orchestrator) created and configured!")
-print("\n📋 Agent Team Roster:")
-print("=" * 70)
-for i, agent in enumerate(commandcore_agent.sub_agents, 1):
-    print(f"   {i}. {agent.name}")
-print("=" * 70)
+# The old module-level globals (`commandcore_runner`, `pathmatch_agent`,
+# `session_service`, ...) still work, but are now resolved through the
+# registry on first access instead of being built at import time.
+_LAZY_ATTRIBUTES = {
+    f"{name.lower()}_{kind}": (kind, name)
+    for name in AGENT_SPECS
+    for kind in ("agent", "runner")
+}
+
+
+def __getattr__(name: str):
+    if name == "retry_config":
+        return build_retry_config()
+    if name == "session_service":
+        return registry.session_service
+    if name == "memory_service":
+        return registry.memory_service
+    if name in _LAZY_ATTRIBUTES:
+        kind, agent_name = _LAZY_ATTRIBUTES[name]
+        return registry.agent(agent_name) if kind == "agent" else registry.runner(agent_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ============================================================================
 # 9. FINAL TEST - COMPLETE MULTI-AGENT ECOSYSTEM
 # ============================================================================
 
-print("\n🎯 COMPREHENSIVE MULTI-AGENT SYSTEM TEST")
-print("=" * 70)
-
 async def run_final_test():
+    commandcore_runner = registry.runner("CommandCore")
+
+    print("✅ CommandCore (orchestrator) created and configured!")
+    print("\n📋 Agent Team Roster:")
+    print("=" * 70)
+    for i, agent in enumerate(commandcore_runner.agent.sub_agents, 1):
+        print(f"   {i}. {agent.name}")
+    print("=" * 70)
+
+    print("\n🎯 COMPREHENSIVE MULTI-AGENT SYSTEM TEST")
+    print("=" * 70)
+
     test_queries = [
         "Hi! I'm a Class 11 student interested in AI and web development. Can you help me understand what I'm really passionate about?",
         "Based on that, what competitions or opportunities should I be looking for right now?",
@@ -734,7 +1630,6 @@ async def run_final_test():
     print("=" * 70)
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(run_final_test())
 
-#bibliohraphy :: gemini AI for refining codes. 
+#bibliohraphy :: gemini AI for refining codes.
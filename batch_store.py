@@ -0,0 +1,74 @@
+# batch_store.py
+#
+# Checkpoints for /chat/batch (see main.py). Every finished item of a batch is
+# appended as one JSON line to <directory>/<batch_id>.jsonl, so a batch that
+# died half-way can be sent again with the same batch_id and only the items
+# without a checkpoint are run. Each record carries a fingerprint of its item,
+# so an item that was changed between attempts is run again rather than
+# answered from the old result.
+
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Any
+
+_BATCH_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+
+def item_fingerprint(user_id: str, session_id: str, message: str, agent: str | None) -> str:
+    payload = json.dumps([user_id, session_id, message, agent or ""])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class BatchCheckpoints:
+    """Append-only per-batch JSONL files of finished items."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def valid_id(batch_id: str) -> bool:
+        return bool(_BATCH_ID.match(batch_id)) and batch_id not in (".", "..")
+
+    def _path(self, batch_id: str) -> Path:
+        if not self.valid_id(batch_id):
+            raise ValueError(f"invalid batch_id: {batch_id!r}")
+        return self.directory / f"{batch_id}.jsonl"
+
+    def load(self, batch_id: str) -> dict[str, dict[str, Any]]:
+        """Finished records of `batch_id` by item id (latest wins)."""
+        path = self._path(batch_id)
+        done: dict[str, dict[str, Any]] = {}
+        if not path.exists():
+            return done
+        with path.open(encoding="utf-8") as f:
+            text = f.read()
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash mid-write
+            done[record["id"]] = record
+        if text and not text.endswith("\n"):
+            # keep the next record off the torn line
+            with self._lock, path.open("a", encoding="utf-8") as f:
+                f.write("\n")
+        return done
+
+    def append(self, batch_id: str, record: dict[str, Any]) -> None:
+        path = self._path(batch_id)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+    def delete(self, batch_id: str) -> bool:
+        path = self._path(batch_id)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
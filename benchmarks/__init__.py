@@ -0,0 +1 @@
+"""Offline benchmarks for the PDE backend (run with `python -m benchmarks.<name>`)."""
@@ -0,0 +1,36 @@
+"""
+The FastAPI app from main.py wired to the fake model, for benchmarks that run
+real uvicorn worker processes (each worker imports this module itself):
+
+    uvicorn benchmarks.fake_app:app --workers 4
+
+The fake is configured from the environment: PDE_FAKE_LATENCY,
+PDE_FAKE_TPS, PDE_FAKE_TOKENS, PDE_FAKE_DELEGATE_RATE,
+PDE_FAKE_SEARCH_RATE, PDE_FAKE_MEMORY_RATE and PDE_FAKE_SEARCH_LATENCY
+(see benchmarks/fakes.py).
+The specialist cache is off so every turn reaches the model.
+"""
+
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+
+import A  # noqa: E402
+from benchmarks import fakes  # noqa: E402
+
+fakes.install(
+    A.registry,
+    search_latency=float(os.environ.get("PDE_FAKE_SEARCH_LATENCY", "0.05")),
+    latency=float(os.environ.get("PDE_FAKE_LATENCY", "0.05")),
+    tokens_per_second=float(os.environ.get("PDE_FAKE_TPS", "2000")),
+    response_tokens=int(os.environ.get("PDE_FAKE_TOKENS", "60")),
+    delegate_rate=float(os.environ.get("PDE_FAKE_DELEGATE_RATE", "1.0")),
+    search_rate=float(os.environ.get("PDE_FAKE_SEARCH_RATE", "0.5")),
+    memory_rate=float(os.environ.get("PDE_FAKE_MEMORY_RATE", "0.0")),
+)
+A.specialist_cache.ttls = {}
+
+# imported after the fakes are installed, only to re-export it for uvicorn
+from main import app  # noqa: E402,F401
+
+__all__ = ["app"]
@@ -0,0 +1,228 @@
+"""
+Deterministic local stand-ins for Gemini and google_search.
+
+`install(registry, ...)` makes every agent the registry builds use
+`FakeGemini` instead of `Gemini(model=MODEL_NAME)` and has the specialists'
+google_search tool fetch from `fake_google_search` (still through
+A.search_cache) instead of SearchAgent, so the whole pipeline
+(routing tools, sub-sessions, runners, the FastAPI app) runs without network
+access or quota. Must be called before anything is built.
+
+The fake honours the knobs the benchmarks care about:
+
+* `latency`       - seconds before the first token (model "thinking" time)
+* `tokens_per_second` / `response_tokens` - how fast and how much it streams
+* `delegate_rate` - chance an agent with ask_* tools calls one of them first
+* `search_rate`   - chance an agent with google_search searches first
+* `memory_rate`   - chance an agent with load_memory looks up memory first
+* `error_rate`    - chance a call fails with ConnectionError before answering
+* `slow_rate` / `slow_factor` - chance a call's latency is multiplied (tail)
+* `prefill_per_1k` - extra seconds to first token per 1000 uncached prompt
+  tokens; cached-content tokens cost `cached_prefill_ratio` of that
+
+`FakeCacheStore` plays the model's context-caching API, and every call's
+token usage is added up in `usage_totals`.
+
+Choices are seeded from the request text, so a given prompt always takes the
+same path.
+"""
+
+import asyncio
+import json
+import random
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+WORDS = (
+    "focus on one small project each week and write down what you learned "
+    "before moving on to the next topic so progress stays visible"
+).split()
+
+# tokens per streamed chunk, roughly what the real API sends per SSE event
+CHUNK_TOKENS = 8
+
+
+@dataclass
+class SearchConfig:
+    latency: float = 0.2
+    results: int = 3
+
+
+search_config = SearchConfig()
+
+usage_totals = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+class FakeCacheStore:
+    """In-memory stand-in for `client.aio.caches` (see prefix_cache.py)."""
+
+    def __init__(self, create_latency: float = 0.3):
+        self.create_latency = create_latency
+        self.entries: dict[str, tuple[int, float]] = {}   # name -> (tokens, expires_at)
+
+    async def create(self, model: str, system_instruction, tools, ttl: float) -> tuple[str, float]:
+        await asyncio.sleep(self.create_latency)
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        expires_at = time.monotonic() + ttl
+        self.entries[name] = (_prefix_tokens(system_instruction, tools), expires_at)
+        return name, expires_at
+
+    async def refresh(self, name: str, ttl: float) -> float:
+        tokens, _ = self.entries[name]
+        expires_at = time.monotonic() + ttl
+        self.entries[name] = (tokens, expires_at)
+        return expires_at
+
+    def tokens(self, name: str) -> int:
+        tokens, expires_at = self.entries.get(name, (0, 0.0))
+        if expires_at <= time.monotonic():
+            raise ValueError(f"404 NOT_FOUND: cached content {name} not found")
+        return tokens
+
+
+async def fake_google_search(query: str) -> dict:
+    """Search the web and return the top results for `query`."""
+    await asyncio.sleep(search_config.latency)
+    return {
+        "results": [
+            {
+                "title": f"Result {i + 1} for {query}",
+                "url": f"https://example.com/{zlib.crc32(query.encode()):08x}/{i}",
+                "snippet": " ".join(WORDS[i:i + 12]),
+            }
+            for i in range(search_config.results)
+        ]
+    }
+
+
+def _text_of(content: types.Content) -> str:
+    return "".join(part.text or "" for part in content.parts or [])
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _prefix_tokens(system_instruction, tools) -> int:
+    tokens = _estimate_tokens(str(system_instruction or ""))
+    for tool in tools or []:
+        tokens += _estimate_tokens(json.dumps(tool.model_dump(mode="json", exclude_none=True)))
+    return tokens
+
+
+class FakeGemini(BaseLlm):
+    """BaseLlm that answers with canned text at a configurable pace."""
+
+    # the name must look like Gemini 2.x for ADK's built-in tool checks
+    model: str = "gemini-2.5-flash-fake"
+    latency: float = 0.3
+    tokens_per_second: float = 200.0
+    response_tokens: int = 60
+    delegate_rate: float = 1.0
+    search_rate: float = 0.5
+    memory_rate: float = 0.0
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_factor: float = 10.0
+    prefill_per_1k: float = 0.0
+    cached_prefill_ratio: float = 0.1
+    cache_backend: Any = None
+
+    async def generate_content_async(
+        self, llm_request, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        contents = llm_request.contents or []
+        last = contents[-1] if contents else None
+        prompt = _text_of(last) if last else ""
+        rng = random.Random(zlib.crc32(prompt.encode()) ^ zlib.crc32(self.model.encode()))
+
+        config = llm_request.config
+        cached = 0
+        if config is not None and config.cached_content:
+            cached = self.cache_backend.tokens(config.cached_content)
+        prefix = _prefix_tokens(config.system_instruction, config.tools) if config is not None else 0
+        usage_prompt = cached + prefix + sum(_estimate_tokens(_text_of(content)) for content in contents)
+        usage_totals["calls"] += 1
+        usage_totals["prompt_tokens"] += usage_prompt
+        usage_totals["cached_tokens"] += cached
+        # prompt processing time, with cached tokens much cheaper
+        prefill = self.prefill_per_1k * (usage_prompt - cached + cached * self.cached_prefill_ratio) / 1000
+
+        answered_tool = last is not None and any(p.function_response for p in last.parts or [])
+        if not answered_tool:
+            tools = list(llm_request.tools_dict)
+            delegates = [name for name in tools if name.startswith("ask_") and name != "ask_many"]
+            if delegates and rng.random() < self.delegate_rate:
+                await asyncio.sleep(prefill)
+                yield self._call(rng.choice(delegates), {"question": prompt}, usage_prompt, cached)
+                return
+            if "google_search" in tools and rng.random() < self.search_rate:
+                await asyncio.sleep(prefill)
+                yield self._call("google_search", {"query": prompt[:80]}, usage_prompt, cached)
+                return
+            if "load_memory" in tools and rng.random() < self.memory_rate:
+                await asyncio.sleep(prefill)
+                yield self._call("load_memory", {"query": prompt[:80]}, usage_prompt, cached)
+                return
+
+        # faults are drawn from an unseeded source so a retry or hedge of the
+        # same request doesn't fail (or stall) in exactly the same way
+        latency = self.latency * (self.slow_factor if random.random() < self.slow_rate else 1.0)
+        await asyncio.sleep(prefill + latency)
+        if random.random() < self.error_rate:
+            raise ConnectionError("fake model connection reset")
+        tokens = [rng.choice(WORDS) for _ in range(self.response_tokens)]
+        seconds_per_token = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        if stream:
+            for start in range(0, len(tokens), CHUNK_TOKENS):
+                chunk = tokens[start:start + CHUNK_TOKENS]
+                await asyncio.sleep(seconds_per_token * len(chunk))
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=" ".join(chunk) + " ")]),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(seconds_per_token * len(tokens))
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=" ".join(tokens))]),
+            usage_metadata=self._usage(usage_prompt, len(tokens), cached),
+        )
+
+    def _call(self, name: str, args: dict, usage_prompt: int, cached: int) -> LlmResponse:
+        return LlmResponse(
+            content=types.Content(
+                role="model",
+                parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))],
+            ),
+            usage_metadata=self._usage(usage_prompt, 10, cached),
+        )
+
+    @staticmethod
+    def _usage(prompt: int, completion: int, cached: int = 0) -> types.GenerateContentResponseUsageMetadata:
+        usage_totals["completion_tokens"] += completion
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt,
+            cached_content_token_count=cached or None,
+            candidates_token_count=completion,
+            total_token_count=prompt + completion,
+        )
+
+
+def install(registry, search_latency: float = 0.2, cache_latency: float = 0.3, **model_options) -> None:
+    """Point `registry` at FakeGemini and fake_google_search (before any build)."""
+    if registry._agents:
+        raise RuntimeError("fakes must be installed before any agent is built")
+
+    import A
+
+    search_config.latency = search_latency
+    caches = FakeCacheStore(cache_latency)
+    registry.model_factory = lambda name: FakeGemini(cache_backend=caches, **model_options)
+    A.search_cache.fetch = fake_google_search
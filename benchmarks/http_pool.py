@@ -0,0 +1,128 @@
+"""
+Shared, pre-warmed connection pool vs a client per agent (see http_pool.py).
+
+    python -m benchmarks.http_pool [--agents 8] [--calls 400] [--concurrency 8]
+                                   [--handshake-ms 60] [--response-ms 20] [--idle 6]
+
+Runs benchmarks/http_stub.py, a local HTTPS stand-in for the Gemini API. The
+stub waits `--handshake-ms` before each TLS handshake, as the extra round
+trips to a real endpoint would cost. Then `--calls` generate_content calls are
+spread over `--agents` Gemini models, `--concurrency` at a time, in two setups:
+
+* per agent: every model has its own HttpPool with httpx's defaults
+  (HTTP/1.1, idle connections dropped after 5s, no warm-up). This is what a
+  plain Gemini(...) with its own genai Client does.
+* shared: every model is a pooled_gemini on one HttpPool (HTTP/2, 300s
+  keep-alive), warmed up before the first call.
+
+After the burst, each setup idles `--idle` seconds and makes one call per
+agent. With the default 6s, that is longer than httpx's 5s keep-alive. The
+report covers the connections and TLS handshakes the stub accepted, the
+connection reuse ratio, latency of each agent's first call, burst p50/p95,
+and latency after the idle.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.http_stub import StubServer
+from benchmarks.session_store import percentile
+
+MODEL = "gemini-2.5-flash"
+
+
+def llm_request():
+    from google.adk.models.llm_request import LlmRequest
+    from google.genai import types
+
+    return LlmRequest(
+        model=MODEL,
+        contents=[types.Content(role="user", parts=[types.Part(text="hello")])],
+        config=types.GenerateContentConfig(),
+    )
+
+
+async def call(model) -> float:
+    started = time.perf_counter()
+    async for _ in model.generate_content_async(llm_request()):
+        pass
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(label: str, models: list, pools: list, server: StubServer, args) -> None:
+    before = dict(server.counters)
+    if label == "shared":
+        await pools[0].warm_up()
+
+    # each agent's first call, all at once, as when the first turns arrive
+    first = await asyncio.gather(*(call(model) for model in models))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            return await call(models[i % len(models)])
+
+    burst = await asyncio.gather(*(one(i) for i in range(args.calls)))
+
+    await asyncio.sleep(args.idle)
+    after_idle = [await call(model) for model in models]
+
+    seen = {key: server.counters[key] - before[key] for key in server.counters}
+    requests = sum(pool.counters["requests"] for pool in pools)
+    connections = sum(pool.counters["connections"] for pool in pools)
+    http2 = sum(pool.counters["http2_responses"] for pool in pools)
+    print(f"\n{label}: {len(pools)} pool(s), {len(models)} agents")
+    print(f"  TLS handshakes (stub)   {seen['tls_handshakes']:>8}   of which HTTP/2 {seen['h2_connections']}")
+    print(f"  requests                {requests:>8}   over HTTP/2 {http2}")
+    print(f"  connection reuse        {1 - connections / max(1, requests):>8.3f}")
+    print(f"  handshake time          {sum(p.counters['tls_seconds'] for p in pools) * 1000:>8.0f} ms total")
+    print(f"  first call per agent    p50 {statistics.median(first):7.1f} ms  max {max(first):7.1f} ms")
+    print(f"  burst                   p50 {statistics.median(burst):7.1f} ms  p95 {percentile(burst, 95):7.1f} ms")
+    print(f"  after {args.idle:g}s idle           p50 {statistics.median(after_idle):7.1f} ms  "
+          f"max {max(after_idle):7.1f} ms")
+
+
+async def main_async(args) -> None:
+    from http_pool import HttpPool, pooled_gemini
+
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    server = await StubServer(args.handshake_ms / 1000, args.response_ms / 1000).start()
+    print(f"stub on {server.url}: {args.handshake_ms:g} ms per handshake, {args.response_ms:g} ms per response")
+    try:
+        pools = [
+            HttpPool(server.url, http2=False, keepalive_expiry=5.0, verify=str(server.cafile),
+                     warm_connections=0, keepwarm=0)
+            for _ in range(args.agents)
+        ]
+        models = [pooled_gemini(pool, model=MODEL) for pool in pools]
+        await run("per agent", models, pools, server, args)
+        for pool in pools:
+            await pool.close()
+
+        pool = HttpPool(server.url, verify=str(server.cafile), keepwarm=max(1.0, args.idle / 2))
+        models = [pooled_gemini(pool, model=MODEL) for _ in range(args.agents)]
+        await run("shared", models, [pool], server, args)
+        print(f"  keep-warm pings         {pool.counters['keepwarm_pings']:>8}")
+        await pool.close()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--agents", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--handshake-ms", type=float, default=60.0)
+    parser.add_argument("--response-ms", type=float, default=20.0)
+    parser.add_argument("--idle", type=float, default=6.0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+A local stand-in for the Gemini API endpoint, for testing http_pool.py.
+
+`StubServer` serves HTTPS on 127.0.0.1 with a throwaway self-signed
+certificate. It speaks HTTP/2 (h2) or HTTP/1.1 (h11), whichever the client
+negotiates through ALPN. It answers generateContent and
+streamGenerateContent (SSE) with canned text, and anything else with 404.
+`handshake_delay` seconds pass before each TLS handshake, to stand in for
+the round trips a real handshake costs. `response_delay` seconds pass before
+each answer. `counters` records connections, handshakes and requests by
+protocol, as the server saw them.
+
+    python -m benchmarks.http_stub --port 8443
+    PDE_GEMINI_BASE_URL=https://127.0.0.1:8443 PDE_HTTP_CA_BUNDLE=<printed path> ...
+"""
+
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import ssl
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def make_certificate(directory: Path) -> tuple[Path, Path]:
+    """A self-signed certificate for localhost / 127.0.0.1 (cert, key)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(
+            x509.SubjectAlternativeName([
+                x509.DNSName("localhost"),
+                x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+            ]),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = directory / "stub.crt", directory / "stub.key"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return cert_path, key_path
+
+
+def generate_response(text: str = "stub reply") -> dict:
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 2, "totalTokenCount": 12},
+        "modelVersion": "gemini-2.5-flash",
+    }
+
+
+class StubServer:
+    def __init__(self, handshake_delay: float = 0.0, response_delay: float = 0.0, port: int = 0):
+        self.handshake_delay = handshake_delay
+        self.response_delay = response_delay
+        self.port = port
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cafile, key = make_certificate(Path(self._tmp.name))
+        self._ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self._ssl.load_cert_chain(self.cafile, key)
+        self._ssl.set_alpn_protocols(["h2", "http/1.1"])
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.counters = {"connections": 0, "tls_handshakes": 0, "h2_connections": 0,
+                         "requests": 0, "h2_requests": 0, "generate_requests": 0}
+
+    @property
+    def url(self) -> str:
+        return f"https://127.0.0.1:{self.port}"
+
+    async def start(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._tmp.cleanup()
+
+    def _answer(self, method: str, path: str) -> tuple[int, str, bytes]:
+        self.counters["requests"] += 1
+        if method == "POST" and ":generateContent" in path:
+            self.counters["generate_requests"] += 1
+            return 200, "application/json", json.dumps(generate_response()).encode()
+        if method == "POST" and ":streamGenerateContent" in path:
+            self.counters["generate_requests"] += 1
+            body = "".join(
+                f"data: {json.dumps(generate_response(word))}\r\n\r\n" for word in ("stub ", "reply")
+            )
+            return 200, "text/event-stream", body.encode()
+        return 404, "application/json", b'{"error": {"code": 404}}'
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.counters["connections"] += 1
+        try:
+            # leave the ClientHello on the socket for start_tls, not in `reader`
+            writer.transport.pause_reading()
+            await asyncio.sleep(self.handshake_delay)
+            await writer.start_tls(self._ssl)
+            self.counters["tls_handshakes"] += 1
+            if writer.get_extra_info("ssl_object").selected_alpn_protocol() == "h2":
+                self.counters["h2_connections"] += 1
+                await self._serve_h2(reader, writer)
+            else:
+                await self._serve_h11(reader, writer)
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_h11(self, reader, writer) -> None:
+        import h11
+
+        conn = h11.Connection(h11.SERVER)
+        request = None
+        while True:
+            event = conn.next_event()
+            if event is h11.NEED_DATA:
+                data = await reader.read(65536)
+                conn.receive_data(data)
+                if not data and conn.their_state is not h11.DONE:
+                    return
+                continue
+            if isinstance(event, h11.Request):
+                request = event
+            elif isinstance(event, h11.EndOfMessage):
+                await asyncio.sleep(self.response_delay)
+                method, path = request.method.decode(), request.target.decode()
+                status, content_type, body = self._answer(method, path)
+                writer.write(conn.send(h11.Response(status_code=status, headers=[
+                    ("content-type", content_type), ("content-length", str(len(body))),
+                ])))
+                if method != "HEAD":
+                    writer.write(conn.send(h11.Data(data=body)))
+                writer.write(conn.send(h11.EndOfMessage()))
+                await writer.drain()
+                if conn.our_state is h11.MUST_CLOSE:
+                    return
+                conn.start_next_cycle()
+            elif isinstance(event, h11.ConnectionClosed):
+                return
+
+    async def _serve_h2(self, reader, writer) -> None:
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        requests: dict[int, dict] = {}
+
+        async def respond(stream_id: int, headers: dict) -> None:
+            await asyncio.sleep(self.response_delay)
+            self.counters["h2_requests"] += 1
+            method = headers[":method"]
+            status, content_type, body = self._answer(method, headers[":path"])
+            head = [(":status", str(status)), ("content-type", content_type), ("content-length", str(len(body)))]
+            if method == "HEAD":
+                conn.send_headers(stream_id, head, end_stream=True)
+            else:
+                conn.send_headers(stream_id, head)
+                conn.send_data(stream_id, body, end_stream=True)
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+        tasks = set()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    requests[event.stream_id] = dict(event.headers)
+                elif isinstance(event, h2.events.DataReceived):
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    task = asyncio.create_task(respond(event.stream_id, requests.pop(event.stream_id)))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+
+async def _serve(args) -> None:
+    server = await StubServer(args.handshake_ms / 1000, args.response_ms / 1000, args.port).start()
+    print(f"stub Gemini API on {server.url}  (CA bundle: {server.cafile})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--handshake-ms", type=float, default=0.0)
+    parser.add_argument("--response-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Offline load test against a fake Gemini (see benchmarks/fakes.py).
+
+    python -m benchmarks.load [--target runner|chat|stream] [--requests 200]
+                              [--concurrency 20] [--latency 0.3] [--tps 200]
+
+Drives the CommandCore runner directly (`runner`), POST /chat in process
+through httpx's ASGI transport (`chat`) or the SSE turn behind /chat/stream
+(`stream`) with a fixed number of concurrent clients, and reports:
+
+* latency p50/p95/p99 (and time to first text frame for `stream`)
+* requests per second over the whole run
+* event-loop lag (how late a 10 ms ticker wakes up) while under load
+* memory growth per new session, measured with tracemalloc in a second,
+  smaller phase so tracing doesn't skew the latency numbers
+
+The pre-router and the specialist cache would answer most of the repeated
+prompts without touching the model, so both are off unless asked for.
+`--json` writes the numbers to a file to keep as a baseline.
+"""
+
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.session_store import percentile
+
+PROMPTS = [
+    "I want to learn AI but don't know if it's right for me",
+    "Find me AI internships for class 11 students",
+    "I'm struggling and demotivated with my studies",
+    "Tell me about transformers in machine learning",
+    "My python code throws a TypeError when I sort a list",
+    "Create a 6 month roadmap for learning data science",
+    "What do I really enjoy - art or computers?",
+    "Help me plan next week",
+]
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires - a blocked loop shows up here."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected) * 1000)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def make_client(target: str):
+    """Return `async send(message, session_id, user_id) -> (ttft, ok)`."""
+    if target == "runner":
+        from google.genai import types
+        from A import get_or_create_session, model_scheduler, registry
+
+        async def send(message, session_id, user_id):
+            runner = await registry.arunner("CommandCore")
+            session = await get_or_create_session(user_id, session_id)
+            content = types.Content(role="user", parts=[types.Part(text=message)])
+            chunks = []
+            with model_scheduler.context(user_id):
+                async for event in runner.run_async(
+                    user_id=user_id, session_id=session.id, new_message=content
+                ):
+                    if event.content and event.content.parts and event.content.parts[0].text:
+                        chunks.append(event.content.parts[0].text)
+            return None, bool(chunks)
+
+        return send, None
+
+    import httpx
+    import main
+
+    http = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None
+    )
+
+    async def send(message, session_id, user_id):
+        body = {"message": message, "session_id": session_id, "user_id": user_id}
+        if target == "chat":
+            response = await http.post("/chat", json=body)
+            return None, response.status_code == 200
+
+        # httpx's ASGI transport buffers the whole body, so time the SSE
+        # generator behind /chat/stream directly to see the first frame
+        started = time.perf_counter()
+        ttft = None
+        ok = False
+        async for frame in main.stream_single_turn(message, session_id, user_id):
+            if ttft is None and frame.startswith("event: text"):
+                ttft = time.perf_counter() - started
+            if frame.startswith("event: done"):
+                ok = True
+        return ttft, ok
+
+    return send, http
+
+
+async def drive(send, requests: int, concurrency: int, users: int, turns: int, tag: str) -> dict:
+    counter = itertools.count()
+    latencies: list[float] = []
+    ttfts: list[float] = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            conversation = i // turns
+            user_id = f"{tag}-user-{conversation % users}"
+            session_id = f"{tag}-s-{conversation}"
+            started = time.perf_counter()
+            try:
+                ttft, ok = await send(PROMPTS[i % len(PROMPTS)], session_id, user_id)
+            except Exception:
+                ttft, ok = None, False
+            latencies.append(time.perf_counter() - started)
+            if ttft is not None:
+                ttfts.append(ttft)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return {
+        "wall": time.perf_counter() - started,
+        "latencies": latencies,
+        "ttfts": ttfts,
+        "errors": errors,
+    }
+
+
+def summarize(values: list[float], scale: float = 1000.0) -> dict:
+    if not values:
+        return {}
+    return {
+        "p50": statistics.median(values) * scale,
+        "p95": percentile(values, 95) * scale,
+        "p99": percentile(values, 99) * scale,
+        "max": max(values) * scale,
+    }
+
+
+async def run(args) -> dict:
+    import A
+    from benchmarks import fakes
+
+    fakes.install(
+        A.registry,
+        search_latency=args.search_latency,
+        latency=args.latency,
+        tokens_per_second=args.tps,
+        response_tokens=args.tokens,
+        delegate_rate=args.delegate_rate,
+        search_rate=args.search_rate,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        prefill_per_1k=args.prefill_per_1k,
+    )
+    A.prefix_cache.enabled = not args.no_prefix_cache
+    if not args.cache:
+        A.specialist_cache.ttls = {}
+    A.model_resilience.hedge = not args.no_hedge
+    # the scheduler's defaults protect the real quota; here they're knobs
+    A.model_scheduler.max_in_flight = args.max_model_calls
+    A.model_scheduler.bucket.rate = args.model_rps
+    A.model_scheduler.bucket.burst = A.model_scheduler.bucket.tokens = max(1.0, args.model_rps * 2)
+    if args.target != "runner":
+        import main
+        main.PREROUTER_ENABLED = args.prerouter
+    await asyncio.to_thread(A.registry.warm_up)
+
+    send, http = make_client(args.target)
+    try:
+        # one untimed request so lazy imports and first-call setup don't count
+        await send(PROMPTS[0], "warmup", "warmup")
+
+        usage_before = dict(fakes.usage_totals)
+        monitor = LoopLagMonitor()
+        monitor.start()
+        load = await drive(send, args.requests, args.concurrency, args.users, args.turns, "load")
+        await monitor.stop()
+        usage = {key: fakes.usage_totals[key] - usage_before[key] for key in usage_before}
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        await drive(send, args.memory_sessions, args.concurrency, args.memory_sessions, 1, "mem")
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        if http is not None:
+            await http.aclose()
+        await A.registry.shutdown()
+
+    completed = len(load["latencies"])
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "requests": completed,
+        "errors": load["errors"],
+        "rps": completed / load["wall"] if load["wall"] else 0.0,
+        "latency_ms": summarize(load["latencies"]),
+        "ttft_ms": summarize(load["ttfts"]),
+        "loop_lag_ms": summarize(monitor.samples, scale=1.0),
+        "memory_per_session_kib": (after - before) / max(1, args.memory_sessions) / 1024,
+        "model_usage": usage,
+    }
+
+
+def report(result: dict) -> None:
+    config = result["config"]
+    print(
+        f"target: {config['target']}  requests: {result['requests']}  "
+        f"concurrency: {config['concurrency']}  errors: {result['errors']}"
+    )
+    print(
+        f"fake model: latency {config['latency']}s  {config['tps']} tok/s  "
+        f"{config['tokens']} tokens  search {config['search_latency']}s"
+    )
+    print(f"  throughput          {result['rps']:>10.1f} req/s")
+    for label, key in (("latency", "latency_ms"), ("time to first text", "ttft_ms"), ("event-loop lag", "loop_lag_ms")):
+        stats = result[key]
+        if stats:
+            print(
+                f"  {label:<19} p50 {stats['p50']:.1f} ms  p95 {stats['p95']:.1f} ms  "
+                f"p99 {stats['p99']:.1f} ms  max {stats['max']:.1f} ms"
+            )
+    print(f"  memory per session  {result['memory_per_session_kib']:>10.1f} KiB")
+    usage = result["model_usage"]
+    print(
+        f"  model calls         {usage['calls']:>10}  prompt tokens {usage['prompt_tokens']:,} "
+        f"(cached {usage['cached_tokens']:,})  completion tokens {usage['completion_tokens']:,}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", choices=["runner", "chat", "stream"], default="runner")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="distinct user ids")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--memory-sessions", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.3, help="fake model seconds to first token")
+    parser.add_argument("--tps", type=float, default=200.0, help="fake model tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="fake model tokens per answer")
+    parser.add_argument("--delegate-rate", type=float, default=1.0)
+    parser.add_argument("--search-rate", type=float, default=0.5)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake model transport failures")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fake model calls 10x slower")
+    parser.add_argument("--prefill-per-1k", type=float, default=0.0,
+                        help="fake model seconds per 1000 uncached prompt tokens")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="send instructions as plain prompts")
+    parser.add_argument("--no-hedge", action="store_true", help="turn model call hedging off")
+    parser.add_argument("--max-model-calls", type=int, default=64, help="scheduler concurrency cap")
+    parser.add_argument("--model-rps", type=float, default=0.0, help="scheduler rate limit (0 = off)")
+    parser.add_argument("--prerouter", action="store_true", help="keep the pre-router on")
+    parser.add_argument("--cache", action="store_true", help="keep the specialist cache on")
+    parser.add_argument("--json", type=Path, default=None, help="also write the results here")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+    os.environ["PDE_WARMUP"] = "0"
+    result = asyncio.run(run(args))
+    report(result)
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Long-term memory benchmark (see vector_index.py and memory_store.py).
+
+    python -m benchmarks.memory [--sizes 10000,50000,100000,300000] [--users 1000]
+                                [--queries 200] [--k 5] [--turns 30]
+
+Runs three scenarios over synthetic memories built from topic vocabularies,
+so that many memories share words the way one student's conversations do:
+
+* one user's memories grown to each of `--sizes`, searched with exact
+  search and with IVF (what a partition past PDE_MEMORY_IVF_THRESHOLD
+  uses) at several probe fractions. "recall" is the overlap with exact
+  search's top k. "hit" is how often the memory a query was taken from
+  comes back in the top k.
+* the largest size spread over `--users` users, through
+  VectorMemoryService end to end. This measures ingest throughput
+  (embedding plus SQLite) and search latency, which depends on the asking
+  user's partition rather than on the size of the whole store.
+* `--users` conversations of `--turns` turns each, ingested two ways. The
+  first re-adds the whole session after every turn, which is quadratic in
+  conversation length. The second feeds each new event to
+  memory_ingest.MemoryIngestor. This reports throughput and, for the
+  ingestor, lag from an event being appended to it being searchable.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.session_store import percentile
+from vector_index import HashingEmbedder, VectorIndex
+
+PROBE_FRACTIONS = (0.05, 0.1, 0.25, 0.5)
+
+
+class Corpus:
+    """Memories of ~12 words: 9 from one of `topics` topics, 3 from anywhere."""
+
+    def __init__(self, seed: int = 1, vocabulary: int = 20_000, topics: int = 500, topic_words: int = 60):
+        self.rng = random.Random(seed)
+        self.words = [f"w{i}x" for i in range(vocabulary)]
+        self.topics = [self.rng.sample(self.words, topic_words) for _ in range(topics)]
+
+    def memory(self) -> str:
+        topic = self.rng.choice(self.topics)
+        words = self.rng.choices(topic, k=9) + self.rng.choices(self.words, k=3)
+        self.rng.shuffle(words)
+        return " ".join(words)
+
+    def query(self, memory: str) -> str:
+        """Half of a memory's words, as a later question about it might use."""
+        words = memory.split()
+        return " ".join(self.rng.sample(words, len(words) // 2))
+
+
+def timed_search(index: VectorIndex, name, queries: np.ndarray, k: int, exact: bool):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = index.search(name, query, k, exact=exact)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([payload for _, payload in hits])
+    return latencies, results
+
+
+def report(label: str, latencies: list[float], results, truth, sources) -> None:
+    recall = statistics.mean(len(set(r) & set(t)) / max(1, len(t)) for r, t in zip(results, truth))
+    hit = statistics.mean(source in r for r, source in zip(results, sources))
+    print(
+        f"  {label:<14} p50 {statistics.median(latencies):7.2f} ms  p95 {percentile(latencies, 95):7.2f} ms"
+        f"  recall@k {recall:.3f}  hit {hit:.3f}"
+    )
+
+
+def single_partition(corpus: Corpus, embedder: HashingEmbedder, sizes: list[int], queries: int, k: int) -> None:
+    texts = [corpus.memory() for _ in range(max(sizes))]
+    started = time.perf_counter()
+    vectors = embedder.embed(texts)
+    print(f"embedded {len(texts):,} memories at {len(texts) / (time.perf_counter() - started):,.0f}/s")
+
+    for size in sizes:
+        sources = corpus.rng.sample(range(size), min(queries, size))
+        query_vectors = embedder.embed([corpus.query(texts[i]) for i in sources])
+
+        index = VectorIndex(embedder.dims, ivf_threshold=size)
+        started = time.perf_counter()
+        index.add("user", list(range(size)), vectors[:size], list(range(size)))
+        build = time.perf_counter() - started
+        nlist = len(index._partitions["user"].centroids)
+        print(f"\none user, {size:,} memories (IVF: {nlist} lists, built in {build:.1f}s)")
+
+        latencies, truth = timed_search(index, "user", query_vectors, k, exact=True)
+        report("exact", latencies, truth, truth, sources)
+        for fraction in PROBE_FRACTIONS:
+            index.probe_fraction = fraction
+            latencies, results = timed_search(index, "user", query_vectors, k, exact=False)
+            report(f"ivf {fraction:.0%} lists", latencies, results, truth, sources)
+
+
+async def many_users(corpus: Corpus, dims: int, total: int, users: int, queries: int, k: int, path: Path) -> None:
+    from google.adk.events import Event
+    from google.adk.sessions import Session
+    from google.genai import types
+
+    from memory_store import VectorMemoryService
+
+    service = VectorMemoryService(path, dims=dims, top_k=k, min_score=0.0)
+    per_session = 10
+    sessions = []
+    for i in range(total // per_session):
+        user_id = f"user-{i % users}"
+        events = [
+            Event(
+                author="user",
+                invocation_id=f"inv-{i}-{j}",
+                content=types.Content(role="user", parts=[types.Part(text=corpus.memory())]),
+            )
+            for j in range(per_session)
+        ]
+        sessions.append(Session(id=f"s-{i}", app_name="bench", user_id=user_id, events=events))
+
+    started = time.perf_counter()
+    for session in sessions:
+        await service.add_session_to_memory(session)
+    seconds = time.perf_counter() - started
+    print(f"\n{users:,} users, {total:,} memories through VectorMemoryService")
+    print(f"  ingest               {total / seconds:>10,.0f} memories/s")
+
+    # a fresh service, as in another worker: a user's first search loads
+    # their partition, later ones only check for new rows
+    service = VectorMemoryService(path, dims=dims, top_k=k, min_score=0.0)
+    by_user = {}
+    for session in sessions:
+        by_user.setdefault(session.user_id, []).append(session)
+    sample = corpus.rng.sample(sorted(by_user), min(queries, len(by_user)))
+    for label in ("first search", "warm search"):
+        latencies = []
+        for user_id in sample:
+            session = corpus.rng.choice(by_user[user_id])
+            query = corpus.query(corpus.rng.choice(session.events).content.parts[0].text)
+            started = time.perf_counter()
+            await service.search_memory(app_name="bench", user_id=user_id, query=query)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(
+            f"  {label:<20} p50 {statistics.median(latencies):7.2f} ms  p95 {percentile(latencies, 95):7.2f} ms"
+        )
+    print(f"  partitions loaded    {service.stats()['partitions']:>10,}")
+
+
+def conversation_turn(corpus: Corpus, session, turn: int) -> list:
+    from google.adk.events import Event
+    from google.genai import types
+
+    events = [
+        Event(
+            author=author,
+            invocation_id=f"inv-{session.id}-{turn}",
+            content=types.Content(role=role, parts=[types.Part(text=corpus.memory())]),
+        )
+        for author, role in (("user", "user"), ("CommandCore", "model"))
+    ]
+    session.events.extend(events)
+    return events
+
+
+async def ingestion(corpus: Corpus, dims: int, users: int, turns: int, directory: Path) -> None:
+    from google.adk.sessions import Session
+
+    from memory_ingest import MemoryIngestor
+    from memory_store import VectorMemoryService
+
+    total = users * turns * 2
+    print(f"\n{users:,} conversations of {turns} turns ({total:,} events)")
+
+    service = VectorMemoryService(directory / "whole.db", dims=dims)
+    sessions = [Session(id=f"s-{i}", app_name="bench", user_id=f"user-{i}") for i in range(users)]
+    started = time.perf_counter()
+    for turn in range(turns):
+        for session in sessions:
+            conversation_turn(corpus, session, turn)
+            await service.add_session_to_memory(session)
+    seconds = time.perf_counter() - started
+    print(f"  whole session per turn   {total / seconds:>10,.0f} events/s")
+
+    service = VectorMemoryService(directory / "incremental.db", dims=dims)
+    observed: dict[str, float] = {}
+    lags: list[float] = []
+
+    async def write(events):
+        await service.add_events_to_memory(events)
+        now = time.monotonic()
+        lags.extend(now - observed[event.id] for *_, event in events)
+
+    ingestor = MemoryIngestor(write, debounce=0.05, max_delay=0.5)
+    sessions = [Session(id=f"s-{i}", app_name="bench", user_id=f"user-{i}") for i in range(users)]
+    started = time.perf_counter()
+    for turn in range(turns):
+        for session in sessions:
+            for event in conversation_turn(corpus, session, turn):
+                observed[event.id] = time.monotonic()
+                ingestor.observe(session, event)
+        # the next turn of a conversation comes a little later
+        await asyncio.sleep(0.01)
+    await ingestor.close()
+    seconds = time.perf_counter() - started
+    stats = ingestor.stats()
+    print(f"  incremental (ingestor)   {total / seconds:>10,.0f} events/s  "
+          f"in {stats['batches']:,} batches of ~{stats['written'] / max(1, stats['batches']):,.0f}")
+    print(f"  ingest lag               p50 {statistics.median(lags) * 1000:7.1f} ms  "
+          f"p95 {percentile(lags, 95) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,50000,100000,300000")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    corpus = Corpus()
+    single_partition(corpus, HashingEmbedder(args.dims), sizes, args.queries, args.k)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(many_users(corpus, args.dims, sizes[-1], args.users, args.queries, args.k, Path(tmp) / "memory.db"))
+        asyncio.run(ingestion(corpus, args.dims, args.users, args.turns, Path(tmp)))
+
+
+if __name__ == "__main__":
+    main()
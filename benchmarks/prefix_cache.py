@@ -0,0 +1,82 @@
+"""
+Cached instruction prefixes vs plain prompts (see prefix_cache.py).
+
+    python -m benchmarks.prefix_cache [--requests 200] [--concurrency 10]
+                                      [--prefill-per-1k 0.05] [--cached-price 0.25]
+
+Runs the streaming load test (benchmarks/load.py) twice against the fake
+model - once with PDE_PREFIX_CACHE on, once off - each in a fresh process,
+and compares time to first text, end-to-end latency and input tokens billed.
+Cached-content tokens are billed at `--cached-price` of the normal input
+price. `--min-tokens` overrides the smallest prefix the cache accepts;
+Gemini's own minimum (1024) leaves only CommandCore's prefix cacheable.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_load(args, cached: bool, output: Path) -> dict:
+    command = [
+        sys.executable, "-m", "benchmarks.load",
+        "--target", "stream",
+        "--requests", str(args.requests),
+        "--concurrency", str(args.concurrency),
+        "--prefill-per-1k", str(args.prefill_per_1k),
+        "--memory-sessions", "1",
+        "--json", str(output),
+    ]
+    if not cached:
+        command.append("--no-prefix-cache")
+    env = dict(os.environ, PDE_PREFIX_CACHE_MIN_TOKENS=str(args.min_tokens))
+    env.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+    subprocess.run(command, cwd=REPO_ROOT, env=env, check=True, capture_output=True, text=True)
+    return json.loads(output.read_text())
+
+
+def billed_input(usage: dict, cached_price: float) -> float:
+    return usage["prompt_tokens"] - usage["cached_tokens"] * (1 - cached_price)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--prefill-per-1k", type=float, default=0.05)
+    parser.add_argument("--cached-price", type=float, default=0.25)
+    parser.add_argument("--min-tokens", type=int, default=1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "plain": run_load(args, False, Path(tmp) / "plain.json"),
+            "cached": run_load(args, True, Path(tmp) / "cached.json"),
+        }
+
+    print(
+        f"requests: {args.requests}  concurrency: {args.concurrency}  "
+        f"prefill: {args.prefill_per_1k}s/1k tokens  min prefix: {args.min_tokens} tokens"
+    )
+    print(f"  {'':<8}{'ttft p50':>10}{'ttft p95':>10}{'p50':>10}{'p95':>10}{'input tok':>12}{'billed':>12}")
+    for label, result in results.items():
+        usage = result["model_usage"]
+        print(
+            f"  {label:<8}"
+            f"{result['ttft_ms']['p50']:>8.0f}ms{result['ttft_ms']['p95']:>8.0f}ms"
+            f"{result['latency_ms']['p50']:>8.0f}ms{result['latency_ms']['p95']:>8.0f}ms"
+            f"{usage['prompt_tokens']:>12,}{billed_input(usage, args.cached_price):>12,.0f}"
+        )
+    plain, cached = (billed_input(results[k]["model_usage"], args.cached_price) for k in ("plain", "cached"))
+    if plain:
+        print(f"  billed input tokens saved: {1 - cached / plain:.1%}")
+
+
+if __name__ == "__main__":
+    main()
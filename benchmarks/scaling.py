@@ -0,0 +1,159 @@
+"""
+Throughput of the multi-worker deployment (PDE_SHARED_STATE=1) as uvicorn
+workers are added:
+
+    python -m benchmarks.scaling [--workers 1 2 4] [--requests 400]
+                                 [--concurrency-per-worker 16]
+
+For each worker count it starts `uvicorn benchmarks.fake_app:app --workers N`
+on a fresh temporary data directory. The sessions, memory and session locks
+are shared through SQLite and lock files there. It then drives POST /chat
+over real TCP, with the concurrency growing with N, and reports throughput,
+latency and the speedup over one worker. Conversations run several turns
+each, so consecutive turns of one session land on different workers and go
+through the shared store and the cross-worker lock.
+
+The model is the local fake (benchmarks/fakes.py), so what's measured is the
+CPU the backend itself spends per turn - the part more workers can spread.
+Scaling tops out at the number of cores; the core count is printed with the
+results.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.load import drive, summarize
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, data: Path, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        PDE_SHARED_STATE="1",
+        PDE_SESSION_DB=str(data / "sessions.db"),
+        PDE_MEMORY_DB=str(data / "memory.db"),
+        PDE_LOCK_DIR=str(data / "locks"),
+        PDE_JOB_DB=str(data / "jobs.db"),
+        PDE_BATCH_DIR=str(data / "batches"),
+        PDE_JOB_WORKERS="0",
+        PDE_PREROUTER="0",
+        PDE_MAX_MODEL_CALLS="256",
+        PDE_MODEL_RPS="0",
+        PDE_MODEL_QUEUE_PER_USER="256",
+        PDE_FAKE_LATENCY=str(args.latency),
+        PDE_FAKE_TOKENS=str(args.tokens),
+    )
+    env.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_app:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+async def wait_ready(http, server: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited: {server.stderr.read()[-2000:]}")
+        try:
+            if (await http.get("/metrics")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("server did not come up")
+
+
+async def measure(workers: int, args) -> dict:
+    import httpx
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(workers, port, Path(tmp), args)
+        concurrency = args.concurrency_per_worker * workers
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        try:
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits
+            ) as http:
+                await wait_ready(http, server)
+
+                async def send(message, session_id, user_id):
+                    body = {"message": message, "session_id": session_id, "user_id": user_id}
+                    response = await http.post("/chat", json=body)
+                    return None, response.status_code == 200
+
+                # every worker warms up (imports, agent builds) before timing
+                await drive(send, args.warmup_per_worker * workers, concurrency, 8, 1, "warmup")
+                result = await drive(send, args.requests, concurrency, args.users, args.turns, "load")
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    completed = len(result["latencies"])
+    return {
+        "workers": workers,
+        "concurrency": concurrency,
+        "requests": completed,
+        "errors": result["errors"],
+        "rps": completed / result["wall"] if result["wall"] else 0.0,
+        "latency_ms": summarize(result["latencies"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency-per-worker", type=int, default=16)
+    parser.add_argument("--users", type=int, default=50, help="distinct user ids")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--warmup-per-worker", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model seconds to first token")
+    parser.add_argument("--tokens", type=int, default=60, help="fake model tokens per answer")
+    parser.add_argument("--json", type=Path, default=None, help="also write the results here")
+    args = parser.parse_args()
+
+    results = [asyncio.run(measure(n, args)) for n in args.workers]
+
+    print(f"cores: {os.cpu_count()}  requests: {args.requests}  "
+          f"fake model latency {args.latency}s  {args.tokens} tokens")
+    print(f"{'workers':>8}{'conc':>6}{'req/s':>9}{'speedup':>9}{'eff.':>7}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    base = results[0]["rps"] / results[0]["workers"] if results[0]["rps"] else 0.0
+    for r in results:
+        speedup = r["rps"] / base if base else 0.0
+        print(
+            f"{r['workers']:>8}{r['concurrency']:>6}{r['rps']:>9.1f}{speedup:>9.2f}"
+            f"{speedup / r['workers']:>7.0%}{r['latency_ms'].get('p50', 0):>9.1f}"
+            f"{r['latency_ms'].get('p95', 0):>9.1f}{r['errors']:>8}"
+        )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Session store benchmark.
+
+    python -m benchmarks.session_store [--sessions 10000] [--events 10] [--backend sqlite]
+
+Creates `--sessions` sessions, appends `--events` events to each and reports
+append throughput (time until append_event returned, and until everything was
+committed) plus get_session latency percentiles over a random sample of the
+populated store.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_event(session_index: int, event_index: int):
+    from google.adk.events import Event
+    from google.genai import types
+
+    author = "user" if event_index % 2 == 0 else "CommandCore"
+    return Event(
+        author=author,
+        invocation_id=f"inv-{session_index}-{event_index // 2}",
+        content=types.Content(
+            role="user" if author == "user" else "model",
+            parts=[types.Part(text=f"message {event_index} of session {session_index} " * 8)],
+        ),
+    )
+
+
+def build_service(backend: str, path: Path):
+    if backend == "sqlite":
+        from session_store import SqliteSessionService
+        return SqliteSessionService(path)
+    from session_store import BoundedSessionService
+    return BoundedSessionService(max_sessions=10**9, max_events=10**9)
+
+
+async def run(backend: str, sessions: int, events: int, samples: int, path: Path) -> None:
+    service = build_service(backend, path)
+    app_name = "bench"
+
+    started = time.perf_counter()
+    handles = []
+    for i in range(sessions):
+        handles.append(await service.create_session(
+            app_name=app_name, user_id=f"user-{i % 500}", session_id=f"s-{i}"
+        ))
+    create_seconds = time.perf_counter() - started
+
+    payload = [[make_event(i, j) for j in range(events)] for i in range(sessions)]
+    started = time.perf_counter()
+    for i, session in enumerate(handles):
+        for event in payload[i]:
+            await service.append_event(session, event)
+    appended_seconds = time.perf_counter() - started
+    if hasattr(service, "flush"):
+        await service.flush()
+    committed_seconds = time.perf_counter() - started
+
+    latencies = []
+    for i in random.sample(range(sessions), min(samples, sessions)):
+        t0 = time.perf_counter()
+        session = await service.get_session(
+            app_name=app_name, user_id=f"user-{i % 500}", session_id=f"s-{i}"
+        )
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert session is not None and len(session.events) == events
+
+    total_events = sessions * events
+    print(f"backend: {backend}  sessions: {sessions}  events/session: {events}")
+    print(f"  create_session        {sessions / create_seconds:>12,.0f} /s")
+    print(f"  append_event returned {total_events / appended_seconds:>12,.0f} /s")
+    print(f"  append_event durable  {total_events / committed_seconds:>12,.0f} /s")
+    print(
+        "  get_session latency   "
+        f"p50 {statistics.median(latencies):.3f} ms  "
+        f"p95 {percentile(latencies, 95):.3f} ms  "
+        f"p99 {percentile(latencies, 99):.3f} ms"
+    )
+    if hasattr(service, "close"):
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=1_000)
+    parser.add_argument("--db", type=Path, default=None, help="database file (default: a temp file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or Path(tmp) / "bench_sessions.db"
+        asyncio.run(run(args.backend, args.sessions, args.events, args.samples, path))
+
+
+if __name__ == "__main__":
+    main()
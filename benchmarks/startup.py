@@ -0,0 +1,77 @@
+"""
+Startup-time benchmark.
+
+Every measurement runs in a fresh interpreter so module caches don't hide the
+real cold-start cost a new uvicorn worker pays:
+
+    python -m benchmarks.startup [--runs 5]
+
+It reports how long `import main` takes (the time until a worker can accept
+traffic), how long the first CommandCore runner build takes (what the
+background warm-up / first request pays) and the per-agent build times the
+registry recorded.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+main.registry.runner("CommandCore")
+t2 = time.perf_counter()
+main.registry.warm_up()
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_main": t1 - t0,
+    "first_commandcore": t2 - t1,
+    "warm_up_rest": t3 - t2,
+    "build_times": main.registry.build_times,
+}))
+"""
+
+
+def run_probe() -> dict:
+    env = dict(os.environ, PDE_WARMUP="0")
+    env.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # the last line is ours; anything before it is library chatter
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+
+    print(f"{'stage':<24}{'median (ms)':>14}{'max (ms)':>12}")
+    print("-" * 50)
+    for key in ("import_main", "first_commandcore", "warm_up_rest"):
+        values = [r[key] * 1000 for r in results]
+        print(f"{key:<24}{statistics.median(values):>14.1f}{max(values):>12.1f}")
+
+    print("\nregistry build times (last run):")
+    for name, seconds in sorted(results[-1]["build_times"].items()):
+        print(f"  {name:<28}{seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
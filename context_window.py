@@ -0,0 +1,200 @@
+# context_window.py
+#
+# Keeps the history each model call sends bounded. ADK rebuilds a request's
+# contents from the whole session on every call, so without this the prompt
+# of CommandCore and of every specialist sub-session grows with the
+# conversation. Installed as each agent's before_model_callback (see
+# A.AgentRegistry); the session itself is untouched.
+#
+# The last `keep_turns` turns go out verbatim. Older turns are replaced by
+# one extractive summary that is extended incrementally as turns age out, and
+# whole turns move into the summary until the request fits the agent's token
+# budget. No model calls are made.
+
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import metrics
+
+SUMMARY_HEADER = "[Summary of the earlier conversation]"
+
+# text ADK puts in front of other agents' replies when it replays them
+_REPLAY_PREFIX = "For context:"
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, as elsewhere in the backend
+    return len(text) // 4 + 1
+
+
+def _content_text(content) -> str:
+    return "".join(part.text for part in content.parts or [] if part.text)
+
+
+def _content_tokens(content) -> int:
+    tokens = 0
+    for part in content.parts or []:
+        if part.text:
+            tokens += estimate_tokens(part.text)
+        elif part.function_call is not None:
+            tokens += estimate_tokens(str(part.function_call.args or {})) + 8
+        elif part.function_response is not None:
+            tokens += estimate_tokens(str(part.function_response.response or {})) + 8
+    return tokens
+
+
+def _starts_turn(content) -> bool:
+    if content.role != "user":
+        return False
+    text = _content_text(content)
+    return bool(text) and not text.startswith(_REPLAY_PREFIX)
+
+
+def split_turns(contents: list) -> list[list]:
+    """Group contents into turns, each starting with a user message."""
+    turns: list[list] = []
+    for content in contents:
+        if not turns or _starts_turn(content):
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+
+def summarize_turn(turn: list, max_chars: int = 200) -> list[str]:
+    lines = []
+    for content in turn:
+        text = " ".join(_content_text(content).split())
+        calls = [part.function_call.name for part in content.parts or [] if part.function_call]
+        if calls:
+            lines.append(f"- Assistant consulted: {', '.join(calls)}")
+        if not text:
+            continue
+        if len(text) > max_chars:
+            text = text[: max_chars - 3] + "..."
+        speaker = "User" if _starts_turn(content) else "Assistant"
+        lines.append(f"- {speaker}: {text}")
+    return lines
+
+
+def _fingerprint(turns: list[list]) -> int:
+    return zlib.crc32("\x00".join(_content_text(c) for turn in turns for c in turn).encode())
+
+
+@dataclass
+class _Summary:
+    turns: int = 0              # how many leading turns the lines cover
+    fingerprint: int = 0        # of those turns, to notice a rewritten history
+    lines: list[str] = field(default_factory=list)
+
+
+class ContextWindow:
+    """
+    Per-agent history compaction for LLM requests.
+
+    `budgets` maps agent name to a prompt token budget for the conversation
+    part of the request (`default_budget` otherwise). Summaries are cached per
+    (session, agent), at most `max_sessions` of them, and trimmed to their
+    last `max_summary_chars` characters.
+    """
+
+    def __init__(
+        self,
+        keep_turns: int = 6,
+        budgets: Optional[dict[str, int]] = None,
+        default_budget: int = 4000,
+        max_summary_chars: int = 3000,
+        max_sessions: int = 10_000,
+    ):
+        self.keep_turns = keep_turns
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.max_summary_chars = max_summary_chars
+        self.max_sessions = max_sessions
+        self._summaries: "OrderedDict[tuple, _Summary]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "compacted": 0, "tokens_before": 0, "tokens_after": 0}
+
+    def budget(self, agent: str) -> int:
+        return self.budgets.get(agent, self.default_budget)
+
+    def _summary_for(self, key: tuple, old_turns: list[list]) -> _Summary:
+        with self._lock:
+            cached = self._summaries.get(key)
+            if cached is not None:
+                self._summaries.move_to_end(key)
+        if (
+            cached is None
+            or cached.turns > len(old_turns)
+            or cached.fingerprint != _fingerprint(old_turns[: cached.turns])
+        ):
+            cached = _Summary()
+
+        if cached.turns < len(old_turns):
+            # only the turns that aged out since last time are summarised
+            lines = list(cached.lines)
+            for turn in old_turns[cached.turns:]:
+                lines.extend(summarize_turn(turn))
+            while lines and sum(len(line) + 1 for line in lines) > self.max_summary_chars:
+                lines.pop(0)
+            cached = _Summary(len(old_turns), _fingerprint(old_turns), lines)
+
+        with self._lock:
+            self._summaries[key] = cached
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+        return cached
+
+    def compact(self, key: tuple, agent: str, contents: list) -> tuple[list, int, int]:
+        """Return (contents to send, tokens before, tokens after)."""
+        from google.genai import types
+
+        before = sum(_content_tokens(c) for c in contents)
+        turns = split_turns(contents)
+        keep = min(self.keep_turns, len(turns))
+        budget = self.budget(agent)
+
+        while True:
+            old, recent = turns[: len(turns) - keep], turns[len(turns) - keep:]
+            if not old:
+                return contents, before, before
+            summary = self._summary_for(key, old)
+            summary_text = "\n".join([SUMMARY_HEADER, *summary.lines])
+            after = estimate_tokens(summary_text) + sum(_content_tokens(c) for turn in recent for c in turn)
+            if after <= budget or keep <= 1:
+                break
+            keep -= 1
+
+        compacted = [types.Content(role="user", parts=[types.Part(text=summary_text)])]
+        compacted.extend(content for turn in recent for content in turn)
+        return compacted, before, after
+
+    def before_model(self, callback_context, llm_request):
+        """before_model_callback: compact llm_request.contents in place."""
+        session = callback_context.session
+        agent = callback_context.agent_name
+        contents = llm_request.contents or []
+        compacted, before, after = self.compact((session.user_id, session.id, agent), agent, contents)
+        if after >= before:
+            compacted, after = contents, before
+
+        self.counters["requests"] += 1
+        self.counters["tokens_before"] += before
+        self.counters["tokens_after"] += after
+        saved = before - after
+        metrics.CONTEXT_TOKENS_SAVED_PER_REQUEST.observe(saved, agent=agent)
+        if saved > 0:
+            self.counters["compacted"] += 1
+            metrics.CONTEXT_TOKENS_SAVED.inc(saved, agent=agent)
+            llm_request.contents = compacted
+        return None
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "tokens_saved": self.counters["tokens_before"] - self.counters["tokens_after"],
+            "summaries": len(self._summaries),
+        }
@@ -0,0 +1,202 @@
+# http_pool.py
+#
+# One HTTP connection pool for every model call in the process. Each
+# Gemini(...) in A.py used to build its own google.genai Client and with it
+# its own httpx pool, so the eight agents (SearchAgent's grounded searches
+# included) kept eight pools. Each pool paid its own TCP + TLS handshake on
+# first use, and paid it again whenever httpx dropped an idle connection,
+# which it does after 5s by default. PooledGemini gives every agent the same
+# genai Client on one httpx.AsyncClient:
+#
+# * HTTP/2 when the h2 package is installed: concurrent calls share a
+#   connection instead of opening one each
+# * idle connections are kept for `keepalive_expiry` seconds. While the
+#   process is idle, a keep-warm request every `keepwarm` seconds stops the
+#   server from closing them, so the first call after a quiet spell doesn't
+#   pay the handshake
+# * warm_up() opens `warm_connections` connections at startup
+# * stats() counts requests, connections opened and TLS handshakes (with
+#   their time), so connection reuse can be measured
+#
+# `base_url` and `verify` point the pool somewhere other than the public
+# endpoint, e.g. the local stub in benchmarks/http_stub.py.
+
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import time
+from typing import Any, Optional
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+
+class HttpPool:
+    """
+    A shared httpx.AsyncClient and the google.genai Client built on it.
+
+    Both are created on first use, and again if the event loop they were
+    created on has gone (httpx connections can't move between loops).
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_connections: int = 20,
+        keepalive_expiry: float = 300.0,
+        http2: bool = True,
+        timeout: float = 120.0,
+        verify: Any = True,
+        warm_connections: int = 2,
+        keepwarm: float = 240.0,
+    ):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.timeout = timeout
+        self.verify = verify
+        self.warm_connections = warm_connections
+        self.keepwarm = keepwarm
+        self._client = None
+        self._genai_clients: dict[tuple, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._keepwarm_task: Optional[asyncio.Task] = None
+        self._last_request = 0.0
+        self.counters = {"requests": 0, "connections": 0, "tls_handshakes": 0, "tls_seconds": 0.0,
+                         "http2_responses": 0, "warm_ups": 0, "keepwarm_pings": 0, "errors": 0}
+
+    @property
+    def url(self) -> str:
+        return self.base_url or DEFAULT_BASE_URL
+
+    @property
+    def client(self):
+        """The shared httpx.AsyncClient for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = self._build_client()
+            self._genai_clients = {}
+            self._loop = loop
+        return self._client
+
+    def _build_client(self):
+        import httpx
+
+        return httpx.AsyncClient(
+            # httpx needs the optional h2 package for HTTP/2
+            http2=self.http2 and importlib.util.find_spec("h2") is not None,
+            verify=self.verify,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+
+    def genai_client(self, headers: dict[str, str], retry_options: Any = None):
+        """A google.genai Client sending through the shared pool (one per headers/retry setup)."""
+        from google.genai import Client, types
+
+        client = self.client
+        key = (tuple(sorted(headers.items())), id(retry_options))
+        genai = self._genai_clients.get(key)
+        if genai is None:
+            options = {"base_url": self.base_url, "headers": headers, "retry_options": retry_options}
+            # google-genai before httpx_async_client: a client of its own, as Gemini would build
+            if "httpx_async_client" in types.HttpOptions.model_fields:
+                options["httpx_async_client"] = client
+            genai = self._genai_clients[key] = Client(http_options=types.HttpOptions(**options))
+        return genai
+
+    # -- connection accounting ------------------------------------------------
+
+    async def _on_request(self, request) -> None:
+        self._last_request = time.monotonic()
+        started: dict[str, float] = {}
+
+        # httpcore reports each step of opening a connection to this callback
+        async def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                self.counters["connections"] += 1
+            elif event == "connection.start_tls.started":
+                started["tls"] = time.perf_counter()
+            elif event == "connection.start_tls.complete":
+                self.counters["tls_handshakes"] += 1
+                self.counters["tls_seconds"] += time.perf_counter() - started.pop("tls", time.perf_counter())
+
+        request.extensions["trace"] = trace
+
+    async def _on_response(self, response) -> None:
+        self.counters["requests"] += 1
+        if response.http_version == "HTTP/2":
+            self.counters["http2_responses"] += 1
+
+    # -- warm-up and keep-warm ---------------------------------------------------
+
+    async def _ping(self) -> None:
+        try:
+            # any answer will do: the point is the open connection
+            await self.client.head(self.url)
+        except Exception:
+            self.counters["errors"] += 1
+
+    async def warm_up(self) -> None:
+        """Open connections ahead of the first model call and start the keep-warm loop."""
+        await asyncio.gather(*(self._ping() for _ in range(self.warm_connections)))
+        self.counters["warm_ups"] += 1
+        if self.keepwarm > 0 and (self._keepwarm_task is None or self._keepwarm_task.done()):
+            self._keepwarm_task = asyncio.create_task(self._keep_warm())
+
+    async def _keep_warm(self) -> None:
+        while True:
+            idle = time.monotonic() - self._last_request
+            if idle < self.keepwarm:
+                await asyncio.sleep(self.keepwarm - idle)
+                continue
+            await self._ping()
+            self.counters["keepwarm_pings"] += 1
+
+    async def close(self) -> None:
+        if self._keepwarm_task is not None:
+            self._keepwarm_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._keepwarm_task
+            self._keepwarm_task = None
+        if self._client is not None:
+            client, self._client = self._client, None
+            self._genai_clients = {}
+            with contextlib.suppress(Exception):
+                await client.aclose()
+
+    def stats(self) -> dict:
+        requests = self.counters["requests"]
+        return {
+            **self.counters,
+            # share of requests that went out on an already open connection
+            "reuse_ratio": 1 - self.counters["connections"] / requests if requests else 0.0,
+        }
+
+
+@functools.cache
+def _pooled_gemini_class():
+    from google.adk.models.google_llm import Gemini
+    from pydantic import Field
+
+    class PooledGemini(Gemini):
+        """Gemini whose api_client sends through a shared HttpPool."""
+
+        pool: Any = Field(default=None, exclude=True)
+
+        @property
+        def api_client(self):
+            return self.pool.genai_client(self._tracking_headers, self.retry_options)
+
+    return PooledGemini
+
+
+def pooled_gemini(pool: HttpPool, **kwargs):
+    """Gemini(**kwargs) that uses `pool` for its API calls."""
+    return _pooled_gemini_class()(pool=pool, **kwargs)
@@ -0,0 +1,434 @@
+# jobs.py
+#
+# Background jobs for turns that run longer than a load balancer will hold an
+# HTTP request open (e.g. a roadmap that chains several specialists).
+# POST /jobs (main.py) only records the job; a pool of JobWorkers runs it and
+# GET /jobs/{id} reads its status and the text produced so far.
+#
+# * jobs live in a SQLite table (WAL), so they survive restarts and every
+#   process on the box sees the same jobs
+# * workers claim jobs atomically, so any number of processes can run a pool
+#   (PDE_JOB_WORKERS per HTTP worker, or `python jobs.py` on its own)
+# * a running job's worker heartbeats while it works; a job whose heartbeat is
+#   older than `lease` seconds (its process died) is queued again, up to
+#   `max_attempts` runs in total
+# * when a job finishes, its `callback_url`, if any, gets a POST of the result.
+#   Callback URLs come from clients, so they must be https and either name a
+#   host on the `callback_hosts` allow-list or, with no allow-list, resolve
+#   only to public addresses (no loopback, private, link-local or metadata
+#   endpoints); redirects are not followed, and the POST goes to the address
+#   that was checked, so a host can't re-resolve somewhere internal between
+#   the check and the connection
+
+import asyncio
+import contextlib
+import ipaddress
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Collection, Optional
+from urllib.parse import urlsplit
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    user_id      TEXT NOT NULL,
+    session_id   TEXT NOT NULL,
+    message      TEXT NOT NULL,
+    agent        TEXT,
+    callback_url TEXT,
+    status       TEXT NOT NULL,          -- queued, running, done, failed
+    partial      TEXT NOT NULL DEFAULT '',
+    reply        TEXT,
+    route        TEXT,
+    error        TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    worker       TEXT,
+    created_at   REAL NOT NULL,
+    started_at   REAL,
+    finished_at  REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+"""
+
+# what GET /jobs/{id} shows
+PUBLIC_FIELDS = (
+    "id", "user_id", "session_id", "agent", "status", "partial", "reply", "route",
+    "error", "attempts", "created_at", "started_at", "finished_at",
+)
+
+
+class JobStore:
+    """
+    The jobs table. Methods block; call them through asyncio.to_thread.
+
+    The database is only opened (and created) by `open()` or the first
+    query, so building a JobStore touches no files.
+    """
+
+    def __init__(self, path: str | Path = "jobs.db"):
+        self.path = str(path)
+        self._local = threading.local()
+        self._open_lock = threading.Lock()
+        self._opened = False
+
+    def open(self) -> None:
+        """Create the database and its schema if need be (idempotent)."""
+        with self._open_lock:
+            if self._opened:
+                return
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = self._local.conn = self._connect()
+            conn.executescript(JOB_SCHEMA)
+            self._opened = True
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread, as in session_store.SqliteSessionService
+        if not self._opened:
+            self.open()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def create(
+        self,
+        user_id: str,
+        session_id: str,
+        message: str,
+        agent: Optional[str] = None,
+        callback_url: Optional[str] = None,
+    ) -> dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        self._conn().execute(
+            "INSERT INTO jobs (id, user_id, session_id, message, agent, callback_url, status, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, user_id, session_id, message, agent, callback_url, time.time()),
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def claim(self, worker: str, lease: float, max_attempts: int) -> Optional[dict[str, Any]]:
+        """Mark the oldest queued job as running by `worker` and return it."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # jobs whose worker stopped heartbeating: retry, or give up
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " error = CASE WHEN attempts >= ? THEN 'worker lost' ELSE error END,"
+                " finished_at = CASE WHEN attempts >= ? THEN ? ELSE finished_at END"
+                " WHERE status = 'running' AND heartbeat_at < ?",
+                (max_attempts, max_attempts, max_attempts, now, now - lease),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,"
+                " started_at = ?, heartbeat_at = ?, partial = '' WHERE id = ?",
+                (worker, now, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, worker: str, partial: str) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET heartbeat_at = ?, partial = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), partial, job_id, worker),
+        )
+
+    def finish(
+        self,
+        job_id: str,
+        worker: str,
+        status: str,
+        reply: Optional[str] = None,
+        route: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, reply = ?, partial = COALESCE(?, partial), route = ?, error = ?,"
+            " finished_at = ? WHERE id = ? AND worker = ?",
+            (status, reply, reply, route, error, time.time(), job_id, worker),
+        )
+
+    def release(self, job_id: str, worker: str) -> None:
+        """Put a job this worker is giving up (shutdown) back in the queue."""
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, attempts = MAX(attempts - 1, 0)"
+            " WHERE id = ? AND worker = ? AND status = 'running'",
+            (job_id, worker),
+        )
+
+    def counts(self) -> dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def check_callback_url(url: str, allowed_hosts: Collection[str] = ()) -> list[str]:
+    """
+    Raise ValueError unless the server may POST to `url`.
+
+    It must be https. Its host must match `allowed_hosts` (an entry starting
+    with "." also matches subdomains) or, when that is empty, resolve only to
+    public addresses. Returns the addresses checked ([] for an allowed host).
+    Resolves the host, so it blocks.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise ValueError("callback_url must be an https URL")
+    host = parts.hostname.rstrip(".").lower()
+    if allowed_hosts:
+        if not any(host == entry or (entry.startswith(".") and host.endswith(entry)) for entry in allowed_hosts):
+            raise ValueError(f"callback host {host!r} is not allowed")
+        return []
+    try:
+        # dict: unique, in the resolver's order of preference
+        addresses = list(dict.fromkeys(
+            info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM)
+        ))
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"callback host {host!r} does not resolve") from e
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"callback host {host!r} resolves to a non-public address")
+    return addresses
+
+
+def post_callback(
+    url: str, payload: dict[str, Any], allowed_hosts: Collection[str] = (), timeout: float = 10.0
+) -> None:
+    import requests
+
+    # checked again at send time: the host may resolve differently than at submit
+    addresses = check_callback_url(url, allowed_hosts)
+    if not addresses:
+        requests.post(url, json=payload, timeout=timeout, allow_redirects=False).raise_for_status()
+        return
+
+    # connect to a checked address rather than resolving the name again; TLS
+    # still sends the name (SNI) and checks the certificate against it
+    from requests.adapters import HTTPAdapter
+
+    parts = urlsplit(url)
+    host = parts.hostname
+    userinfo, _, hostport = parts.netloc.rpartition("@")
+
+    class PinnedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, server_hostname=host, assert_hostname=host, **kwargs)
+
+    with requests.Session() as session:
+        session.mount("https://", PinnedAdapter())
+        for i, address in enumerate(addresses):
+            ip = f"[{address}]" if ":" in address else address
+            netloc = f"{ip}:{parts.port}" if parts.port else ip
+            if userinfo:
+                netloc = f"{userinfo}@{netloc}"
+            try:
+                response = session.post(
+                    parts._replace(netloc=netloc).geturl(),
+                    json=payload,
+                    headers={"Host": hostport},
+                    timeout=timeout,
+                    allow_redirects=False,
+                )
+            except requests.ConnectionError:
+                if i + 1 == len(addresses):
+                    raise
+                continue
+            response.raise_for_status()
+            return
+
+
+RunJob = Callable[[dict[str, Any], Callable[[str], None]], Awaitable[tuple[str, str, bool]]]
+
+
+class JobWorkers:
+    """
+    `workers` coroutines that claim jobs from `store` and run them.
+
+    `run(job, on_text)` does the work: it calls `on_text` with each piece of
+    reply text as it is produced and returns (reply, route, ok). Idle workers
+    look for new jobs every `poll` seconds, or at once after `wake()`. A job
+    that can't be finished or reported (e.g. the store is locked) is logged
+    and its worker moves on; its lease runs out and it is run again. A claim
+    that fails is logged too, and retried after a back-off that doubles up to
+    `max_backoff` seconds.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        run: RunJob,
+        workers: int = 4,
+        lease: float = 60.0,
+        heartbeat: float = 2.0,
+        poll: float = 1.0,
+        max_attempts: int = 3,
+        callback_hosts: Collection[str] = (),
+        max_backoff: float = 30.0,
+    ):
+        self.store = store
+        self.run = run
+        self.workers = workers
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self.callback_hosts = tuple(callback_hosts)
+        self.max_backoff = max_backoff
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.busy = 0
+        self.counters = {"claimed": 0, "done": 0, "failed": 0, "released": 0, "errors": 0,
+                         "claim_errors": 0, "callbacks": 0, "callback_errors": 0}
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._loop(f"{self.name}/{i}")) for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self, worker: str) -> None:
+        failures = 0
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim, worker, self.lease, self.max_attempts)
+            except Exception:
+                # e.g. the store is locked, full or unreadable: keep the worker,
+                # but don't spin on it
+                failures += 1
+                self.counters["claim_errors"] += 1
+                logger.exception("worker %s could not claim a job", worker)
+                await asyncio.sleep(min(self.max_backoff, self.poll * 2 ** (failures - 1)))
+                continue
+            failures = 0
+            if job is None:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll)
+                continue
+            self.counters["claimed"] += 1
+            try:
+                await self._run(worker, job)
+            except Exception:
+                # keep the worker: the job's lease lapses and another run picks it up
+                self.counters["errors"] += 1
+                logger.exception("job %s failed in worker %s", job["id"], worker)
+
+    async def _run(self, worker: str, job: dict[str, Any]) -> None:
+        chunks: list[str] = []
+
+        async def beat():
+            while True:
+                await asyncio.sleep(self.heartbeat)
+                await asyncio.to_thread(self.store.heartbeat, job["id"], worker, "".join(chunks))
+
+        self.busy += 1
+        heartbeat = asyncio.create_task(beat())
+        try:
+            reply, route, ok = await self.run(job, chunks.append)
+        except asyncio.CancelledError:
+            # shutting down: let another worker (or the next start) pick it up
+            await asyncio.shield(asyncio.to_thread(self.store.release, job["id"], worker))
+            self.counters["released"] += 1
+            raise
+        except Exception as e:
+            reply, route, ok = None, None, False
+            error = f"{type(e).__name__}: {e}"
+        else:
+            error = None if ok else reply
+        finally:
+            heartbeat.cancel()
+            self.busy -= 1
+
+        status = "done" if ok else "failed"
+        await asyncio.to_thread(self.store.finish, job["id"], worker, status, reply, route, error)
+        self.counters[status] += 1
+        metrics.JOBS.inc(status=status)
+
+        if job.get("callback_url"):
+            payload = {"id": job["id"], "status": status, "reply": reply, "route": route, "error": error}
+            try:
+                await asyncio.to_thread(post_callback, job["callback_url"], payload, self.callback_hosts)
+                self.counters["callbacks"] += 1
+            except Exception as e:
+                self.counters["callback_errors"] += 1
+                logger.warning("callback for job %s failed: %s", job["id"], e)
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.counters, "workers": len(self._tasks), "busy": self.busy}
+
+
+async def _serve_forever(workers: int) -> None:
+    import main
+
+    pool = main.build_job_workers(workers)
+    pool.start()
+    if main.registry.http_pool is not None:
+        await main.registry.http_pool.warm_up()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+        await main.memory_ingestor.close()
+        await main.registry.shutdown()
+
+
+if __name__ == "__main__":
+    # a job worker process without the HTTP server (set PDE_JOB_WORKERS=0 on
+    # the HTTP workers to leave all jobs to processes like this one)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PDE_JOB_WORKERS", "4")) or 4)
+    args = parser.parse_args()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(_serve_forever(args.workers))
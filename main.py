@@ -1,14 +1,73 @@
 # server.py
 import os
+import hmac
+import json
 import asyncio
-from fastapi import FastAPI
+import time
+import contextlib
+import uuid
+from urllib.parse import urlencode
+from dataclasses import dataclass
+from typing import Callable
+from pathlib import Path
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 
-# import everything you defined in A.py
-from A import commandcore_runner, run_session, APP_NAME, USER_ID, session_service
+# import everything you defined in A.py (agents/runners are built lazily by the registry)
+from A import (
+    registry,
+    session_locks,
+    get_or_create_session,
+    answer_directly,
+    specialist_cache,
+    model_scheduler,
+    model_resilience,
+    context_window,
+    prefix_cache,
+    search_cache,
+    memory_ingestor,
+    usage_ledger,
+    turn_deadline,
+    relay_specialists,
+    relayed_reply,
+    SPECIALIST_NAMES,
+    SPECIALIST_PASSTHROUGH,
+    COMMANDCORE_SYNTHESIS,
+    USER_ID,
+    TURN_TIMEOUT,
+)
+from batch_store import BatchCheckpoints, item_fingerprint
+from jobs import PUBLIC_FIELDS, JobStore, JobWorkers, check_callback_url
+from router import PreRouter
+from resilience import CircuitOpen
+from scheduler import BACKGROUND, INTERACTIVE, SchedulerBusy
+from usage import QuotaExceeded
+import metrics
+
+# build every agent in a background thread once the worker is up, so the first
+# request doesn't pay for the google.adk import (set PDE_WARMUP=0 to disable)
+WARMUP_ON_STARTUP = os.environ.get("PDE_WARMUP", "1") == "1"
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the SQLite files are opened here, not at import (both also open on first use)
+    await asyncio.to_thread(job_store.open)
+    await asyncio.to_thread(usage_ledger.open)
+    if WARMUP_ON_STARTUP:
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, registry.warm_up)
+        if registry.http_pool is not None and registry.model_factory is None:
+            # open the model API connections before the first turn needs them
+            app.state.http_warmup = asyncio.create_task(registry.http_pool.warm_up())
+    if JOB_WORKERS > 0:
+        job_workers.start()
+    yield
+    await job_workers.stop()
+    await memory_ingestor.close()
+    await registry.shutdown()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,49 +77,653 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(SchedulerBusy)
+async def scheduler_busy(request: Request, exc: SchedulerBusy):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded(request: Request, exc: QuotaExceeded):
+    headers = {"Retry-After": str(int(exc.retry_after))} if exc.retry_after is not None else None
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers=headers)
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open(request: Request, exc: CircuitOpen):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))},
+    )
+
 class ChatRequest(BaseModel):
     session_id: str
     message: str
+    user_id: str = USER_ID
 
 class ChatResponse(BaseModel):
     reply: str
 
-async def run_single_turn(message: str, session_id: str) -> str:
-    # minimal version of run_session that returns text instead of printing
+# how many runner events may sit unsent before the runner is paused
+STREAM_QUEUE_SIZE = int(os.environ.get("PDE_STREAM_QUEUE_SIZE", "16"))
+# how often (seconds) to check for a gone client while the model is busy
+STREAM_DISCONNECT_POLL = float(os.environ.get("PDE_STREAM_DISCONNECT_POLL", "1.0"))
+
+_STREAM_END = object()
+
+class BatchItem(BaseModel):
+    session_id: str
+    message: str
+    user_id: str = USER_ID
+    agent: str | None = None    # a specialist to answer directly, skipping CommandCore
+    id: str | None = None       # defaults to the item's position in the batch
+
+class BatchRequest(BaseModel):
+    items: list[BatchItem]
+    batch_id: str | None = None     # send the same id again to resume a batch
+    concurrency: int | None = None
+
+# /chat/batch: items in flight at once (per batch), largest batch accepted,
+# how often an item the scheduler turns away is retried, and where finished
+# items are checkpointed (see batch_store.py)
+BATCH_CONCURRENCY = int(os.environ.get("PDE_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.environ.get("PDE_BATCH_MAX_ITEMS", "10000"))
+BATCH_RETRIES = int(os.environ.get("PDE_BATCH_RETRIES", "3"))
+BATCH_DIR = os.environ.get("PDE_BATCH_DIR", str(Path(__file__).parent / "data" / "batches"))
+
+batch_checkpoints = BatchCheckpoints(BATCH_DIR)
+
+class JobRequest(BaseModel):
+    session_id: str
+    message: str
+    user_id: str = USER_ID
+    agent: str | None = None
+    callback_url: str | None = None     # gets a POST with the result when the job ends
+
+# background jobs (see jobs.py): worker coroutines in each HTTP worker process
+# (0 leaves the jobs to `python jobs.py` processes), where jobs are kept, each
+# job's deadline, how long a silent worker keeps its job before it is rerun,
+# and the hosts callback_url may point at (comma-separated, ".example.com"
+# for subdomains; empty: any host that resolves to public addresses only)
+JOB_WORKERS = int(os.environ.get("PDE_JOB_WORKERS", "4"))
+JOB_DB_PATH = os.environ.get("PDE_JOB_DB", str(Path(__file__).parent / "data" / "jobs.db"))
+JOB_TIMEOUT = float(os.environ.get("PDE_JOB_TIMEOUT", "600"))
+JOB_LEASE = float(os.environ.get("PDE_JOB_LEASE", "60"))
+JOB_CALLBACK_HOSTS = tuple(
+    host.strip().lower() for host in os.environ.get("PDE_JOB_CALLBACK_HOSTS", "").split(",") if host.strip()
+)
+
+job_store = JobStore(JOB_DB_PATH)
+
+# send obvious single-specialist messages straight to that specialist instead
+# of through CommandCore (PDE_PREROUTER=0 disables, see router.py)
+PREROUTER_ENABLED = os.environ.get("PDE_PREROUTER", "1") == "1"
+pre_router = PreRouter(
+    threshold=float(os.environ.get("PDE_PREROUTER_THRESHOLD", "0.75")),
+    # without the rephrasing call, a CommandCore turn is one call shorter
+    round_trips_saved=1 if SPECIALIST_PASSTHROUGH and not COMMANDCORE_SYNTHESIS else 2,
+)
+
+# component stats, evaluated on each /metrics scrape
+metrics.export_stats("pde_prerouter", "Pre-router counters (see router.py).", pre_router.stats)
+metrics.export_stats("pde_scheduler", "Model call scheduler state (see scheduler.py).", model_scheduler.stats)
+metrics.export_stats("pde_resilience", "Model call retries, hedges and breakers (see resilience.py).", model_resilience.stats)
+metrics.export_stats("pde_context_window", "History compaction totals (see context_window.py).", context_window.stats)
+metrics.export_stats("pde_prefix_cache", "Cached instruction prefixes (see prefix_cache.py).", prefix_cache.stats)
+metrics.export_stats("pde_search_cache", "Web search cache and coalescing (see search_cache.py).", search_cache.stats)
+metrics.export_stats("pde_session_store", "Session store counters (see session_store.py).", registry.session_stats)
+if registry.http_pool is not None:
+    metrics.export_stats("pde_http_pool", "Shared model API connection pool (see http_pool.py).", registry.http_pool.stats)
+metrics.export_stats("pde_memory", "Long-term memory store (see memory_store.py).", registry.memory_stats)
+metrics.export_stats("pde_usage", "Token accounting and budgets (see usage.py).", usage_ledger.stats)
+metrics.export_stats("pde_memory_ingest", "Background memory ingestion (see memory_ingest.py).", memory_ingestor.stats)
+if hasattr(session_locks, "stats"):
+    metrics.export_stats("pde_session_locks", "Cross-worker session locks (see shared_locks.py).", session_locks.stats)
+metrics.registry.gauge(
+    "pde_specialist_cache",
+    "Semantic specialist cache counters (see specialist_cache.py).",
+    ["agent", "field"],
+    collect=lambda: {
+        (agent, key): value
+        for agent, fields in specialist_cache.stats().items()
+        for key, value in fields.items()
+    },
+)
+
+def sse_frame(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@dataclass
+class TurnResult:
+    reply: str
+    route: str      # commandcore, routed, timeout or error
+
+async def run_single_turn(
+    message: str,
+    session_id: str,
+    user_id: str = USER_ID,
+    timeout: float | None = TURN_TIMEOUT,
+) -> str:
+    """Run one interactive turn and return the reply text (see serve_turn)."""
+    result = await serve_turn(message, session_id, user_id, timeout=timeout)
+    return result.reply
+
+async def serve_turn(
+    message: str,
+    session_id: str,
+    user_id: str = USER_ID,
+    timeout: float | None = TURN_TIMEOUT,
+    priority: int = INTERACTIVE,
+    agent: str | None = None,
+    endpoint: str = "chat",
+    on_text: Callable[[str], None] | None = None,
+) -> TurnResult:
+    """
+    Run one turn: through CommandCore, or straight to `agent` (a specialist
+    name) or wherever the pre-router sends it.
+
+    The turn gets `timeout` seconds (None: no limit), and the specialists it
+    consults inherit the deadline (see A.turn_deadline). When it runs out, the
+    runner and everything under it - specialist runs, ask_many fan-outs,
+    queued model calls - is cancelled and the text produced so far is
+    returned with a note saying it was cut short. SchedulerBusy, CircuitOpen
+    and QuotaExceeded propagate; other errors become an "error" result. The
+    turn's model tokens are charged to `user_id` and `session_id` (usage.py),
+    whose budgets are checked before each model call. `on_text`
+    is called with each piece of reply text as soon as the runner yields it,
+    including a delegated specialist's answer while it is being generated
+    (PDE_SPECIALIST_PASSTHROUGH, see A.relay_specialists).
+    """
     from google.genai import types
 
+    started = time.perf_counter()
+    route_label = "commandcore"
+    segments: list[tuple[bool, str]] = []   # (relayed from a specialist, text)
+
+    async def relay_text(agent: str, text: str) -> None:
+        segments.append((True, text))
+        if on_text is not None:
+            on_text(text)
+
+    relay = (
+        relay_specialists(relay_text, stream=on_text is not None)
+        if SPECIALIST_PASSTHROUGH else contextlib.nullcontext()
+    )
+    with metrics.REQUESTS_IN_FLIGHT.track(endpoint=endpoint), \
+            model_scheduler.context(user_id, priority), \
+            metrics.span("turn", user_id=user_id, session_id=session_id) as turn, \
+            usage_ledger.context(user_id, session_id), \
+            turn_deadline(timeout) as deadline, \
+            relay:
+        try:
+            async with asyncio.timeout_at(deadline):
+                commandcore_runner = await registry.arunner("CommandCore")
+
+                async with session_locks.get(user_id, session_id):
+                    with metrics.STAGE_SECONDS.time(stage="session_lookup", agent="CommandCore"):
+                        session = await get_or_create_session(user_id, session_id)
+
+                    if agent is None and PREROUTER_ENABLED:
+                        route = pre_router.route(message)
+                        agent = route.agent if route else None
+                    if agent:
+                        route_label = "routed"
+                        turn.attributes["routed_to"] = agent
+                        reply = await answer_directly(agent, message, user_id, session.id)
+                        if on_text is not None and not SPECIALIST_PASSTHROUGH:
+                            on_text(reply)
+                        return TurnResult(reply.strip() or "[No response text]", route_label)
+
+                    content = types.Content(
+                        role="user",
+                        parts=[types.Part(text=message)],
+                    )
+
+                    async for event in metrics.track_run("CommandCore", commandcore_runner.run_async(
+                        user_id=user_id,
+                        session_id=session.id,
+                        new_message=content,
+                    )):
+                        await usage_ledger.record(user_id, session_id, event.author, event)
+                        if event.content and event.content.parts and event.content.parts[0].text:
+                            segments.append((False, event.content.parts[0].text))
+                            if on_text is not None:
+                                on_text(event.content.parts[0].text)
+
+            return TurnResult(relayed_reply(segments).strip() or "[No response text]", route_label)
+        except TimeoutError:
+            route_label = "timeout"
+            turn.status = "timeout"
+            note = f"[Reply cut short: this turn hit its {timeout:g}s time limit]"
+            partial = relayed_reply(segments).strip()
+            return TurnResult(f"{partial}\n\n{note}" if partial else note, route_label)
+        except asyncio.CancelledError:
+            # client went away (or the server is shutting down)
+            route_label = "cancelled"
+            turn.status = "cancelled"
+            raise
+        except (SchedulerBusy, CircuitOpen, QuotaExceeded):
+            # let the endpoint answer 429 / 503 + Retry-After
+            route_label = "rejected"
+            turn.status = "rejected"
+            raise
+        except Exception as e:
+            route_label = "error"
+            turn.status = f"error: {type(e).__name__}"
+            return TurnResult(f"[Server error: {e}]", route_label)
+        finally:
+            metrics.TURN_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, route=route_label)
+
+async def until_disconnected(request: Request | None, coro):
+    """
+    Await `coro` in its own task, cancelling it if the client disconnects.
+
+    Returns (True, result) when it finished, (False, None) when the client went
+    away first. Exceptions from `coro` propagate.
+    """
+    task = asyncio.create_task(coro)
     try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=STREAM_DISCONNECT_POLL)
+            if done:
+                return True, task.result()
+            if request is not None and await request.is_disconnected():
+                return False, None
+    finally:
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request):
+    model_scheduler.admit(req.user_id)
+    await usage_ledger.check(req.user_id, req.session_id)
+    finished, reply = await until_disconnected(
+        request, run_single_turn(req.message, req.session_id, req.user_id)
+    )
+    if not finished:
+        # nobody is listening any more; 499 is nginx's "client closed request"
+        return JSONResponse(status_code=499, content={"detail": "client disconnected"})
+    return ChatResponse(reply=reply)
+
+async def stream_single_turn(
+    message: str,
+    session_id: str,
+    user_id: str = USER_ID,
+    request: Request | None = None,
+    timeout: float | None = TURN_TIMEOUT,
+):
+    """
+    Same turn as run_single_turn, but yields SSE frames as the runner produces
+    them: "text" chunks, "tool_call" for each specialist call, then "done".
+    With PDE_SPECIALIST_PASSTHROUGH, the answer of a specialist CommandCore
+    delegates to (or the pre-router picks) streams out as "text" chunks
+    under the specialist's name while it is being generated.
+
+    The runner is pumped by a separate task into a bounded queue, so a slow
+    client pauses the model stream instead of buffering it, and a client that
+    goes away cancels the task (and with it any in-flight model calls).
+    The turn gets the same `timeout` as run_single_turn: when it runs out the
+    task is cancelled and "done" carries the text streamed so far with a note
+    saying it was cut short.
+    """
+    started = time.perf_counter()
+    outcome = {"route": "commandcore"}
+    with metrics.REQUESTS_IN_FLIGHT.track(endpoint="stream"), \
+            model_scheduler.context(user_id, INTERACTIVE), \
+            metrics.span("turn", user_id=user_id, session_id=session_id, stream=True) as turn, \
+            usage_ledger.context(user_id, session_id), \
+            turn_deadline(timeout) as deadline:
+        frames = _stream_frames(message, session_id, user_id, request, turn, outcome, deadline, timeout)
         try:
-            session = await session_service.create_session(
-                app_name=APP_NAME,
-                user_id=USER_ID,
-                session_id=session_id,
-            )
-        except Exception:
-            session = await session_service.get_session(
-                app_name=APP_NAME,
-                user_id=USER_ID,
-                session_id=session_id,
+            async with contextlib.aclosing(frames):
+                async for frame in frames:
+                    yield frame
+        finally:
+            metrics.TURN_SECONDS.observe(
+                time.perf_counter() - started, endpoint="stream", route=outcome["route"]
             )
 
-        content = types.Content(
-            role="user",
-            parts=[types.Part(text=message)],
-        )
+async def _stream_frames(message, session_id, user_id, request, turn, outcome, deadline, timeout):
+    from google.genai import types
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+
+    commandcore_runner = await registry.arunner("CommandCore")
+    content = types.Content(
+        role="user",
+        parts=[types.Part(text=message)],
+    )
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    route = pre_router.route(message) if PREROUTER_ENABLED else None
+    routed = route.agent if route and route.agent else None
+
+    async def relay_text(agent: str, text: str) -> None:
+        # a specialist's answer while it is being generated (A.relay_specialists)
+        await queue.put((agent, text))
+
+    async def produce():
+        relay = relay_specialists(relay_text) if SPECIALIST_PASSTHROUGH else contextlib.nullcontext()
+        try:
+            with relay:
+                # look the session up under its lock, as serve_turn does, so two
+                # workers can't both create it; the deadline also bounds the
+                # puts, so a stalled client can't hold the lock past it either
+                async with asyncio.timeout_at(deadline), session_locks.get(user_id, session_id):
+                    with metrics.STAGE_SECONDS.time(stage="session_lookup", agent="CommandCore"):
+                        session = await get_or_create_session(user_id, session_id)
+                    if routed:
+                        reply = await answer_directly(routed, message, user_id, session.id)
+                        if not SPECIALIST_PASSTHROUGH:
+                            await queue.put((routed, reply.strip()))
+                    else:
+                        async for event in metrics.track_run("CommandCore", commandcore_runner.run_async(
+                            user_id=user_id,
+                            session_id=session.id,
+                            new_message=content,
+                            run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+                        )):
+                            await usage_ledger.record(user_id, session.id, event.author, event)
+                            await queue.put(event)
+        except asyncio.CancelledError:
+            raise
+        except TimeoutError:
+            # the consumer notices the deadline itself
+            return
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_STREAM_END)
+
+    if routed:
+        outcome["route"] = "routed"
+        turn.attributes["routed_to"] = routed
+        yield sse_frame("tool_call", {
+            "agent": "router",
+            "name": f"ask_{routed.lower()}",
+            "args": {"question": message},
+        })
+
+    loop = asyncio.get_running_loop()
+    producer = asyncio.create_task(produce())
+    segments: list[tuple[bool, str]] = []   # (relayed from a specialist, text)
+    streamed_partial = False
+    timed_out = False
+    try:
+        while True:
+            poll = STREAM_DISCONNECT_POLL
+            if deadline is not None:
+                poll = max(0.0, min(poll, deadline - loop.time()))
+            try:
+                item = await asyncio.wait_for(queue.get(), poll)
+            except asyncio.TimeoutError:
+                if deadline is not None and loop.time() >= deadline:
+                    timed_out = True
+                    break
+                if request is not None and await request.is_disconnected():
+                    return
+                continue
+
+            if item is _STREAM_END:
+                break
+            if isinstance(item, (SchedulerBusy, CircuitOpen, QuotaExceeded)):
+                outcome["route"] = "rejected"
+                turn.status = "rejected"
+                yield sse_frame("error", {"error": str(item), "retry_after": item.retry_after})
+                return
+            if isinstance(item, Exception):
+                outcome["route"] = "error"
+                turn.status = f"error: {type(item).__name__}"
+                yield sse_frame("error", {"error": f"[Server error: {item}]"})
+                return
+
+            if isinstance(item, tuple):
+                agent, text = item
+                segments.append((True, text))
+                yield sse_frame("text", {"agent": agent, "text": text})
+                continue
+
+            event = item
+            if not (event.content and event.content.parts):
+                continue
 
-        full_text = ""
-        async for event in commandcore_runner.run_async(
-            user_id=USER_ID,
-            session_id=session.id,
-            new_message=content,
-        ):
-            if event.content and event.content.parts and event.content.parts[0].text:
-                full_text += event.content.parts[0].text
+            for call in event.get_function_calls():
+                yield sse_frame("tool_call", {
+                    "agent": event.author,
+                    "name": call.name,
+                    "args": call.args or {},
+                })
 
-        return full_text.strip() or "[No response text]"
+            text = "".join(part.text for part in event.content.parts if part.text)
+            if not text:
+                continue
+            if event.partial:
+                # SSE mode yields the chunks first and then one aggregated
+                # event repeating the whole text; only forward the chunks
+                streamed_partial = True
+            elif streamed_partial:
+                streamed_partial = False
+                continue
+            segments.append((False, text))
+            yield sse_frame("text", {"agent": event.author, "text": text})
+
+        reply = relayed_reply(segments).strip()
+        if timed_out:
+            outcome["route"] = "timeout"
+            turn.status = "timeout"
+            producer.cancel()
+            note = f"[Reply cut short: this turn hit its {timeout:g}s time limit]"
+            reply = f"{reply}\n\n{note}" if reply else note
+        yield sse_frame("done", {"session_id": session_id, "reply": reply or "[No response text]"})
+    finally:
+        if not producer.done():
+            producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await producer
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    # reject before the 200 and the SSE headers go out
+    model_scheduler.admit(req.user_id)
+    await usage_ledger.check(req.user_id, req.session_id)
+    return StreamingResponse(
+        stream_single_turn(req.message, req.session_id, req.user_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def serve_turn_patiently(*args, retries: int = BATCH_RETRIES, **kwargs) -> TurnResult:
+    """serve_turn for work nobody waits on live: sit out SchedulerBusy/CircuitOpen and retry."""
+    for attempt in range(retries):
+        try:
+            return await serve_turn(*args, **kwargs)
+        except (SchedulerBusy, CircuitOpen) as e:
+            await asyncio.sleep(e.retry_after)
+    return await serve_turn(*args, **kwargs)
+
+def specialist_name(requested: str, where: str = "") -> str:
+    """Canonical specialist name for `requested` (any case), else HTTP 400."""
+    name = {name.lower(): name for name in SPECIALIST_NAMES}.get(requested.strip().lower())
+    if name is None:
+        raise HTTPException(400, f"{where}unknown specialist {requested!r}")
+    return name
+
+def ndjson_line(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+async def run_batch_item(item_id: str, item: BatchItem, fingerprint: str) -> dict:
+    """Run one batch item at background priority and return its NDJSON record."""
+    record = {
+        "id": item_id,
+        "fingerprint": fingerprint,
+        "user_id": item.user_id,
+        "session_id": item.session_id,
+        "agent": item.agent,
+    }
+    try:
+        result = await serve_turn_patiently(
+            item.message, item.session_id, item.user_id,
+            priority=BACKGROUND, agent=item.agent, endpoint="batch",
+        )
     except Exception as e:
-        return f"[Server error: {e}]"
+        return {**record, "status": "failed", "error": f"{type(e).__name__}: {e}"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    return ChatResponse(reply="backend ok")
+    status = result.route if result.route in ("timeout", "error") else "ok"
+    return {**record, "status": status, "route": result.route, "reply": result.reply}
+
+async def run_batch(batch_id: str, items: list[tuple[str, BatchItem]], concurrency: int):
+    """
+    NDJSON lines for a batch: a header, one line per item as it finishes
+    (checkpointed ones first, marked "resumed"), then a summary.
+
+    Only "ok" items are checkpointed, so resuming retries the ones that timed
+    out or failed. A client that disconnects cancels the items still running.
+    """
+    done = await asyncio.to_thread(batch_checkpoints.load, batch_id)
+    counts = {"ok": 0, "resumed": 0, "timeout": 0, "error": 0, "failed": 0}
+
+    pending: list[tuple[str, BatchItem, str]] = []
+    resumed: list[dict] = []
+    for item_id, item in items:
+        fingerprint = item_fingerprint(item.user_id, item.session_id, item.message, item.agent)
+        record = done.get(item_id)
+        if record is not None and record.get("fingerprint") == fingerprint:
+            resumed.append({**record, "resumed": True})
+        else:
+            pending.append((item_id, item, fingerprint))
+
+    yield ndjson_line({"batch_id": batch_id, "items": len(items), "resumed": len(resumed)})
+    for record in resumed:
+        counts["resumed"] += 1
+        metrics.BATCH_ITEMS.inc(status="resumed")
+        yield ndjson_line(record)
+
+    finished: asyncio.Queue = asyncio.Queue()
+    work = iter(pending)
+
+    async def worker():
+        for item_id, item, fingerprint in work:
+            record = await run_batch_item(item_id, item, fingerprint)
+            if record["status"] == "ok":
+                try:
+                    await asyncio.to_thread(batch_checkpoints.append, batch_id, record)
+                except OSError as e:
+                    record["checkpoint_error"] = str(e)
+            await finished.put(record)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+    try:
+        for _ in range(len(pending)):
+            record = await finished.get()
+            counts[record["status"]] += 1
+            metrics.BATCH_ITEMS.inc(status=record["status"])
+            yield ndjson_line(record)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    yield ndjson_line({"batch_id": batch_id, "done": True, **counts})
+
+@app.post("/chat/batch")
+async def chat_batch(req: BatchRequest):
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"at most {BATCH_MAX_ITEMS} items per batch")
+    batch_id = req.batch_id or uuid.uuid4().hex
+    if not batch_checkpoints.valid_id(batch_id):
+        raise HTTPException(400, "batch_id may only contain letters, digits, '.', '_' and '-'")
+
+    items: list[tuple[str, BatchItem]] = []
+    seen: set[str] = set()
+    for index, item in enumerate(req.items):
+        item_id = item.id or str(index)
+        if item_id in seen:
+            raise HTTPException(400, f"duplicate item id {item_id!r}")
+        seen.add(item_id)
+        if item.agent is not None:
+            item = item.model_copy(update={"agent": specialist_name(item.agent, f"item {item_id!r}: ")})
+        items.append((item_id, item))
+
+    concurrency = max(1, min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    return StreamingResponse(
+        run_batch(batch_id, items, concurrency),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id, "X-Accel-Buffering": "no"},
+    )
+
+async def run_job(job: dict, on_text: Callable[[str], None]) -> tuple[str, str, bool]:
+    # nobody waits on a job live: it queues behind /chat turns, as batch items do
+    result = await serve_turn_patiently(
+        job["message"], job["session_id"], job["user_id"],
+        timeout=JOB_TIMEOUT, priority=BACKGROUND, agent=job["agent"], endpoint="job", on_text=on_text,
+    )
+    return result.reply, result.route, result.route != "error"
+
+def build_job_workers(workers: int) -> JobWorkers:
+    return JobWorkers(job_store, run_job, workers=workers, lease=JOB_LEASE, callback_hosts=JOB_CALLBACK_HOSTS)
+
+job_workers = build_job_workers(JOB_WORKERS)
+metrics.export_stats("pde_jobs", "Background job workers in this process (see jobs.py).", job_workers.stats)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(req: JobRequest):
+    agent = specialist_name(req.agent) if req.agent is not None else None
+    if req.callback_url is not None:
+        try:
+            await asyncio.to_thread(check_callback_url, req.callback_url, JOB_CALLBACK_HOSTS)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    job = await asyncio.to_thread(
+        job_store.create, req.user_id, req.session_id, req.message, agent, req.callback_url
+    )
+    job_workers.wake()
+    location = f"/jobs/{job['id']}?{urlencode({'user_id': req.user_id})}"
+    return {"id": job["id"], "status": job["status"], "location": location}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = USER_ID):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    # someone else's job looks just like a missing one
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(404, "no such job")
+    return {field: job[field] for field in PUBLIC_FIELDS}
+
+# bearer token for the operator endpoints, /traces and /usage: they show every
+# user's data and the only identity a chat request carries is the user_id it
+# claims (unset: those endpoints are disabled)
+ADMIN_TOKEN = os.environ.get("PDE_ADMIN_TOKEN", "")
+
+def require_admin(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "set PDE_ADMIN_TOKEN to enable this endpoint")
+    supplied = request.headers.get("authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(401, "admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/usage")
+async def usage(request: Request, user_id: str | None = None, session_id: str | None = None, top: int = 10):
+    """
+    Token totals and cost: overall with per-agent totals and the top users,
+    one user's (per agent, per session, and their budget), or one session's.
+    """
+    require_admin(request)
+    if session_id is not None:
+        if user_id is None:
+            raise HTTPException(400, "session_id needs a user_id")
+        return await usage_ledger.session_summary(user_id, session_id)
+    if user_id is not None:
+        return await usage_ledger.user_summary(user_id)
+    return await usage_ledger.summary(top=top)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces(request: Request, limit: int = 20):
+    require_admin(request)
+    # most recent finished turns first, each with its nested specialist spans
+    recent = list(metrics.recent_traces)[-limit:][::-1]
+    return {"traces": [span.to_dict() for span in recent]}
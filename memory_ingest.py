@@ -0,0 +1,192 @@
+# memory_ingest.py
+#
+# Incremental ingestion of conversations into long-term memory (see
+# memory_store.py). The session service hands every event it appends - the
+# user's message and each final event of the runner's stream - to
+# MemoryIngestor.observe(), which only buffers it. One background task per
+# process writes the buffered events out after the turn:
+#
+# * only new events: each session has a high-water mark (the timestamp of
+#   the last event written), so nothing is embedded twice and a session is
+#   never re-read, however long the conversation gets
+# * debounced: a session is written once it has been quiet for `debounce`
+#   seconds (or `max_delay` after its oldest buffered event), so a burst of
+#   turns - or a CommandCore turn with several specialist calls - is one write
+# * batched: every session that is due, whichever user it belongs to, goes
+#   into one write of up to `max_batch` events (one embedding call, one
+#   transaction)
+
+import asyncio
+import contextlib
+import contextvars
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import metrics
+
+SessionKey = tuple[str, str, str]   # app_name, user_id, session_id
+
+# (app_name, user_id, session_id, event)
+MemoryEvent = tuple[str, str, str, Any]
+
+
+class MemoryIngestor:
+    """
+    Buffers appended events per session and hands them to `write(events)`
+    in batches, on a task of its own.
+
+    The task runs in a fresh context, so it inherits no turn deadline or
+    scheduler priority from the turn that happened to start it. Events of
+    `ignore_users` and events without text are dropped on arrival. A failed
+    write is retried `debounce` seconds later, up to `max_attempts` times.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[MemoryEvent]], Awaitable[None]],
+        debounce: float = 2.0,
+        max_delay: float = 10.0,
+        max_batch: int = 512,
+        max_attempts: int = 3,
+        ignore_users: Iterable[str] = (),
+        max_sessions: int = 50_000,
+    ):
+        self.write = write
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.ignore_users = set(ignore_users)
+        self.max_sessions = max_sessions
+        # session -> [(event, observed at)], first observed, last observed, attempts
+        self._buffers: dict[SessionKey, list] = {}
+        self._high_water: "OrderedDict[SessionKey, float]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+        self.counters = {"observed": 0, "skipped": 0, "written": 0, "batches": 0,
+                         "write_errors": 0, "dropped": 0, "write_seconds": 0.0}
+
+    def observe(self, session, event) -> None:
+        """Buffer `event`, just appended to `session` (a session service listener)."""
+        if event.partial or session.user_id in self.ignore_users:
+            return
+        if not (event.content and event.content.parts and any(part.text for part in event.content.parts)):
+            return
+        key = (session.app_name, session.user_id, session.id)
+        if event.timestamp <= self._high_water.get(key, float("-inf")):
+            self.counters["skipped"] += 1
+            return
+        now = time.monotonic()
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = [[], now, now, 0]
+        buffer[0].append((event, now))
+        buffer[2] = now
+        self.counters["observed"] += 1
+        self._start()
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    def _due_at(self, buffer: list) -> float:
+        return min(buffer[2] + self.debounce, buffer[1] + self.max_delay)
+
+    def _take_batch(self, now: float) -> list[tuple[SessionKey, list]]:
+        """
+        Whole buffers of due sessions, oldest first, up to `max_batch` events.
+        Once one session is due, those due within half a debounce join it.
+        """
+        if not self._closing and min(self._due_at(buffer) for buffer in self._buffers.values()) > now:
+            return []
+        horizon = float("inf") if self._closing else now + self.debounce / 2
+        due = sorted(
+            (buffer[1], key) for key, buffer in self._buffers.items()
+            if self._due_at(buffer) <= horizon
+        )
+        batch, size = [], 0
+        for _, key in due:
+            if batch and size + len(self._buffers[key][0]) > self.max_batch:
+                break
+            buffer = self._buffers.pop(key)
+            batch.append((key, buffer))
+            size += len(buffer[0])
+        return batch
+
+    async def _run(self) -> None:
+        while self._buffers:
+            now = time.monotonic()
+            batch = self._take_batch(now)
+            if not batch:
+                self._wakeup.clear()
+                wait = min(self._due_at(buffer) for buffer in self._buffers.values()) - now
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), max(wait, 0.0))
+                continue
+            await self._write(batch)
+
+    async def _write(self, batch: list[tuple[SessionKey, list]]) -> None:
+        events = [(*key, event) for key, buffer in batch for event, _ in buffer[0]]
+        started = time.perf_counter()
+        try:
+            await self.write(events)
+        except Exception:
+            self.counters["write_errors"] += 1
+            self._requeue(batch)
+            if not self._closing:
+                await asyncio.sleep(self.debounce)
+            return
+        finally:
+            self.counters["write_seconds"] += time.perf_counter() - started
+
+        now = time.monotonic()
+        for key, buffer in batch:
+            self._high_water[key] = max(self._high_water.get(key, float("-inf")),
+                                        max(event.timestamp for event, _ in buffer[0]))
+            self._high_water.move_to_end(key)
+            for _, observed in buffer[0]:
+                metrics.MEMORY_INGEST_LAG_SECONDS.observe(now - observed)
+        while len(self._high_water) > self.max_sessions:
+            self._high_water.popitem(last=False)
+        self.counters["written"] += len(events)
+        self.counters["batches"] += 1
+        metrics.MEMORY_INGESTED_EVENTS.inc(len(events))
+
+    def _requeue(self, batch: list[tuple[SessionKey, list]]) -> None:
+        for key, buffer in batch:
+            buffer[3] += 1
+            if buffer[3] >= self.max_attempts:
+                self.counters["dropped"] += len(buffer[0])
+                continue
+            # back in line, together with anything observed since
+            newer = self._buffers.pop(key, None)
+            if newer is not None:
+                buffer[0].extend(newer[0])
+                buffer[2] = newer[2]
+            self._buffers[key] = buffer
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Write everything still buffered, waiting up to `timeout` seconds (shutdown)."""
+        if self._task is None or self._task.done():
+            return
+        self._closing = True
+        self._wakeup.set()
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        if not self._task.done():
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            **self.counters,
+            "pending_sessions": len(self._buffers),
+            "pending_events": sum(len(buffer[0]) for buffer in self._buffers.values()),
+            # how far behind the memory the agents search is right now
+            "lag_seconds": max((now - buffer[1] for buffer in self._buffers.values()), default=0.0),
+        }
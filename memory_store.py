@@ -0,0 +1,321 @@
+# memory_store.py
+#
+# Memory service backends for the runners in A.py. Like session_store.py, only
+# imported when the registry first builds its memory service.
+#
+# * SqliteMemoryService - InMemoryMemoryService's keyword match, shared by
+#   every worker through SQLite
+# * VectorMemoryService - ranked top-k retrieval from a per-user vector index
+#   (vector_index.py), persisted in SQLite so every worker sees it
+
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.genai import types
+
+from vector_index import HashingEmbedder, VectorIndex
+
+MEMORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    app_name   TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event_id   TEXT NOT NULL,
+    author     TEXT,
+    timestamp  REAL NOT NULL,
+    text       TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id, event_id)
+);
+"""
+
+VECTOR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_vectors (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name   TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event_id   TEXT NOT NULL,
+    author     TEXT,
+    timestamp  REAL NOT NULL,
+    text       TEXT NOT NULL,
+    embedding  BLOB NOT NULL,           -- float32 x dims
+    UNIQUE (app_name, user_id, session_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS memory_vectors_by_user ON memory_vectors (app_name, user_id, seq);
+"""
+
+_WORD = re.compile(r"[A-Za-z]+")
+
+
+def _words(text: str) -> set[str]:
+    return {word.lower() for word in _WORD.findall(text)}
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _memory_entry(author: str | None, timestamp: float, text: str) -> MemoryEntry:
+    return MemoryEntry(
+        content=types.Content(role="user" if author == "user" else "model", parts=[types.Part(text=text)]),
+        author=author,
+        timestamp=datetime.fromtimestamp(timestamp).isoformat(),
+    )
+
+
+def event_text(event) -> str:
+    if not (event.content and event.content.parts):
+        return ""
+    return " ".join(part.text for part in event.content.parts if part.text).strip()
+
+
+class SqliteMemoryService(BaseMemoryService):
+    """
+    InMemoryMemoryService's keyword search over a SQLite table (WAL), so
+    every worker on the box sees the memories any of them ingested.
+    """
+
+    def __init__(self, path: str | Path = "memory.db"):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(MEMORY_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def _add(self, rows: list[tuple]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO memories VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def add_session_to_memory(self, session: Session) -> None:
+        await self.add_events_to_memory(
+            [(session.app_name, session.user_id, session.id, event) for event in session.events]
+        )
+
+    async def add_events_to_memory(self, events: list[tuple[str, str, str, Event]]) -> None:
+        """Add individual events, as (app_name, user_id, session_id, event)."""
+        rows = [
+            (app_name, user_id, session_id, event.id, event.author, event.timestamp, text)
+            for app_name, user_id, session_id, event in events
+            if (text := event_text(event))
+        ]
+        if rows:
+            await asyncio.to_thread(self._add, rows)
+
+    def _search(self, app_name: str, user_id: str, query: str) -> list[MemoryEntry]:
+        query_words = _words(query)
+        rows = self._conn().execute(
+            "SELECT author, timestamp, text FROM memories WHERE app_name = ? AND user_id = ? ORDER BY timestamp",
+            (app_name, user_id),
+        ).fetchall()
+        return [
+            _memory_entry(author, timestamp, text)
+            for author, timestamp, text in rows
+            if query_words & _words(text)
+        ]
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        memories = await asyncio.to_thread(self._search, app_name, user_id, query)
+        return SearchMemoryResponse(memories=memories)
+
+
+class VectorMemoryService(BaseMemoryService):
+    """
+    Top-`top_k` memories by cosine similarity to the query, from the asking
+    user's partition of a VectorIndex.
+
+    Events are embedded once, when first added - as part of a session or
+    on their own (add_events_to_memory) - and stored with their embedding
+    in SQLite (WAL). The index is a cache of that table:
+    a user's partition is loaded on their first search and then caught up
+    with rows added since (by any worker) before each search. Partitions
+    past `max_partitions`, or idle for `idle_seconds`, are dropped from the
+    index and loaded again from the table when next searched. Adding a
+    session again only embeds the events that are not stored yet. Matches
+    scoring below `min_score`, and repeats of a text already returned, are
+    dropped.
+    """
+
+    # partitions share this many locks, so the locks don't grow with the users
+    lock_stripes = 64
+
+    def __init__(
+        self,
+        path: str | Path = "memory.db",
+        dims: int = 256,
+        top_k: int = 5,
+        min_score: float = 0.15,
+        ivf_threshold: int = 100_000,
+        probe_fraction: float = 0.5,
+        max_partitions: int = 10_000,
+        idle_seconds: float = 3600.0,
+    ):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.top_k = top_k
+        self.min_score = min_score
+        self.embedder = HashingEmbedder(dims)
+        self.index = VectorIndex(
+            dims,
+            ivf_threshold=ivf_threshold,
+            probe_fraction=probe_fraction,
+            max_partitions=max_partitions,
+            idle_seconds=idle_seconds,
+        )
+        self._local = threading.local()
+        self._conn().executescript(VECTOR_SCHEMA)
+        self._loaded: dict[tuple[str, str], int] = {}     # partition -> last seq in the index
+        self._partition_locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        self.counters = {"sessions_added": 0, "events_embedded": 0, "searches": 0, "search_seconds": 0.0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def _partition_lock(self, partition: tuple[str, str]) -> threading.Lock:
+        return self._partition_locks[hash(partition) % self.lock_stripes]
+
+    def _evict_cold(self) -> None:
+        # every row is in the table already, so dropping a partition loses nothing
+        for partition in self.index.cold():
+            lock = self._partition_lock(partition)
+            if not lock.acquire(blocking=False):
+                continue    # being caught up right now: not that cold
+            try:
+                self.index.drop(partition)
+                self._loaded.pop(partition, None)
+            finally:
+                lock.release()
+
+    def _catch_up(self, partition: tuple[str, str]) -> None:
+        """Load the partition's rows the index doesn't have yet."""
+        with self._partition_lock(partition):
+            rows = self._conn().execute(
+                "SELECT seq, session_id, event_id, author, timestamp, text, embedding FROM memory_vectors"
+                " WHERE app_name = ? AND user_id = ? AND seq > ? ORDER BY seq",
+                (*partition, self._loaded.get(partition, 0)),
+            ).fetchall()
+            if rows:
+                vectors = np.frombuffer(b"".join(row[6] for row in rows), dtype=np.float32)
+                if vectors.size != len(rows) * self.embedder.dims:
+                    # stored with another PDE_MEMORY_DIMS: embed again
+                    vectors = self.embedder.embed([row[5] for row in rows])
+                self.index.add(
+                    partition,
+                    [(row[1], row[2]) for row in rows],
+                    vectors.reshape(len(rows), self.embedder.dims),
+                    [(row[3], row[4], row[5]) for row in rows],
+                )
+                self._loaded[partition] = rows[-1][0]
+        self._evict_cold()
+
+    def _catch_up_loaded(self, partitions) -> None:
+        # partitions nobody searched yet are loaded on their first search
+        for partition in partitions:
+            if partition in self._loaded:
+                self._catch_up(partition)
+
+    def _add_events(self, events: list[tuple[str, str, str, Event]]) -> int:
+        fresh = [(app_name, user_id, session_id, event, text)
+                 for app_name, user_id, session_id, event in events
+                 if (text := event_text(event))]
+        if not fresh:
+            return 0
+        # one embedding call for the whole batch, whoever's events they are
+        vectors = self.embedder.embed([entry[4] for entry in fresh])
+        rows = [
+            (app_name, user_id, session_id, event.id, event.author, event.timestamp, text, vector.tobytes())
+            for (app_name, user_id, session_id, event, text), vector in zip(fresh, vectors)
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO memory_vectors"
+                " (app_name, user_id, session_id, event_id, author, timestamp, text, embedding)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._catch_up_loaded({(row[0], row[1]) for row in rows})
+        return len(rows)
+
+    def _add_session(self, session: Session) -> int:
+        partition = (session.app_name, session.user_id)
+        self._catch_up(partition)
+        return self._add_events([
+            (session.app_name, session.user_id, session.id, event)
+            for event in session.events
+            if not self.index.has_key(partition, (session.id, event.id))
+        ])
+
+    async def add_session_to_memory(self, session: Session) -> None:
+        embedded = await asyncio.to_thread(self._add_session, session)
+        self.counters["sessions_added"] += 1
+        self.counters["events_embedded"] += embedded
+
+    async def add_events_to_memory(self, events: list[tuple[str, str, str, Event]]) -> None:
+        """
+        Add individual events, as (app_name, user_id, session_id, event) -
+        the incremental path (see memory_ingest.py). Events already stored
+        are ignored, but still embedded: callers only send new ones.
+        """
+        embedded = await asyncio.to_thread(self._add_events, events)
+        self.counters["events_embedded"] += embedded
+
+    def _search(self, app_name: str, user_id: str, query: str) -> list[MemoryEntry]:
+        started = time.perf_counter()
+        partition = (app_name, user_id)
+        self._catch_up(partition)
+        # a message forwarded to a specialist is stored in both sessions:
+        # over-fetch so repeats don't crowd out other memories
+        hits = self.index.search(partition, self.embedder.embed([query])[0], 2 * self.top_k)
+        entries, seen = [], set()
+        for score, (author, timestamp, text) in hits:
+            if score < self.min_score or len(entries) == self.top_k:
+                break
+            if text not in seen:
+                seen.add(text)
+                entries.append(_memory_entry(author, timestamp, text))
+        self.counters["searches"] += 1
+        self.counters["search_seconds"] += time.perf_counter() - started
+        return entries
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        memories = await asyncio.to_thread(self._search, app_name, user_id, query)
+        return SearchMemoryResponse(memories=memories)
+
+    def stats(self) -> dict:
+        return {**self.index.stats(), **self.counters}
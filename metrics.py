@@ -0,0 +1,389 @@
+# metrics.py
+#
+# Minimal Prometheus-style metrics and nested trace spans for the agent
+# pipeline, with no extra dependencies. main.py serves `registry.render()` on
+# /metrics and recent traces on /traces. Everything is per process: with
+# several uvicorn workers, each one reports its own numbers.
+
+import contextlib
+import contextvars
+import math
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect: Optional[Callable[[], dict]] = None):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+        # optional callback returning {label-tuple: value}, evaluated at scrape time
+        self.collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        values = dict(self.values)
+        if self.collect is not None:
+            try:
+                values.update(self.collect())
+            except Exception:
+                pass
+        for key, value in values.items():
+            yield f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> ([count per bucket], sum, count)
+        self.values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None) -> Gauge:
+        return self._register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# -- pipeline metrics --------------------------------------------------------
+
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "pde_requests_in_flight", "Chat requests currently being served.", ["endpoint"]
+)
+TURN_SECONDS = registry.histogram(
+    "pde_turn_seconds", "End-to-end latency of one chat turn.", ["endpoint", "route"]
+)
+STAGE_SECONDS = registry.histogram(
+    "pde_stage_seconds", "Latency of one stage of a turn (session lookup, runner, ...).", ["stage", "agent"]
+)
+AGENT_RUN_SECONDS = registry.histogram(
+    "pde_agent_run_seconds", "Duration of one Runner.run_async call.", ["agent"]
+)
+AGENT_FIRST_EVENT_SECONDS = registry.histogram(
+    "pde_agent_first_event_seconds", "Time from starting a runner to its first event.", ["agent"]
+)
+SPECIALIST_CALLS = registry.counter(
+    "pde_specialist_calls_total", "query_specialist calls by outcome.", ["agent", "outcome"]
+)
+EVENTS = registry.counter(
+    "pde_runner_events_total", "Events produced by runners.", ["agent"]
+)
+TOKENS = registry.counter(
+    "pde_tokens_total",
+    "Tokens reported in event usage metadata, by kind: prompt (cached included), cached,"
+    " tool_use_prompt, completion or thoughts.",
+    ["agent", "kind"],
+)
+TOKENS_PER_EVENT = registry.histogram(
+    "pde_tokens_per_event", "Total tokens reported per event that carries usage metadata.", ["agent"],
+    buckets=(64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+)
+TOOL_CALLS = registry.counter(
+    "pde_tool_calls_total", "Function/tool calls emitted by agents.", ["agent", "tool"]
+)
+SEARCH_GROUNDED_EVENTS = registry.counter(
+    "pde_search_grounded_events_total",
+    "Events carrying google_search grounding (the search itself runs inside the model call).",
+    ["agent"],
+)
+SCHEDULER_WAIT_SECONDS = registry.histogram(
+    "pde_scheduler_wait_seconds", "Time a model call waited for a scheduler slot.", ["priority", "agent"]
+)
+SCHEDULER_REJECTED = registry.counter(
+    "pde_scheduler_rejected_total", "Model calls / requests turned away by the scheduler.", ["reason"]
+)
+BREAKER_TRANSITIONS = registry.counter(
+    "pde_circuit_breaker_transitions_total", "Circuit breaker state changes per agent.", ["agent", "state"]
+)
+RESILIENCE_EVENTS = registry.counter(
+    "pde_resilience_events_total", "Model call retries, hedges, hedge wins and fast failures.", ["agent", "event"]
+)
+CONTEXT_TOKENS_SAVED = registry.counter(
+    "pde_context_tokens_saved_total", "Prompt tokens removed by history compaction.", ["agent"]
+)
+CONTEXT_TOKENS_SAVED_PER_REQUEST = registry.histogram(
+    "pde_context_tokens_saved_per_request", "Prompt tokens removed from one model request.", ["agent"],
+    buckets=(0, 100, 500, 1000, 2000, 5000, 10000, 20000, 50000),
+)
+PREFIX_CACHE_EVENTS = registry.counter(
+    "pde_prefix_cache_events_total",
+    "Cached instruction prefix hits, misses, creations, refreshes and fallbacks.",
+    ["agent", "event"],
+)
+SEARCH_LOOKUPS = registry.counter(
+    "pde_search_lookups_total", "google_search tool lookups: hit, coalesced or miss.", ["outcome"]
+)
+SEARCH_SAVED_SECONDS = registry.counter(
+    "pde_search_saved_seconds_total", "Search latency avoided by the cache and by coalescing."
+)
+
+BATCH_ITEMS = registry.counter(
+    "pde_batch_items_total", "/chat/batch items by status: ok, resumed, timeout, error or failed.", ["status"]
+)
+JOBS = registry.counter(
+    "pde_jobs_total", "Background jobs finished, by status (done or failed).", ["status"]
+)
+MEMORY_INGESTED_EVENTS = registry.counter(
+    "pde_memory_ingested_events_total", "Events written to long-term memory (see memory_ingest.py)."
+)
+MEMORY_INGEST_LAG_SECONDS = registry.histogram(
+    "pde_memory_ingest_lag_seconds", "Time from an event being appended to it being searchable in memory.",
+    buckets=(0.1, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120),
+)
+QUOTA_REJECTED = registry.counter(
+    "pde_quota_rejected_total", "Model calls refused because a token budget was spent.", ["scope"]
+)
+
+
+async def track_run(agent: str, events: AsyncIterator) -> AsyncIterator:
+    """Pass runner events through while recording counts, tokens, tool calls and timing."""
+    started = time.perf_counter()
+    first = True
+    try:
+        async for event in events:
+            if first:
+                AGENT_FIRST_EVENT_SECONDS.observe(time.perf_counter() - started, agent=agent)
+                first = False
+            record_event(event)
+            yield event
+    finally:
+        AGENT_RUN_SECONDS.observe(time.perf_counter() - started, agent=agent)
+        # close the runner now rather than at GC time if our consumer stopped early
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def record_event(event) -> None:
+    author = event.author or "unknown"
+    EVENTS.inc(agent=author)
+
+    usage = getattr(event, "usage_metadata", None)
+    if usage is not None and not event.partial:
+        for kind, count in (
+            ("prompt", usage.prompt_token_count),
+            ("cached", usage.cached_content_token_count),
+            ("tool_use_prompt", usage.tool_use_prompt_token_count),
+            ("completion", usage.candidates_token_count),
+            ("thoughts", usage.thoughts_token_count),
+        ):
+            if count:
+                TOKENS.inc(count, agent=author, kind=kind)
+        if usage.total_token_count:
+            TOKENS_PER_EVENT.observe(usage.total_token_count, agent=author)
+
+    for call in event.get_function_calls():
+        TOOL_CALLS.inc(agent=author, tool=call.name)
+    if getattr(event, "grounding_metadata", None) is not None:
+        SEARCH_GROUNDED_EVENTS.inc(agent=author)
+
+
+def export_stats(name: str, help: str, stats: Callable[[], dict]) -> None:
+    """Expose the numeric fields of some component's stats() dict as a gauge."""
+
+    def collect() -> dict:
+        return {
+            (key,): value
+            for key, value in stats().items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+    registry.gauge(name, help, ["field"], collect=collect)
+
+
+# -- tracing -----------------------------------------------------------------
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    attributes: dict[str, Any] = field(default_factory=dict)
+    end: Optional[float] = None
+    status: str = "ok"
+    children: list["Span"] = field(default_factory=list)
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("pde_span", default=None)
+recent_traces: deque = deque(maxlen=200)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+    Open a trace span nested under the current one.
+
+    The current span lives in a contextvar, so spans opened by specialist
+    calls - including ones fanned out with asyncio.gather - hang under the
+    turn that triggered them. Finished root spans land in `recent_traces`.
+    """
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+    if parent is not None:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        current.end = time.time()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # closed from another context (e.g. an abandoned streaming generator)
+            pass
+        if parent is None:
+            recent_traces.append(current)
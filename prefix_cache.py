@@ -0,0 +1,219 @@
+# prefix_cache.py
+#
+# Registers each agent's static prompt prefix - its system instruction and
+# tool declarations - with the model's context-caching facility once, and
+# sends later calls with a reference to the cached content instead of the
+# multi-kilobyte prefix. Used by the registry's model wrapper
+# (scheduler.scheduled_model) on every call.
+#
+# * one cache handle per agent, keyed by a fingerprint of model + prefix, so a
+#   changed instruction simply gets a new handle
+# * creating a handle never delays a call: the call that finds none goes out
+#   as a plain prompt and creation runs in the background (one per agent)
+# * a handle that is used within `refresh_margin` of expiring gets its TTL
+#   extended in the background, so busy agents never see it lapse
+# * prefixes below `min_tokens` (the API's minimum), models without caching
+#   and failed creations fall back to plain prompts; a call that fails while
+#   using a handle drops the handle and is retried once without it
+
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import metrics
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class GeminiCacheBackend:
+    """Context caching through google.genai's `client.aio.caches`."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, model: str, system_instruction, tools, ttl: float) -> tuple[str, float]:
+        from google.genai import types
+
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                tools=tools or None,
+                ttl=f"{int(ttl)}s",
+            ),
+        )
+        return cached.name, time.monotonic() + ttl
+
+    async def refresh(self, name: str, ttl: float) -> float:
+        from google.genai import types
+
+        await self.client.aio.caches.update(
+            name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s")
+        )
+        return time.monotonic() + ttl
+
+
+def backend_for(model) -> Optional[Any]:
+    """The caching backend for a BaseLlm, or None if it can't cache."""
+    backend = getattr(model, "cache_backend", None)
+    if backend is not None:
+        return backend
+    if any(cls.__name__ == "Gemini" for cls in type(model).__mro__):
+        return GeminiCacheBackend(model.api_client)
+    return None
+
+
+@dataclass
+class CacheHandle:
+    fingerprint: str
+    name: Optional[str] = None
+    expires_at: float = 0.0
+    tokens: int = 0
+    failed_until: float = 0.0       # back off after a failed creation
+
+
+class PrefixCache:
+    """
+    Per-agent cached-content handles for static prompt prefixes.
+
+    `ttl` is the lifetime requested for each cache, `refresh_margin` how
+    close to expiry a use triggers an extension, `min_tokens` the smallest
+    prefix worth caching and `retry_after` how long to wait after a failed
+    creation before trying again.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        min_tokens: int = 1024,
+        retry_after: float = 600.0,
+        enabled: bool = True,
+    ):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self.enabled = enabled
+        self.handles: dict[str, CacheHandle] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.counters = {"hits": 0, "misses": 0, "created": 0, "refreshed": 0, "failures": 0, "fallbacks": 0}
+
+    @staticmethod
+    def _prefix(llm_request) -> tuple[Any, list]:
+        config = llm_request.config
+        if config is None:
+            return None, []
+        return config.system_instruction, list(config.tools or [])
+
+    @staticmethod
+    def _fingerprint(model: str, system_instruction, tools: list) -> str:
+        payload = json.dumps(
+            {
+                "model": model,
+                "instruction": str(system_instruction),
+                "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def prepare(self, agent: str, model, llm_request):
+        """Return the request to send: with a cached prefix if one is ready, else unchanged."""
+        if not self.enabled:
+            return llm_request
+        backend = backend_for(model)
+        system_instruction, tools = self._prefix(llm_request)
+        if backend is None or system_instruction is None:
+            return llm_request
+        if llm_request.config.cached_content:
+            return llm_request  # someone else already manages caching for this call
+
+        tokens = estimate_tokens(str(system_instruction)) + sum(
+            estimate_tokens(json.dumps(tool.model_dump(mode="json", exclude_none=True))) for tool in tools
+        )
+        if tokens < self.min_tokens:
+            return llm_request
+
+        fingerprint = self._fingerprint(llm_request.model or model.model, system_instruction, tools)
+        handle = self.handles.get(agent)
+        if handle is None or handle.fingerprint != fingerprint:
+            handle = self.handles[agent] = CacheHandle(fingerprint, tokens=tokens)
+
+        now = time.monotonic()
+        if handle.name is None or handle.expires_at <= now:
+            handle.name = None
+            self.counters["misses"] += 1
+            metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="miss")
+            if handle.failed_until <= now:
+                self._background(agent, self._create(agent, backend, llm_request.model or model.model,
+                                                     system_instruction, tools, handle))
+            return llm_request
+
+        if handle.expires_at - now < self.refresh_margin:
+            self._background(agent, self._refresh(agent, backend, handle))
+        self.counters["hits"] += 1
+        metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="hit")
+
+        # the API rejects a request that repeats what the cache already holds
+        config = llm_request.config.model_copy(
+            update={"system_instruction": None, "tools": None, "tool_config": None, "cached_content": handle.name}
+        )
+        return llm_request.model_copy(update={"config": config})
+
+    def invalidate(self, agent: str) -> None:
+        """Forget an agent's handle (e.g. the server no longer knows it)."""
+        handle = self.handles.get(agent)
+        if handle is not None:
+            handle.name = None
+            handle.expires_at = 0.0
+        self.counters["fallbacks"] += 1
+        metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="fallback")
+
+    def _background(self, agent: str, coro) -> None:
+        running = self._tasks.get(agent)
+        if running is not None and not running.done():
+            coro.close()
+            return
+        self._tasks[agent] = asyncio.get_running_loop().create_task(coro)
+
+    async def _create(self, agent, backend, model_name, system_instruction, tools, handle: CacheHandle):
+        try:
+            name, expires_at = await backend.create(model_name, system_instruction, tools, self.ttl)
+        except Exception:
+            handle.failed_until = time.monotonic() + self.retry_after
+            self.counters["failures"] += 1
+            metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="create_failed")
+            return
+        handle.name, handle.expires_at = name, expires_at
+        self.counters["created"] += 1
+        metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="created")
+
+    async def _refresh(self, agent, backend, handle: CacheHandle):
+        try:
+            handle.expires_at = await backend.refresh(handle.name, self.ttl)
+        except Exception:
+            # it will lapse and be recreated on a later call
+            self.counters["failures"] += 1
+            metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="refresh_failed")
+            return
+        self.counters["refreshed"] += 1
+        metrics.PREFIX_CACHE_EVENTS.inc(agent=agent, event="refreshed")
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "handles": sum(1 for h in self.handles.values() if h.name and h.expires_at > time.monotonic()),
+            "cached_prefix_tokens": sum(h.tokens for h in self.handles.values() if h.name),
+        }
@@ -0,0 +1,322 @@
+# resilience.py
+#
+# Retry, hedging and circuit breaking around individual model calls. The
+# registry's model wrapper (scheduler.scheduled_model) runs each call through
+# `Resilience.stream`:
+#
+# * circuit breaker - after `threshold` consecutive failures of one agent's
+#   calls, further calls fail fast with CircuitOpen for `reset_timeout`
+#   seconds, then a single probe decides whether to close again. Only
+#   transport errors and 5xx count: a 4xx says the request was bad, not the
+#   backend, and one user's bad prompt mustn't cut everybody off
+# * retry - transport failures (timeouts, dropped connections) that happen
+#   before the first response are retried with exponential backoff and full
+#   jitter; HTTP 429/5xx are already retried inside the Gemini client by
+#   A.retry_config, so they are not retried a second time here
+# * hedging - when the first response is later than that agent's recent p95,
+#   one duplicate call is started and whichever answers first wins. Model
+#   calls don't touch session state, so the loser is simply cancelled.
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+
+import metrics
+
+_END = object()
+
+# responses a hedged/raced call may buffer ahead of its consumer
+PUMP_QUEUE_SIZE = 16
+
+
+class CircuitOpen(Exception):
+    """Calls to this agent are failing; not trying again until the breaker resets."""
+
+    def __init__(self, agent: str, retry_after: float):
+        super().__init__(f"{agent} is unavailable (circuit open), retry after {retry_after:.0f}s")
+        self.agent = agent
+        self.retry_after = retry_after
+
+
+def is_transient(exc: BaseException) -> bool:
+    # httpx/aiohttp transport errors carry these names without importing them
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError)) or type(exc).__name__ in {
+        "ConnectError", "ReadError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError",
+        "ServerDisconnectedError", "ClientConnectionError",
+    }
+
+
+def is_server_error(exc: BaseException) -> bool:
+    """Does `exc` say something about the backend's health (transport error or 5xx)?"""
+    if is_transient(exc):
+        return True
+    # google.genai's APIError has `code`, httpx's HTTPStatusError a response
+    code = getattr(exc, "code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(code, int) and code >= 500
+
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 3, initial_delay: float = 0.5, max_delay: float = 8.0, multiplier: float = 2.0):
+        self.attempts = attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, initial * multiplier**attempt)]."""
+        return random.uniform(0, min(self.max_delay, self.initial_delay * self.multiplier ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, agent: str, threshold: int = 5, reset_timeout: float = 30.0):
+        self.agent = agent
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """Failing fast right now (open and not yet due for a probe)?"""
+        return self.state == "open" and self.retry_after() > 0
+
+    def allow(self) -> bool:
+        """May a call go ahead now? (In half-open state only one probe at a time.)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if self.retry_after() > 0:
+                return False
+            self._set("half_open")
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != "closed":
+            self._set("closed")
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._set("open")
+
+    def release(self) -> None:
+        """The call said nothing about backend health (cancelled, bad request); let another probe try."""
+        self._probing = False
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        metrics.BREAKER_TRANSITIONS.inc(agent=self.agent, state=state)
+
+
+class LatencyWindow:
+    """Recent time-to-first-response samples for one agent."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Pump:
+    """Drain an async iterator in its own task so two of them can race."""
+
+    def __init__(self, source: AsyncIterator, maxsize: int = PUMP_QUEUE_SIZE):
+        # bounded, so a slow consumer still slows the model stream down
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.first = asyncio.Event()
+        self.task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source):
+        try:
+            async for item in source:
+                await self.queue.put(item)
+                self.first.set()
+            await self.queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await self.queue.put(e)
+        finally:
+            self.first.set()
+
+    def failed_early(self) -> bool:
+        return not self.queue.empty() and isinstance(self.queue._queue[0], BaseException)
+
+    async def items(self):
+        while True:
+            item = await self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    async def cancel(self):
+        if not self.task.done():
+            self.task.cancel()
+        try:
+            await self.task
+        except BaseException:
+            pass
+
+
+class Resilience:
+    """
+    Per-agent breakers, latency windows and the shared retry/hedge policy.
+
+    `can_hedge()` is asked before each duplicate call (e.g. "is there spare
+    scheduler capacity?"); at most `hedge_budget` of all calls are hedged.
+    Hedging waits for `hedge_min_samples` latencies before it kicks in.
+    """
+
+    def __init__(
+        self,
+        retry: Optional[RetryPolicy] = None,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+        hedge: bool = True,
+        hedge_quantile: float = 0.95,
+        hedge_budget: float = 0.1,
+        hedge_min_samples: int = 20,
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self.can_hedge = can_hedge
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.latency: dict[str, LatencyWindow] = {}
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "fast_failures": 0}
+
+    def breaker(self, agent: str) -> CircuitBreaker:
+        breaker = self.breakers.get(agent)
+        if breaker is None:
+            breaker = self.breakers[agent] = CircuitBreaker(agent, self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def _hedge_delay(self, agent: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        window = self.latency.get(agent)
+        if window is None or len(window.samples) < self.hedge_min_samples:
+            return None
+        return window.quantile(self.hedge_quantile)
+
+    def _may_hedge(self) -> bool:
+        if self.counters["hedges"] >= self.hedge_budget * self.counters["calls"]:
+            return False
+        return self.can_hedge is None or self.can_hedge()
+
+    async def stream(self, agent: str, call: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Run `call()` (a model call's response stream) with breaker, retries and hedging."""
+        breaker = self.breaker(agent)
+        if not breaker.allow():
+            self.counters["fast_failures"] += 1
+            metrics.RESILIENCE_EVENTS.inc(agent=agent, event="fast_failure")
+            raise CircuitOpen(agent, breaker.retry_after())
+        self.counters["calls"] += 1
+
+        outcome = None
+        try:
+            attempt = 0
+            while True:
+                yielded = False
+                try:
+                    async for response in self._race(agent, call):
+                        yielded = True
+                        yield response
+                    outcome = "ok"
+                    return
+                except Exception as e:
+                    if yielded or not is_transient(e) or attempt + 1 >= self.retry.attempts:
+                        # a bad request, or our own back-pressure (SchedulerBusy,
+                        # QuotaExceeded), says nothing about backend health
+                        outcome = "failed" if is_server_error(e) else None
+                        raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                self.counters["retries"] += 1
+                metrics.RESILIENCE_EVENTS.inc(agent=agent, event="retry")
+        finally:
+            if outcome == "ok":
+                breaker.record_success()
+            elif outcome == "failed":
+                breaker.record_failure()
+            else:
+                breaker.release()
+
+    async def _race(self, agent: str, call: Callable[[], AsyncIterator]) -> AsyncIterator:
+        started = time.perf_counter()
+        window = self.latency.setdefault(agent, LatencyWindow())
+        pumps = [_Pump(call())]
+        try:
+            delay = self._hedge_delay(agent)
+            if delay is not None:
+                try:
+                    await asyncio.wait_for(pumps[0].first.wait(), delay)
+                except asyncio.TimeoutError:
+                    if self._may_hedge():
+                        self.counters["hedges"] += 1
+                        metrics.RESILIENCE_EVENTS.inc(agent=agent, event="hedge")
+                        pumps.append(_Pump(call()))
+
+            # first pump with a response wins; one that failed outright only
+            # wins if nothing else is left running
+            winner = None
+            while winner is None:
+                waiters = {asyncio.ensure_future(p.first.wait()): p for p in pumps}
+                done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in pending:
+                    waiter.cancel()
+                for waiter in done:
+                    pump = waiters[waiter]
+                    if pump.failed_early() and len(pumps) > 1:
+                        pumps.remove(pump)
+                        continue
+                    winner = pump
+                    break
+            window.add(time.perf_counter() - started)
+            if winner is not pumps[0]:
+                self.counters["hedge_wins"] += 1
+                metrics.RESILIENCE_EVENTS.inc(agent=agent, event="hedge_win")
+            for pump in pumps:
+                if pump is not winner:
+                    await pump.cancel()
+            pumps = [winner]
+            async for item in winner.items():
+                yield item
+        finally:
+            for pump in pumps:
+                await pump.cancel()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "open_breakers": sum(1 for b in self.breakers.values() if b.state != "closed"),
+        }
@@ -0,0 +1,243 @@
+# router.py
+#
+# Cheap in-process intent classifier that runs before CommandCore. When a
+# message obviously belongs to one specialist (CommandCore's own DECISION
+# LOGIC table), the turn goes straight to that specialist and skips the two
+# CommandCore model calls (delegate + rephrase). Anything ambiguous, multi-need
+# or context-dependent still goes to CommandCore.
+
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from specialist_cache import tokenize
+
+FALLBACK = "CommandCore"
+
+# keyword table mirroring CommandCore's DECISION LOGIC
+RULES: dict[str, list[str]] = {
+    "PathMatch": [
+        r"\bwhat do i (really )?(like|enjoy)\b",
+        r"\b(my|true|real) passion\b",
+        r"\bpassionate about\b",
+        r"\bdon'?t know what (i want|to do|career)\b",
+        r"\bwhich (career|field|major) (suits|fits|is right for) me\b",
+    ],
+    "InfoScout": [
+        r"^\s*(tell me about|what is|what are|who is|explain)\b",
+        r"\b(research|look up|latest news on)\b",
+    ],
+    "Opportune": [
+        r"\b(internships?|scholarships?|hackathons?|competitions?|fellowships?)\b",
+        r"\b(find|show|any) (me )?(opportunit(y|ies)|jobs?)\b",
+    ],
+    "MistakeMonitor": [
+        r"\bi made an? (mistake|error)\b",
+        r"\b(traceback|syntaxerror|typeerror|valueerror|exception|stack trace)\b",
+        r"\b(my code|this code|the code) (doesn'?t|does not|won'?t) (work|run|compile)\b",
+        r"\bwhat (did i do|went) wrong\b",
+    ],
+    "MentalLift": [
+        r"\bi'?m (really |so |feeling )?(struggling|demotivated|overwhelmed|stressed|anxious|burn(ed|t) out|exhausted)\b",
+        r"\bfeel(ing)? (sad|down|lost|hopeless|overwhelmed|stressed|anxious|demotivated)\b",
+        r"\b(lost|no) motivation\b",
+    ],
+    "Evaluator": [
+        r"\bhow am i doing\b",
+        r"\b(my|track my) progress\b",
+        r"\b(\d+|six|three|twelve)[- ](month|week) (road ?map|plan)\b",
+        r"\broad ?map\b",
+    ],
+}
+
+# messages that lean on earlier turns need CommandCore's view of the conversation
+CONTEXT_DEPENDENT = re.compile(
+    r"\b(based on (that|this|what)|as (i|you) (said|mentioned)|like you said|from before|earlier you)\b"
+)
+
+# seed examples for the bag-of-words model (CommandCore = needs orchestration)
+SEED_EXAMPLES: dict[str, list[str]] = {
+    "PathMatch": [
+        "what do i like",
+        "help me find my passion",
+        "i don't know what career i want",
+        "am i really interested in computer science",
+        "which field suits me",
+        "discover my interests",
+    ],
+    "InfoScout": [
+        "tell me about transformers in machine learning",
+        "what is gradient descent",
+        "explain how neural networks learn",
+        "research the best resources for learning python",
+        "what are the requirements for studying ai abroad",
+        "latest news on large language models",
+    ],
+    "Opportune": [
+        "find me opportunities in ai",
+        "kaggle competitions for beginners",
+        "ai internships for class 11 students",
+        "scholarships for computer science students",
+        "hackathons i can join this month",
+        "summer research programs for high school",
+    ],
+    "MistakeMonitor": [
+        "i made a mistake in my code",
+        "my code throws a typeerror",
+        "why does this loop give the wrong answer",
+        "i got this traceback when running my script",
+        "i calculated the derivative wrong",
+        "what went wrong in my solution",
+    ],
+    "MentalLift": [
+        "i'm struggling and demotivated",
+        "i feel overwhelmed with everything",
+        "i'm so stressed about exams",
+        "i lost my motivation",
+        "i feel like giving up",
+        "i'm anxious about my interview",
+    ],
+    "Evaluator": [
+        "how am i doing",
+        "track my progress this month",
+        "create a 6 month roadmap for ai",
+        "evaluate my learning so far",
+        "make a study plan for the next three months",
+        "what should i focus on to improve",
+    ],
+    FALLBACK: [
+        "hi",
+        "hello there",
+        "i want to learn ai but don't know if it's right for me",
+        "i keep failing at coding interviews",
+        "help me with everything",
+        "thanks",
+        "can you help me",
+    ],
+}
+
+
+@dataclass
+class Route:
+    agent: Optional[str]      # specialist to answer directly, None = CommandCore
+    confidence: float
+    reason: str
+
+
+class BagOfWordsModel:
+    """Multinomial naive Bayes over hashed unigram/bigram counts, in NumPy."""
+
+    def __init__(self, examples: dict[str, list[str]], dims: int = 2048, alpha: float = 0.5):
+        self.labels = list(examples)
+        self.dims = dims
+        counts = np.full((len(self.labels), dims), alpha)
+        for i, label in enumerate(self.labels):
+            for text in examples[label]:
+                counts[i] += self.vectorize(text)
+        self.log_likelihood = np.log(counts / counts.sum(axis=1, keepdims=True))
+        self.log_prior = np.log(np.full(len(self.labels), 1.0 / len(self.labels)))
+
+    def features(self, text: str) -> list[str]:
+        tokens = tokenize(text)
+        return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def vectorize(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dims)
+        for feature in self.features(text):
+            # crc32 rather than hash(): str hashes are salted per process
+            vector[zlib.crc32(feature.encode()) % self.dims] += 1.0
+        return vector
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        vector = self.vectorize(text)
+        if not vector.any():
+            probs = np.zeros(len(self.labels))
+            probs[self.labels.index(FALLBACK)] = 1.0
+            return probs
+        scores = self.log_prior + self.log_likelihood @ vector
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+
+class PreRouter:
+    """
+    Decide whether a message can skip CommandCore.
+
+    A single matching keyword rule plus the bag-of-words model vote together;
+    the turn is routed directly only when the combined confidence reaches
+    `threshold`. Messages matching rules of several specialists, long
+    messages and messages referring to earlier turns always go to CommandCore.
+    `stats()` counts routed turns and the model round trips they saved:
+    `round_trips_saved` per routed turn, i.e. CommandCore's call that picks
+    the tool plus, unless pass-through already ends such turns with the
+    specialist's answer (A.COMMANDCORE_SYNTHESIS off), the call that
+    rephrases it.
+    """
+
+    def __init__(self, threshold: float = 0.75, max_words: int = 60, round_trips_saved: int = 2):
+        self.threshold = threshold
+        self.max_words = max_words
+        self.round_trips_saved = round_trips_saved
+        self.rules = {
+            agent: [re.compile(pattern) for pattern in patterns]
+            for agent, patterns in RULES.items()
+        }
+        self._model: Optional[BagOfWordsModel] = None
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {"routed": 0, "fallback": 0, "llm_round_trips_saved": 0}
+        self.routed_by_agent: dict[str, int] = {}
+
+    @property
+    def model(self) -> BagOfWordsModel:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = BagOfWordsModel(SEED_EXAMPLES)
+        return self._model
+
+    def classify(self, message: str) -> Route:
+        text = message.lower()
+        if len(text.split()) > self.max_words:
+            return Route(None, 0.0, "long message")
+        if CONTEXT_DEPENDENT.search(text):
+            return Route(None, 0.0, "refers to earlier turns")
+
+        rule_hits = [
+            agent for agent, patterns in self.rules.items()
+            if any(pattern.search(text) for pattern in patterns)
+        ]
+        if len(rule_hits) > 1:
+            return Route(None, 0.0, f"several intents: {', '.join(rule_hits)}")
+
+        model = self.model
+        scores = model.predict_proba(text)
+        if rule_hits:
+            onehot = np.zeros(len(model.labels))
+            onehot[model.labels.index(rule_hits[0])] = 1.0
+            scores = 0.5 * scores + 0.5 * onehot
+
+        best = int(scores.argmax())
+        label, confidence = model.labels[best], float(scores[best])
+        if label == FALLBACK:
+            return Route(None, confidence, "needs orchestration")
+        if confidence < self.threshold:
+            return Route(None, confidence, f"low confidence ({label})")
+        return Route(label, confidence, "rule+model" if rule_hits else "model")
+
+    def route(self, message: str) -> Route:
+        """classify() and count the outcome."""
+        route = self.classify(message)
+        if route.agent is None:
+            self.counters["fallback"] += 1
+        else:
+            self.counters["routed"] += 1
+            self.counters["llm_round_trips_saved"] += self.round_trips_saved
+            self.routed_by_agent[route.agent] = self.routed_by_agent.get(route.agent, 0) + 1
+        return route
+
+    def stats(self) -> dict:
+        return {**self.counters, "routed_by_agent": dict(self.routed_by_agent)}
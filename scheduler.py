@@ -0,0 +1,304 @@
+# scheduler.py
+#
+# Admission control for model calls. Every agent the registry builds gets its
+# model wrapped by `scheduled_model`, so each Gemini request - CommandCore's
+# and every specialist's - first waits for a slot here. Slots are limited by
+# a concurrency cap and a global token bucket; waiting calls are served
+# interactive-first and round-robin across users, so one busy user can't
+# starve the others. When the queues are full the call fails fast with
+# SchedulerBusy, which main.py turns into HTTP 429 + Retry-After.
+#
+# Model calls are gated rather than whole Runner.run_async calls: a
+# CommandCore turn waits on its own specialists, so holding a slot for the
+# whole turn would deadlock once every slot belonged to a CommandCore run.
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Optional
+
+import metrics
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# (user_id, priority) of the request currently being served
+_request: contextvars.ContextVar[tuple[str, int]] = contextvars.ContextVar(
+    "pde_scheduler_request", default=("anonymous", INTERACTIVE)
+)
+
+
+class SchedulerBusy(Exception):
+    """The queues are full; try again in `retry_after` seconds."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"model queue full ({reason}), retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ModelScheduler:
+    """
+    Fair, rate-limited gate in front of model calls.
+
+    `max_in_flight` caps concurrent calls and `rate`/`burst` is the token
+    bucket (rate <= 0 disables it). Up to `max_queue` calls may wait in
+    total and `max_queue_per_user` per user; beyond that, or when the
+    estimated wait exceeds `max_wait` seconds, callers get SchedulerBusy.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        rate: float = 5.0,
+        burst: Optional[float] = None,
+        max_queue: int = 256,
+        max_queue_per_user: int = 16,
+        max_wait: float = 30.0,
+    ):
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst if burst is not None else max(1.0, rate * 2))
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        # priority -> user -> waiting futures; users rotate for round-robin
+        self._queues: dict[int, "OrderedDict[str, deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self._queued = 0
+        self._queued_by_user: dict[str, int] = {}
+        self.in_flight = 0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        # moving average of how long a call holds its slot, for Retry-After
+        self._hold_seconds = 1.0
+        self.counters = {"granted": 0, "rejected": 0, "cancelled_waiting": 0}
+
+    @contextlib.contextmanager
+    def context(self, user_id: str, priority: int = INTERACTIVE):
+        """Attribute model calls made inside this block to `user_id` at `priority`."""
+        token = _request.set((user_id, priority))
+        try:
+            yield
+        finally:
+            with contextlib.suppress(ValueError):
+                _request.reset(token)
+
+    def estimated_wait(self) -> float:
+        waiting = self._queued + max(0, self.in_flight + 1 - self.max_in_flight)
+        by_concurrency = waiting / self.max_in_flight * self._hold_seconds
+        by_rate = waiting / self.bucket.rate if self.bucket.rate > 0 else 0.0
+        return max(by_concurrency, by_rate)
+
+    def has_capacity(self) -> bool:
+        """Could a call start right now without queueing?"""
+        return self.in_flight < self.max_in_flight and not self._queued
+
+    def admit(self, user_id: str) -> None:
+        """Raise SchedulerBusy if a new call from `user_id` would be rejected."""
+        if self._queued >= self.max_queue:
+            self._reject("queue_full")
+        if self._queued_by_user.get(user_id, 0) >= self.max_queue_per_user:
+            self._reject("user_queue_full")
+        if self.estimated_wait() > self.max_wait:
+            self._reject("wait_too_long")
+
+    def _reject(self, reason: str):
+        self.counters["rejected"] += 1
+        metrics.SCHEDULER_REJECTED.inc(reason=reason)
+        raise SchedulerBusy(max(1, math.ceil(self.estimated_wait())), reason)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, agent: str = ""):
+        """Wait for permission to make one model call, hold it for the block."""
+        user_id, priority = _request.get()
+        started = time.perf_counter()
+        if self.in_flight >= self.max_in_flight or self._queued or self.bucket.take() > 0:
+            await self._wait(user_id, priority)
+        else:
+            self.in_flight += 1
+        self.counters["granted"] += 1
+        metrics.SCHEDULER_WAIT_SECONDS.observe(
+            time.perf_counter() - started, priority=PRIORITY_NAMES[priority], agent=agent
+        )
+
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.perf_counter() - held)
+            self.in_flight -= 1
+            self._dispatch()
+
+    async def _wait(self, user_id: str, priority: int) -> None:
+        self.admit(user_id)
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_id, deque()).append(future)
+        self._queued += 1
+        self._queued_by_user[user_id] = self._queued_by_user.get(user_id, 0) + 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just as we were cancelled: hand the slot back
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                self._remove(user_id, priority, future)
+                self.counters["cancelled_waiting"] += 1
+            raise
+
+    def _remove(self, user_id: str, priority: int, future: asyncio.Future) -> None:
+        users = self._queues[priority]
+        waiting = users.get(user_id)
+        if waiting is None or future not in waiting:
+            return
+        waiting.remove(future)
+        if not waiting:
+            del users[user_id]
+        self._dequeued(user_id)
+
+    def _dequeued(self, user_id: str) -> None:
+        self._queued -= 1
+        remaining = self._queued_by_user[user_id] - 1
+        if remaining:
+            self._queued_by_user[user_id] = remaining
+        else:
+            del self._queued_by_user[user_id]
+
+    def _dispatch(self) -> None:
+        while self._queued and self.in_flight < self.max_in_flight:
+            delay = self.bucket.take()
+            if delay > 0:
+                if self._wakeup is None:
+                    self._wakeup = asyncio.get_running_loop().call_later(delay, self._wake)
+                return
+            future = self._next_waiter()
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _wake(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def _next_waiter(self) -> asyncio.Future:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_id, waiting = next(iter(users.items()))
+            future = waiting.popleft()
+            if waiting:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            self._dequeued(user_id)
+            return future
+        raise RuntimeError("dispatch with empty queues")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self._queued,
+            **{
+                f"queued_{name}": sum(len(w) for w in self._queues[priority].values())
+                for priority, name in PRIORITY_NAMES.items()
+            },
+            "queued_users": len(self._queued_by_user),
+            "tokens": self.bucket.tokens if self.bucket.rate > 0 else 0.0,
+            "estimated_wait_seconds": self.estimated_wait(),
+        }
+
+
+_scheduled_model_class = None
+
+
+def scheduled_model(inner, scheduler: ModelScheduler, agent: str, resilience=None, prefix_cache=None, usage=None):
+    """
+    Wrap a BaseLlm so each generate_content_async call goes through `scheduler`
+    (and, if given, resilience.Resilience: breaker, retries, hedging;
+    prefix_cache.PrefixCache: cached instructions instead of plain prompts;
+    and usage.UsageLedger: no call once the turn's token budget is spent).
+    """
+    global _scheduled_model_class
+    if _scheduled_model_class is None:
+        from google.adk.models.base_llm import BaseLlm
+
+        class ScheduledLlm(BaseLlm):
+            inner: Any
+            scheduler: Any
+            resilience: Any = None
+            prefix_cache: Any = None
+            usage: Any = None
+            agent: str = ""
+
+            async def _call(self, llm_request, stream):
+                request = llm_request
+                if self.prefix_cache is not None:
+                    request = self.prefix_cache.prepare(self.agent, self.inner, llm_request)
+                async with self.scheduler.slot(self.agent):
+                    yielded = False
+                    try:
+                        async for response in self.inner.generate_content_async(request, stream):
+                            yielded = True
+                            yield response
+                        return
+                    except Exception:
+                        if request is llm_request or yielded:
+                            raise
+                        # the cached prefix may be gone: drop it, send the plain prompt once
+                        self.prefix_cache.invalidate(self.agent)
+                    async for response in self.inner.generate_content_async(llm_request, stream):
+                        yield response
+
+            async def generate_content_async(self, llm_request, stream: bool = False):
+                if self.usage is not None:
+                    await self.usage.check()
+                if self.resilience is None:
+                    responses = self._call(llm_request, stream)
+                else:
+                    responses = self.resilience.stream(self.agent, lambda: self._call(llm_request, stream))
+                async with contextlib.aclosing(responses):
+                    async for response in responses:
+                        yield response
+
+            def connect(self, llm_request):
+                return self.inner.connect(llm_request)
+
+        _scheduled_model_class = ScheduledLlm
+
+    return _scheduled_model_class(
+        model=inner.model,
+        inner=inner,
+        scheduler=scheduler,
+        resilience=resilience,
+        prefix_cache=prefix_cache,
+        usage=usage,
+        agent=agent,
+    )
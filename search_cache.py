@@ -0,0 +1,153 @@
+# search_cache.py
+#
+# TTL + LRU cache with single-flight coalescing in front of web searches (the
+# `google_search` tool the specialists call, see A.py). Queries are
+# normalised first, so "Python internships 2025?" and "python  internship
+# 2025" share one entry; concurrent identical queries share one in-flight
+# search instead of each running their own.
+
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import metrics
+
+# words that change how a request is phrased, not what is searched for
+FILLER_WORDS = {"please", "search", "google", "look", "up", "find", "me", "for", "the", "a", "an", "about"}
+
+_TOKEN = re.compile(r"[a-z0-9+#.]+")
+
+
+def normalize_query(query: str) -> str:
+    words = []
+    for word in _TOKEN.findall(query.lower()):
+        word = word.strip(".")
+        if not word or word in FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words) or query.strip().lower()
+
+
+class SearchCache:
+    """
+    Cache `fetch(query)` results by normalised query.
+
+    Entries live `ttl` seconds and at most `max_entries` are kept (least
+    recently used go first). Failed fetches are not cached, but every caller
+    waiting on that fetch sees the error. A fetch runs in a task of its own,
+    so it isn't cancelled with the turn that started it: the others waiting
+    on it still get the result, and it is cached. Once the last waiter is
+    gone, though, nobody wants the result and the fetch is cancelled.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Any]],
+        ttl: float = 1800.0,
+        max_entries: int = 2048,
+    ):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[Any, float, float]]" = OrderedDict()  # key -> (result, expires_at, latency)
+        self._in_flight: dict[str, tuple[asyncio.Task, float]] = {}  # key -> (fetch task, started)
+        self._waiters: dict[asyncio.Task, int] = {}  # fetch task -> callers awaiting it
+        self.counters = {
+            "hits": 0, "coalesced": 0, "misses": 0, "errors": 0, "abandoned": 0, "saved_seconds": 0.0,
+        }
+
+    def _lookup(self, key: str) -> Optional[tuple[Any, float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, expires_at, latency = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result, latency
+
+    async def search(self, query: str) -> Any:
+        key = normalize_query(query)
+        cached = self._lookup(key)
+        if cached is not None:
+            result, latency = cached
+            self._count("hit", latency)
+            return result
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            task, search_started = pending
+            joined = time.perf_counter()
+            result = await self._join(key, task)
+            # a search of its own would have taken as long as the shared one,
+            # but started when we joined rather than when it did
+            self._count("coalesced", joined - search_started)
+            return result
+
+        started = time.perf_counter()
+        task = asyncio.create_task(self._fetch(key, query, started))
+        # mark a failure retrieved when every waiter has gone
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._in_flight[key] = (task, started)
+        self.counters["misses"] += 1
+        metrics.SEARCH_LOOKUPS.inc(outcome="miss")
+        return await self._join(key, task)
+
+    async def _join(self, key: str, task: asyncio.Task) -> Any:
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # shield: one impatient waiter must not cancel everybody's search
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # nobody is left to use the result: stop paying for it, and
+                    # let the next search for this key start a fresh fetch
+                    self.counters["abandoned"] += 1
+                    self._forget(key, task)
+                    task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key, (None,))[0] is task:
+            del self._in_flight[key]
+
+    async def _fetch(self, key: str, query: str, started: float) -> Any:
+        try:
+            result = await self.fetch(query)
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        finally:
+            self._forget(key, asyncio.current_task())
+
+        latency = time.perf_counter() - started
+        self._entries[key] = (result, time.monotonic() + self.ttl, latency)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return result
+
+    def _count(self, outcome: str, saved: float) -> None:
+        self.counters["hits" if outcome == "hit" else outcome] += 1
+        self.counters["saved_seconds"] += saved
+        metrics.SEARCH_LOOKUPS.inc(outcome=outcome)
+        metrics.SEARCH_SAVED_SECONDS.inc(saved)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["coalesced"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hit_rate": (self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,773 @@
+# session_store.py
+#
+# Session service backends for the runners in A.py. Only imported when the
+# registry first builds its session service, so importing google.adk here is
+# fine (it never runs at worker startup).
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session, State
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.genai import types
+
+SessionKey = tuple[str, str, str]  # (app_name, user_id, session_id)
+
+
+SUMMARY_MARKER = "[Summary of earlier conversation]"
+
+
+def summarize_events(events: list[Event], max_chars: int = 1500) -> str:
+    """
+    Cheap extractive summary: one clipped line of text per dropped event.
+
+    A previous summary at the start of `events` is carried over line by line,
+    and when everything doesn't fit the most recent lines win.
+    """
+    lines: list[str] = []
+    for event in events:
+        if not (event.content and event.content.parts):
+            continue
+        text = " ".join(part.text for part in event.content.parts if part.text).strip()
+        if not text:
+            continue
+        if text.startswith(SUMMARY_MARKER):
+            lines.extend(line for line in text[len(SUMMARY_MARKER):].splitlines() if line.strip())
+            continue
+        lines.append(f"{event.author}: {' '.join(text.split())[:200]}")
+
+    kept: list[str] = []
+    used = 0
+    for line in reversed(lines):
+        if used + len(line) > max_chars:
+            kept.append("...")
+            break
+        kept.append(line)
+        used += len(line)
+    return "\n".join(reversed(kept))
+
+
+class EventListeners:
+    """
+    Mixin letting other components follow a session service's events.
+
+    Each callable in `event_listeners` is called with (session, event) for
+    every non-partial event the service appends - e.g.
+    memory_ingest.MemoryIngestor.observe. Listeners run on the request path,
+    so they must be quick and must not raise.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event_listeners: list[Callable[[Session, Event], None]] = []
+
+    def _notify(self, session: Session, event: Event) -> None:
+        for listener in self.event_listeners:
+            listener(session, event)
+
+
+class SessionHandleCache:
+    """
+    Mixin giving a session service one atomic `get_or_create_session()`.
+
+    Known sessions are remembered in a per-process LRU of handles, so a
+    returning user costs a dict lookup instead of a failed create plus a
+    get. Concurrent calls for the same id share one in-flight lookup, which
+    runs in a task of its own so that cancelling the caller who started it
+    doesn't fail the others. The services call `_forget_handle()` whenever
+    a session goes away.
+
+    A handle is for addressing the session (id, user, app) - use get_session
+    for its current events and state.
+    """
+
+    max_handles = 50_000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._handles: "OrderedDict[SessionKey, Session]" = OrderedDict()
+        self._handle_flights: dict[SessionKey, asyncio.Task] = {}
+        self.handle_counters = {"hits": 0, "misses": 0, "created": 0}
+
+    def _remember_handle(self, key: SessionKey, session: Session) -> None:
+        self._handles[key] = session
+        self._handles.move_to_end(key)
+        while len(self._handles) > self.max_handles:
+            self._handles.popitem(last=False)
+
+    def _forget_handle(self, key: SessionKey) -> None:
+        self._handles.pop(key, None)
+
+    def _handle_valid(self, key: SessionKey) -> bool:
+        """Whether a cached handle may be returned without asking the store."""
+        return True
+
+    async def get_or_create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        state: Optional[dict[str, Any]] = None,
+    ) -> Session:
+        key = (app_name, user_id, session_id)
+        handle = self._handles.get(key)
+        if handle is not None and self._handle_valid(key):
+            self._handles.move_to_end(key)
+            self.handle_counters["hits"] += 1
+            return handle
+
+        flight = self._handle_flights.get(key)
+        if flight is None:
+            self.handle_counters["misses"] += 1
+            flight = asyncio.create_task(self._get_or_create(key, state))
+            # mark a failure retrieved when every caller has gone
+            flight.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._handle_flights[key] = flight
+        # shield: a cancelled caller must not cancel the lookup the others wait on
+        return await asyncio.shield(flight)
+
+    async def _get_or_create(self, key: SessionKey, state: Optional[dict[str, Any]]) -> Session:
+        app_name, user_id, session_id = key
+        try:
+            session = await self.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            if session is None:
+                try:
+                    session = await self.create_session(
+                        app_name=app_name, user_id=user_id, state=state, session_id=session_id
+                    )
+                    self.handle_counters["created"] += 1
+                except AlreadyExistsError:
+                    # another process sharing the store created it first
+                    session = await self.get_session(
+                        app_name=app_name, user_id=user_id, session_id=session_id
+                    )
+            self._remember_handle(key, session)
+            return session
+        finally:
+            self._handle_flights.pop(key, None)
+
+
+class BoundedSessionService(EventListeners, SessionHandleCache, InMemorySessionService):
+    """
+    InMemorySessionService with a bounded footprint.
+
+    - at most `max_sessions` sessions are kept; the least recently used one is
+      evicted when a new session would exceed that
+    - sessions idle for longer than `ttl_seconds` expire (swept lazily on
+      create/list and checked on get)
+    - a session never holds more than `max_events` events: once it grows past
+      that, the oldest whole turns are dropped and replaced by a single
+      summary event (see `summarize`, pass None to just truncate)
+
+    `stats()` reports session/event counts, an estimate of the bytes held and
+    eviction counters.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10_000,
+        ttl_seconds: float = 6 * 3600,
+        max_events: int = 200,
+        summarize: Optional[Callable[[list[Event]], str]] = summarize_events,
+    ):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self.summarize = summarize
+
+        # key -> last access (monotonic), least recently used first
+        self._lru: "OrderedDict[SessionKey, float]" = OrderedDict()
+        # key -> approximate serialized size of the stored events
+        self._bytes: dict[SessionKey, int] = {}
+        self.counters = {
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "truncations": 0,
+            "events_dropped": 0,
+        }
+
+    # -- bookkeeping ---------------------------------------------------------
+
+    def _touch(self, key: SessionKey) -> None:
+        self._lru[key] = time.monotonic()
+        self._lru.move_to_end(key)
+
+    def _forget(self, key: SessionKey) -> None:
+        self._lru.pop(key, None)
+        self._bytes.pop(key, None)
+
+    def _drop(self, key: SessionKey) -> None:
+        app_name, user_id, session_id = key
+        user_sessions = self.sessions.get(app_name, {})
+        user_sessions.get(user_id, {}).pop(session_id, None)
+        if user_id in user_sessions and not user_sessions[user_id]:
+            del user_sessions[user_id]
+        self._forget(key)
+        self._forget_handle(key)
+
+    def _is_expired(self, key: SessionKey, now: float) -> bool:
+        last_access = self._lru.get(key)
+        return last_access is not None and now - last_access > self.ttl_seconds
+
+    def _handle_valid(self, key: SessionKey) -> bool:
+        # an expired session is dropped by the get_session that follows
+        if key not in self._lru or self._is_expired(key, time.monotonic()):
+            return False
+        self._touch(key)
+        return True
+
+    def sweep(self) -> int:
+        """Evict every expired session; returns how many were dropped."""
+        now = time.monotonic()
+        dropped = 0
+        while self._lru:
+            key, last_access = next(iter(self._lru.items()))
+            if now - last_access <= self.ttl_seconds:
+                break
+            self._drop(key)
+            self.counters["evicted_ttl"] += 1
+            dropped += 1
+        return dropped
+
+    def _enforce_capacity(self) -> None:
+        while len(self._lru) > self.max_sessions:
+            key = next(iter(self._lru))
+            self._drop(key)
+            self.counters["evicted_lru"] += 1
+
+    @staticmethod
+    def _event_size(event: Event) -> int:
+        return len(event.model_dump_json(exclude_none=True))
+
+    def _truncate(self, key: SessionKey, session: Session) -> None:
+        events = session.events
+        excess = len(events) - self.max_events
+        if excess <= 0:
+            return
+
+        # only cut at the start of a user turn, so a function call is never
+        # separated from its response
+        cut = next(
+            (i for i in range(excess, len(events)) if events[i].author == "user"),
+            None,
+        )
+        if cut is None:
+            return
+
+        dropped, kept = events[:cut], events[cut:]
+        summary = self.summarize(dropped) if self.summarize else ""
+        if summary:
+            kept.insert(0, Event(
+                author="user",
+                invocation_id=dropped[-1].invocation_id,
+                timestamp=dropped[-1].timestamp,
+                content=types.Content(
+                    role="user",
+                    parts=[types.Part(text=f"{SUMMARY_MARKER}\n{summary}")],
+                ),
+            ))
+        session.events = kept
+
+        self._bytes[key] = sum(self._event_size(event) for event in kept)
+        self.counters["truncations"] += 1
+        self.counters["events_dropped"] += len(dropped)
+
+    def stats(self) -> dict[str, Any]:
+        events = sum(
+            len(session.events)
+            for users in self.sessions.values()
+            for sessions in users.values()
+            for session in sessions.values()
+        )
+        return {
+            "sessions": len(self._lru),
+            "events": events,
+            "approx_bytes": sum(self._bytes.values()),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "max_events": self.max_events,
+            "handles": len(self._handles),
+            **self.counters,
+            **{f"handle_{k}": v for k, v in self.handle_counters.items()},
+        }
+
+    # -- BaseSessionService --------------------------------------------------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        self.sweep()
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        key = (app_name, user_id, session.id)
+        self._touch(key)
+        self._bytes[key] = 0
+        self._enforce_capacity()
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        if self._is_expired(key, time.monotonic()):
+            self._drop(key)
+            self.counters["evicted_ttl"] += 1
+            return None
+        session = await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._touch(key)
+        return session
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        self.sweep()
+        return await super().list_sessions(app_name=app_name, user_id=user_id)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._forget((app_name, user_id, session_id))
+        self._forget_handle((app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+
+        key = (session.app_name, session.user_id, session.id)
+        stored = self.sessions.get(session.app_name, {}).get(session.user_id, {}).get(session.id)
+        if stored is None:
+            return event
+
+        self._touch(key)
+        self._bytes[key] = self._bytes.get(key, 0) + self._event_size(event)
+        self._notify(session, event)
+        if len(stored.events) > self.max_events:
+            self._truncate(key, stored)
+        return event
+
+
+# ---------------------------------------------------------------------------
+# Durable backend: SQLite (WAL) with a write-behind queue
+# ---------------------------------------------------------------------------
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name    TEXT NOT NULL,
+    user_id     TEXT NOT NULL,
+    id          TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT '{}',
+    update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name   TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    timestamp  REAL NOT NULL,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (app_name, user_id, session_id, seq);
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id  TEXT NOT NULL,
+    state    TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+
+
+def split_state(state: Optional[dict[str, Any]]) -> tuple[dict, dict, dict]:
+    """Split a state dict into (app, user, session) parts; temp: keys are dropped."""
+    app, user, session = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user[key[len(State.USER_PREFIX):]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session[key] = value
+    return app, user, session
+
+
+class SqliteSessionService(EventListeners, SessionHandleCache, BaseSessionService):
+    """
+    Session service persisted in a local SQLite database (WAL mode).
+
+    Sessions survive restarts and can be read by every uvicorn worker on the
+    box. Writes from `append_event` (and create/delete) are put on an async
+    queue and committed by a single background writer in batches of up to
+    `batch_size`, so the request path never waits on the disk. Reads of a
+    session that still has queued writes wait for those writes first, so a
+    process always sees its own changes.
+
+    Each write in a batch runs in its own savepoint, so one failing write
+    doesn't take the rest of the batch with it. A create reports its own
+    outcome; a failed event write is raised by the next read, append or
+    flush of that session.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = "sessions.db",
+        batch_size: int = 256,
+        queue_size: int = 10_000,
+    ):
+        super().__init__()
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._writer_conn = self._connect()
+        self._writer_conn.executescript(SQLITE_SCHEMA)
+        self._local = threading.local()
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._drained: Optional[asyncio.Condition] = None
+        # key -> writes queued but not committed yet
+        self._pending: dict[tuple[str, str, str], int] = {}
+        # key -> the error of a write nobody has been told about yet
+        self._failed: dict[tuple[str, str, str], BaseException] = {}
+        self.counters = {"batches": 0, "writes": 0, "write_errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # one read connection per executor thread; WAL readers don't block the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._drained = asyncio.Condition()
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _enqueue(self, key: tuple[str, str, str], op: tuple) -> asyncio.Future:
+        """Queue one write; the returned future gets its result once it is committed."""
+        self._ensure_writer()
+        self._pending[key] = self._pending.get(key, 0) + 1
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, op, done))
+        return done
+
+    async def _wait_for_writes(self, key: tuple[str, str, str]) -> None:
+        if self._pending.get(key):
+            async with self._drained:
+                await self._drained.wait_for(lambda: not self._pending.get(key))
+        error = self._failed.pop(key, None)
+        if error is not None:
+            raise error
+
+    async def flush_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        """Wait until the session's queued writes are committed (visible to other processes)."""
+        await self._wait_for_writes((app_name, user_id, session_id))
+
+    async def flush(self) -> None:
+        """Wait until every queued write has been committed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+
+    # -- writer --------------------------------------------------------------
+
+    async def _write_loop(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                try:
+                    results = await asyncio.to_thread(self._commit, [op for _, op, _ in batch])
+                    self.counters["batches"] += 1
+                except Exception as e:
+                    # the transaction itself failed (e.g. the database stayed locked)
+                    results = [e] * len(batch)
+                finally:
+                    for key, _, _ in batch:
+                        self._pending[key] -= 1
+                        if not self._pending[key]:
+                            del self._pending[key]
+                        self._queue.task_done()
+                for (key, _, done), result in zip(batch, results):
+                    failed = isinstance(result, Exception)
+                    self.counters["write_errors" if failed else "writes"] += 1
+                    if failed:
+                        # the session's next read raises it, whether or not anybody awaits `done`
+                        self._failed[key] = result
+                    if done.done():
+                        # the caller was cancelled while it waited
+                        continue
+                    if failed:
+                        done.set_exception(result)
+                        done.exception()
+                    else:
+                        done.set_result(result)
+            finally:
+                # always, or flush()/get_session() waiters would hang
+                async with self._drained:
+                    self._drained.notify_all()
+
+    def _commit(self, ops: list[tuple]) -> list[Any]:
+        """Apply `ops` in one transaction, each in its own savepoint; returns each op's result or error."""
+        conn = self._writer_conn
+        results: list[Any] = []
+        conn.execute("BEGIN")
+        try:
+            for op in ops:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append(getattr(self, f"_apply_{op[0]}")(conn, *op[1:]))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    results.append(e)
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    @staticmethod
+    def _merge_json(conn, table: str, where: str, params: tuple, delta: dict) -> None:
+        if not delta:
+            return
+        row = conn.execute(f"SELECT state FROM {table} WHERE {where}", params).fetchone()
+        state = json.loads(row[0]) if row else {}
+        state.update(delta)
+        if row:
+            conn.execute(f"UPDATE {table} SET state = ? WHERE {where}", (json.dumps(state), *params))
+        else:
+            columns = "app_name" if table == "app_states" else "app_name, user_id"
+            marks = ", ".join("?" for _ in params)
+            conn.execute(
+                f"INSERT INTO {table} ({columns}, state) VALUES ({marks}, ?)",
+                (*params, json.dumps(state)),
+            )
+
+    def _apply_create(self, conn, key, state, app_delta, user_delta, now) -> bool:
+        """Insert the session unless it exists (maybe created by another process); True if inserted."""
+        app_name, user_id, session_id = key
+        inserted = conn.execute(
+            "INSERT INTO sessions (app_name, user_id, id, state, update_time) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (app_name, user_id, id) DO NOTHING",
+            (app_name, user_id, session_id, json.dumps(state), now),
+        ).rowcount == 1
+        if inserted:
+            self._merge_json(conn, "app_states", "app_name = ?", (app_name,), app_delta)
+            self._merge_json(conn, "user_states", "app_name = ? AND user_id = ?", (app_name, user_id), user_delta)
+        return inserted
+
+    def _apply_event(self, conn, key, data, timestamp, app_delta, user_delta, session_delta) -> None:
+        app_name, user_id, session_id = key
+        conn.execute(
+            "INSERT INTO events (app_name, user_id, session_id, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+            (app_name, user_id, session_id, timestamp, data),
+        )
+        conn.execute(
+            "UPDATE sessions SET update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+            (timestamp, app_name, user_id, session_id),
+        )
+        self._merge_json(conn, "sessions", "app_name = ? AND user_id = ? AND id = ?", key, session_delta)
+        self._merge_json(conn, "app_states", "app_name = ?", (app_name,), app_delta)
+        self._merge_json(conn, "user_states", "app_name = ? AND user_id = ?", (app_name, user_id), user_delta)
+
+    def _apply_delete(self, conn, key) -> None:
+        conn.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+        conn.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key)
+
+    # -- reads ---------------------------------------------------------------
+
+    def _merged_state(self, conn, app_name: str, user_id: str, state: dict) -> dict:
+        row = conn.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        for k, v in (json.loads(row[0]) if row else {}).items():
+            state[State.APP_PREFIX + k] = v
+        row = conn.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        for k, v in (json.loads(row[0]) if row else {}).items():
+            state[State.USER_PREFIX + k] = v
+        return state
+
+    def _load_session(self, app_name, user_id, session_id, config) -> Optional[Session]:
+        conn = self._reader()
+        row = conn.execute(
+            "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        ).fetchone()
+        if row is None:
+            return None
+
+        where = "app_name = ? AND user_id = ? AND session_id = ?"
+        params: list[Any] = [app_name, user_id, session_id]
+        if config and config.after_timestamp:
+            where += " AND timestamp >= ?"
+            params.append(config.after_timestamp)
+        if config and config.num_recent_events:
+            query = (
+                f"SELECT data FROM (SELECT seq, data FROM events WHERE {where} "
+                "ORDER BY seq DESC LIMIT ?) ORDER BY seq"
+            )
+            params.append(config.num_recent_events)
+        else:
+            query = f"SELECT data FROM events WHERE {where} ORDER BY seq"
+        events = [Event.model_validate_json(data) for (data,) in conn.execute(query, params)]
+
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=self._merged_state(conn, app_name, user_id, json.loads(row[0])),
+            events=events,
+            last_update_time=row[1],
+        )
+
+    def _list_sessions(self, app_name, user_id) -> list[Session]:
+        conn = self._reader()
+        query = "SELECT user_id, id, state, update_time FROM sessions WHERE app_name = ?"
+        params: list[Any] = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        return [
+            Session(
+                app_name=app_name,
+                user_id=uid,
+                id=sid,
+                state=self._merged_state(conn, app_name, uid, json.loads(state)),
+                last_update_time=update_time,
+            )
+            for uid, sid, state, update_time in conn.execute(query, params).fetchall()
+        ]
+
+    # -- BaseSessionService --------------------------------------------------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        self._ensure_writer()
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        key = (app_name, user_id, session_id)
+        app_delta, user_delta, session_state = split_state(state)
+        now = time.time()
+
+        # the writer decides: whichever create (of any process) commits first wins
+        done = await self._enqueue(key, ("create", key, session_state, app_delta, user_delta, now))
+        try:
+            inserted = await done
+        finally:
+            self._failed.pop(key, None)  # reported right here
+        if not inserted:
+            raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+        return await self.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        await self._wait_for_writes((app_name, user_id, session_id))
+        return await asyncio.to_thread(self._load_session, app_name, user_id, session_id, config)
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        return ListSessionsResponse(
+            sessions=await asyncio.to_thread(self._list_sessions, app_name, user_id)
+        )
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        self._forget_handle(key)
+        await self._enqueue(key, ("delete", key))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        key = (session.app_name, session.user_id, session.id)
+        error = self._failed.pop(key, None)
+        if error is not None:
+            # an earlier write of this session never made it to disk
+            raise error
+        event = await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        delta = event.actions.state_delta if event.actions else None
+        app_delta, user_delta, session_delta = split_state(delta)
+        await self._enqueue(key, (
+            "event",
+            key,
+            event.model_dump_json(exclude_none=True),
+            event.timestamp,
+            app_delta,
+            user_delta,
+            session_delta,
+        ))
+        self._notify(session, event)
+        return event
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "pending_sessions": len(self._pending),
+            "handles": len(self._handles),
+            **self.counters,
+            **{f"handle_{k}": v for k, v in self.handle_counters.items()},
+        }
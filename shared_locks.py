@@ -0,0 +1,159 @@
+# shared_locks.py
+#
+# Per-session locks for multi-worker deployments (uvicorn --workers N, see
+# PDE_SHARED_STATE in A.py). A.SessionLocks only serialises turns inside one
+# process; with several workers reading and writing the same SQLite session
+# store, two requests for one conversation landing on different workers would
+# interleave their events. These locks also exclude the other processes.
+#
+# Keys hash onto a fixed set of lock files locked with flock(2): nothing to
+# clean up, and the kernel drops a crashed worker's locks with its file
+# descriptors. Waiting is a non-blocking poll with backoff, so the event loop
+# never blocks on the lock.
+#
+# A turn holds at most one lock file: a specialist's sub-session, locked
+# inside its CommandCore turn, uses the parent session's file. Two workers
+# can't each hold one file while waiting for the other's.
+#
+# Only the sessions are shared. The model scheduler (PDE_MAX_MODEL_CALLS,
+# PDE_MODEL_RPS), the circuit breakers and the specialist, search and prefix
+# caches are still per process, so N workers may make N times as many model
+# calls per second: divide those limits by the worker count to stay inside
+# the model quota.
+
+import asyncio
+import fcntl
+import os
+import time
+import weakref
+import zlib
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+
+class SharedSessionLocks:
+    """
+    One lock per (user_id, session_id), shared by every process using
+    `directory`.
+
+    Within a process each key has its own asyncio.Lock. Across processes
+    the key maps to one of `stripes` lock files. While any of this process's
+    turns holds a key of a stripe, the process keeps that stripe's flock.
+    A key locked inside the turn of a `parent` session (a specialist
+    sub-session inside a CommandCore turn) maps to the parent's stripe,
+    which the process already holds: it never waits on another process.
+    `on_release(user_id, session_id)` runs before a lock is given up - e.g.
+    to commit queued session writes so the next worker reads them. Waiting
+    longer than `timeout` seconds for another process raises TimeoutError.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        stripes: int = 4096,
+        poll: float = 0.005,
+        max_poll: float = 0.1,
+        timeout: Optional[float] = 120.0,
+        on_release: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ):
+        self.directory = Path(directory)   # created with the first lock file
+        self.stripes = stripes
+        self.poll = poll
+        self.max_poll = max_poll
+        self.timeout = timeout
+        self.on_release = on_release
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._stripe_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._held: dict[int, int] = {}     # stripe -> keys of it held in this process
+        self._fds: dict[int, int] = {}
+        self.counters = {"acquired": 0, "contended": 0, "wait_seconds": 0.0, "timeouts": 0}
+
+    def get(self, user_id: str, session_id: str, parent: Optional[str] = None) -> "_SharedLock":
+        key = (user_id, session_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        stripe = zlib.crc32(f"{user_id}\x00{parent or session_id}".encode()) % self.stripes
+        return _SharedLock(self, lock, stripe, user_id, session_id)
+
+    async def _acquire_stripe(self, stripe: int) -> None:
+        if self._held.get(stripe):
+            self._held[stripe] += 1
+            return
+        gate = self._stripe_locks.get(stripe)
+        if gate is None:
+            gate = self._stripe_locks[stripe] = asyncio.Lock()
+        async with gate:
+            if self._held.get(stripe):
+                self._held[stripe] += 1
+                return
+            path = self.directory / f"{stripe:04x}.lock"
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            except FileNotFoundError:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            started = time.monotonic()
+            delay = self.poll
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        pass
+                    if delay == self.poll:
+                        self.counters["contended"] += 1
+                    if self.timeout is not None and time.monotonic() - started > self.timeout:
+                        self.counters["timeouts"] += 1
+                        raise TimeoutError(f"session lock busy for over {self.timeout:g}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_poll)
+            except BaseException:
+                os.close(fd)
+                raise
+            self.counters["acquired"] += 1
+            self.counters["wait_seconds"] += time.monotonic() - started
+            self._fds[stripe] = fd
+            self._held[stripe] = 1
+
+    def _release_stripe(self, stripe: int) -> None:
+        self._held[stripe] -= 1
+        if self._held[stripe]:
+            return
+        del self._held[stripe]
+        fd = self._fds.pop(stripe)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def stats(self) -> dict:
+        return {**self.counters, "held_stripes": len(self._held)}
+
+
+class _SharedLock:
+    def __init__(self, owner: SharedSessionLocks, lock: asyncio.Lock, stripe: int, user_id: str, session_id: str):
+        self.owner = owner
+        self.lock = lock
+        self.stripe = stripe
+        self.user_id = user_id
+        self.session_id = session_id
+
+    async def __aenter__(self):
+        await self.lock.acquire()
+        try:
+            await self.owner._acquire_stripe(self.stripe)
+        except BaseException:
+            self.lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            if self.owner.on_release is not None:
+                await self.owner.on_release(self.user_id, self.session_id)
+        finally:
+            self.owner._release_stripe(self.stripe)
+            self.lock.release()
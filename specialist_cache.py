@@ -0,0 +1,224 @@
+# specialist_cache.py
+#
+# Semantic response cache in front of query_specialist (see A.py). Pure
+# Python, no model calls: prompts are normalised into bag-of-words vectors and
+# a cached answer is reused when a new prompt to the same specialist is close
+# enough to one already answered and names the same things (places, names,
+# numbers). Answers of specialists that draw on the student's history are
+# only reused for that same student, and an answer given with earlier turns
+# of the conversation in view only within that conversation.
+
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Collection, Optional
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "for", "of", "to", "in", "on", "at", "by",
+    "with", "about", "is", "are", "am", "be", "i", "me", "my", "we", "you",
+    "your", "it", "this", "that", "what", "which", "some", "any", "can",
+    "could", "would", "should", "please", "tell", "find", "show", "give",
+    "list", "there", "do", "does", "good", "best", "get",
+}
+
+_WORD = re.compile(r"[a-z0-9+#]+")
+_CASED_WORD = re.compile(r"[A-Za-z0-9+#]+")
+_SENTENCE_END = re.compile(r"[.!?:]\s*$")
+
+
+def _stem(word: str) -> str:
+    # just enough to fold plurals: "competitions" -> "competition"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(w) for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def normalize(text: str) -> str:
+    """Canonical form used as the exact-match key; word order is kept ("X not Y" != "Y not X")."""
+    return " ".join(tokenize(text))
+
+
+def entities(text: str) -> frozenset[str]:
+    """
+    Tokens a similar prompt must share exactly: numbers and names.
+
+    Names are capitalised words other than a sentence's first word, and
+    acronyms. A name typed in lower case looks like any other word.
+    """
+    found = set()
+    for match in _CASED_WORD.finditer(text):
+        word = match.group()
+        sentence_start = not text[:match.start()].strip() or bool(_SENTENCE_END.search(text[:match.start()]))
+        if (
+            any(c.isdigit() for c in word)
+            or (len(word) > 1 and word.isupper())
+            or (word[0].isupper() and not sentence_start)
+        ) and word.lower() not in STOPWORDS:
+            found.add(_stem(word.lower()))
+    return frozenset(found)
+
+
+def vectorize(text: str) -> dict[str, float]:
+    tokens = tokenize(text)
+    counts: dict[str, float] = {}
+    # bigrams, so the same words in another order aren't "similar"
+    for token in tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]:
+        counts[token] = counts.get(token, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {token: v / norm for token, v in counts.items()}
+
+
+def cosine(a: dict[str, float], b: dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(token, 0.0) for token, weight in a.items())
+
+
+@dataclass
+class CacheEntry:
+    answer: str
+    vector: dict[str, float]
+    entities: frozenset[str]
+    expires_at: float
+    latency: float
+
+
+class SemanticCache:
+    """
+    Per-specialist answer cache with similarity lookup, TTL and LRU bound.
+
+    `ttls` maps specialist name to how long its answers stay fresh (seconds);
+    specialists without a positive TTL are never cached. An answer is
+    reused for every user only if its specialist is in `shared` and it was
+    given without history (`session_id` None); otherwise only for the same
+    `user_id`, and with history only in that same `session_id`. A lookup
+    first tries the exact normalised prompt, then the most similar cached
+    prompt whose cosine similarity is at least `threshold` and whose
+    entities match exactly.
+    """
+
+    def __init__(
+        self,
+        ttls: dict[str, float],
+        threshold: float = 0.85,
+        max_entries: int = 512,
+        shared: Collection[str] = (),
+    ):
+        self.ttls = ttls
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.shared = set(shared)
+        # specialist -> (owner, normalised prompt) -> entry; owner None when shared
+        self._entries: dict[str, "OrderedDict[tuple[Optional[tuple], str], CacheEntry]"] = {}
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def enabled(self, specialist: str) -> bool:
+        return self.ttls.get(specialist, 0) > 0
+
+    def _counter(self, specialist: str) -> dict[str, float]:
+        return self._stats.setdefault(
+            specialist,
+            {"hits": 0, "similar_hits": 0, "misses": 0, "saved_seconds": 0.0, "saved_tokens": 0},
+        )
+
+    def _owner(self, specialist: str, user_id: Optional[str], session_id: Optional[str]) -> Optional[tuple]:
+        if session_id is not None:
+            # "tell me more about the first one" means something else in every conversation
+            return (user_id, session_id)
+        return None if specialist in self.shared else (user_id, None)
+
+    def get(
+        self,
+        specialist: str,
+        prompt: str,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        A cached answer to `prompt`, or None. `session_id` names the
+        conversation the specialist would see history of (None: no history).
+        """
+        if not self.enabled(specialist):
+            return None
+        entries = self._entries.get(specialist)
+        counter = self._counter(specialist)
+        now = time.monotonic()
+
+        owner = self._owner(specialist, user_id, session_id)
+        key = (owner, normalize(prompt))
+        entry = entries.get(key) if entries else None
+        if entry is not None and entry.expires_at <= now:
+            del entries[key]
+            entry = None
+
+        similar = False
+        if entry is None and entries:
+            vector = vectorize(prompt)
+            names = entities(prompt)
+            best_score = self.threshold
+            for candidate_key, candidate in list(entries.items()):
+                if candidate.expires_at <= now:
+                    del entries[candidate_key]
+                    continue
+                if candidate_key[0] != owner or candidate.entities != names:
+                    continue
+                score = cosine(vector, candidate.vector)
+                if score >= best_score:
+                    key, entry, best_score = candidate_key, candidate, score
+            similar = entry is not None
+
+        if entry is None:
+            counter["misses"] += 1
+            return None
+
+        entries.move_to_end(key)
+        counter["similar_hits" if similar else "hits"] += 1
+        counter["saved_seconds"] += entry.latency
+        # rough: ~4 characters per output token, prompt tokens not counted
+        counter["saved_tokens"] += len(entry.answer) // 4
+        return entry.answer
+
+    def put(
+        self,
+        specialist: str,
+        prompt: str,
+        answer: str,
+        latency: float = 0.0,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> None:
+        """Cache `answer`; `user_id` and `session_id` as given to the get() that missed."""
+        if not self.enabled(specialist) or not answer.strip():
+            return
+        entries = self._entries.setdefault(specialist, OrderedDict())
+        key = (self._owner(specialist, user_id, session_id), normalize(prompt))
+        entries[key] = CacheEntry(
+            answer=answer,
+            vector=vectorize(prompt),
+            entities=entities(prompt),
+            expires_at=time.monotonic() + self.ttls[specialist],
+            latency=latency,
+        )
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        report = {}
+        for specialist, counter in self._stats.items():
+            lookups = counter["hits"] + counter["similar_hits"] + counter["misses"]
+            report[specialist] = {
+                **counter,
+                "entries": len(self._entries.get(specialist, ())),
+                "hit_rate": (lookups - counter["misses"]) / lookups if lookups else 0.0,
+            }
+        return report
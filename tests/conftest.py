@@ -0,0 +1,6 @@
+import os
+
+# importing A/main needs no real key or background workers
+os.environ.setdefault("GOOGLE_API_KEY", "test-placeholder")
+os.environ.setdefault("PDE_WARMUP", "0")
+os.environ.setdefault("PDE_JOB_WORKERS", "0")
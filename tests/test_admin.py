@@ -0,0 +1,29 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_traces_are_disabled_without_an_admin_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.get("/traces").status_code == 403
+
+
+def test_traces_need_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/traces").status_code == 401
+    assert client.get("/traces", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/traces", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200 and "traces" in response.json()
+
+
+def test_usage_needs_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/usage", params={"user_id": "u"}).status_code == 401
+    response = client.get("/usage", params={"user_id": "u"}, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200 and response.json()["user_id"] == "u"
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import A
+from usage import QuotaExceeded
+
+
+def _fake_consult(behaviour):
+    async def consult_specialist(name, question, tool_context=None):
+        outcome = behaviour[name]
+        if isinstance(outcome, float):
+            await asyncio.sleep(outcome)
+            return f"{name} answer"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    return consult_specialist
+
+
+def test_partial_failure_keeps_the_other_answers(monkeypatch):
+    monkeypatch.setattr(A, "SPECIALIST_TIMEOUT", 0.1)
+    monkeypatch.setattr(A, "consult_specialist", _fake_consult({
+        "InfoScout": "facts",
+        "MentalLift": RuntimeError("model said no"),
+        "Evaluator": 5.0,
+        "PathMatch": "interests",
+    }))
+    result = asyncio.run(A.ask_many(["pathmatch", "InfoScout", "MentalLift", "Evaluator", "Nobody"], "q"))
+    assert result["answers"] == {"PathMatch": "interests", "InfoScout": "facts"}
+    assert list(result["answers"]) == ["PathMatch", "InfoScout"]
+    assert result["failed"] == {
+        "Nobody": "unknown specialist",
+        "MentalLift": "model said no",
+        "Evaluator": "timed out after 0.1s",
+    }
+
+
+def test_quota_exceeded_ends_the_fan_out(monkeypatch):
+    cancelled = []
+
+    async def consult_specialist(name, question, tool_context=None):
+        if name == "InfoScout":
+            raise QuotaExceeded("user", 10, 10, 60)
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    monkeypatch.setattr(A, "consult_specialist", consult_specialist)
+
+    async def scenario():
+        with pytest.raises(QuotaExceeded):
+            await A.ask_many(["InfoScout", "Evaluator"], "q")
+        await asyncio.sleep(0)
+
+    asyncio.run(asyncio.wait_for(scenario(), 2))
+    assert cancelled == ["Evaluator"]
@@ -0,0 +1,66 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from batch_store import BatchCheckpoints
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "batch_checkpoints", BatchCheckpoints(tmp_path))
+    return TestClient(main.app)
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_resumed_batch_only_runs_unfinished_and_changed_items(client, monkeypatch):
+    served = []
+    failing = {"b"}
+
+    async def serve(message, session_id, user_id, **kwargs):
+        served.append(message)
+        if message in failing:
+            raise RuntimeError("model down")
+        return SimpleNamespace(route="CommandCore", reply=message.upper())
+
+    monkeypatch.setattr(main, "serve_turn_patiently", serve)
+    items = [{"session_id": "s1", "message": "a"}, {"session_id": "s2", "message": "b"}]
+
+    first = _lines(client.post("/chat/batch", json={"batch_id": "nightly", "items": items}))
+    assert first[-1]["ok"] == 1 and first[-1]["failed"] == 1
+
+    failing.clear()
+    served.clear()
+    second = _lines(client.post("/chat/batch", json={"batch_id": "nightly", "items": items}))
+    assert served == ["b"]
+    assert second[0]["resumed"] == 1
+    by_id = {line["id"]: line for line in second[1:-1]}
+    assert by_id["0"]["resumed"] and by_id["0"]["reply"] == "A"
+    assert by_id["1"]["status"] == "ok" and "resumed" not in by_id["1"]
+
+    # an item edited between attempts is answered afresh
+    served.clear()
+    items[0]["message"] = "c"
+    third = _lines(client.post("/chat/batch", json={"batch_id": "nightly", "items": items}))
+    assert served == ["c"]
+    assert (third[-1]["ok"], third[-1]["resumed"]) == (1, 1)
+
+
+def test_torn_checkpoint_line_is_skipped_and_not_appended_to(tmp_path):
+    checkpoints = BatchCheckpoints(tmp_path)
+    checkpoints.append("b1", {"id": "0", "fingerprint": "f0"})
+    with (tmp_path / "b1.jsonl").open("a", encoding="utf-8") as f:
+        f.write('{"id": "1", "finger')
+    assert list(checkpoints.load("b1")) == ["0"]
+    checkpoints.append("b1", {"id": "2", "fingerprint": "f2"})
+    assert list(checkpoints.load("b1")) == ["0", "2"]
+
+
+def test_batch_id_may_not_leave_the_checkpoint_directory(client):
+    response = client.post("/chat/batch", json={"batch_id": "../etc", "items": []})
+    assert response.status_code == 400
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+from google.genai import types
+
+from context_window import SUMMARY_HEADER, ContextWindow, split_turns
+
+
+def _text(content):
+    return "".join(part.text for part in content.parts if part.text)
+
+
+def _conversation(turns, words=60):
+    contents = []
+    for i in range(turns):
+        contents.append(types.Content(role="user", parts=[types.Part(text=f"question {i} " + "word " * words)]))
+        contents.append(types.Content(role="model", parts=[types.Part(text=f"answer {i} " + "word " * words)]))
+    return contents
+
+
+def test_short_history_is_sent_unchanged():
+    window = ContextWindow(keep_turns=6)
+    contents = _conversation(3)
+    compacted, before, after = window.compact(("u", "s", "CommandCore"), "CommandCore", contents)
+    assert compacted is contents and before == after
+
+
+def test_old_turns_are_replaced_by_a_summary():
+    window = ContextWindow(keep_turns=2, default_budget=100_000)
+    contents = _conversation(10, words=20)
+    compacted, before, after = window.compact(("u", "s", "CommandCore"), "CommandCore", contents)
+    summary = _text(compacted[0])
+    assert summary.startswith(SUMMARY_HEADER)
+    assert "question 0" in summary and "answer 7" in summary
+    assert compacted[1:] == contents[-4:]
+
+
+def test_summary_keeps_its_newest_lines():
+    window = ContextWindow(keep_turns=2, default_budget=100_000, max_summary_chars=500)
+    compacted, _, _ = window.compact(("u", "s", "CommandCore"), "CommandCore", _conversation(10, words=20))
+    summary = _text(compacted[0])
+    assert "question 0" not in summary and "answer 7" in summary
+
+
+def test_over_budget_moves_more_turns_into_the_summary():
+    window = ContextWindow(keep_turns=6, default_budget=300)
+    contents = _conversation(10)
+    compacted, _, after = window.compact(("u", "s", "CommandCore"), "CommandCore", contents)
+    kept = split_turns(compacted[1:])
+    assert len(kept) < 6
+    assert after <= 300 or len(kept) == 1
+    # the newest turn always goes out verbatim
+    assert compacted[-2:] == contents[-2:]
+
+
+def test_summary_is_extended_incrementally_and_rebuilt_after_a_rewrite():
+    window = ContextWindow(keep_turns=2, default_budget=100_000)
+    key = ("u", "s", "CommandCore")
+    contents = _conversation(6)
+    window.compact(key, "CommandCore", contents)
+    assert window._summaries[key].turns == 4
+
+    contents += _conversation(7)[-2:]
+    window.compact(key, "CommandCore", contents)
+    assert window._summaries[key].turns == 5
+
+    rewritten = [types.Content(role="user", parts=[types.Part(text="a different start")])] + contents[1:]
+    compacted, _, _ = window.compact(key, "CommandCore", rewritten)
+    assert "a different start" in _text(compacted[0])
+
+
+def _before_model(window, contents):
+    callback_context = SimpleNamespace(
+        session=SimpleNamespace(user_id="u", id="s"), agent_name="CommandCore"
+    )
+    llm_request = SimpleNamespace(contents=contents)
+    window.before_model(callback_context, llm_request)
+    return llm_request.contents
+
+
+def test_before_model_replaces_contents_only_when_it_saves_tokens():
+    long_history = _conversation(10)
+    compacted = _before_model(ContextWindow(keep_turns=2, default_budget=300), long_history)
+    assert _text(compacted[0]).startswith(SUMMARY_HEADER) and len(compacted) < len(long_history)
+
+    # summarising tiny turns would cost more than sending them
+    tiny = _conversation(10, words=0)
+    window = ContextWindow(keep_turns=2)
+    assert _before_model(window, tiny) is tiny
+    assert window.stats()["compacted"] == 0
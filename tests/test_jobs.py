@@ -0,0 +1,103 @@
+import socket
+
+import pytest
+
+from jobs import check_callback_url
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://8.8.8.8/hook",
+        "https://127.0.0.1/hook",
+        "https://169.254.169.254/latest/meta-data",
+        "https://10.0.0.5/hook",
+        "https://[::ffff:192.168.1.1]/hook",
+        "https://[::1]/hook",
+    ],
+)
+def test_callback_to_internal_address_is_refused(url):
+    with pytest.raises(ValueError):
+        check_callback_url(url)
+
+
+def test_callback_to_public_address_is_allowed():
+    check_callback_url("https://8.8.8.8/hook")
+
+
+def test_allow_list_replaces_the_address_check():
+    hosts = ("hooks.example.com", ".partner.org")
+    check_callback_url("https://hooks.example.com/x", hosts)
+    check_callback_url("https://eu.partner.org/x", hosts)
+    for url in ("https://example.com/x", "https://evilpartner.org/x", "https://8.8.8.8/x"):
+        with pytest.raises(ValueError):
+            check_callback_url(url, hosts)
+
+
+def test_callback_connects_to_the_checked_address(monkeypatch):
+    import requests
+
+    import jobs
+
+    monkeypatch.setattr(
+        jobs.socket, "getaddrinfo",
+        lambda host, port, type=0: [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.215.14", port))],
+    )
+    sent = []
+
+    def send(adapter, request, **kwargs):
+        sent.append((request.url, request.headers["Host"], adapter.poolmanager.connection_pool_kw))
+        response = requests.Response()
+        response.status_code = 204
+        return response
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", send)
+    jobs.post_callback("https://hooks.example.com:8443/cb?job=1", {"id": "j"})
+    [(url, host, pool_kw)] = sent
+    assert url == "https://93.184.215.14:8443/cb?job=1"
+    assert host == "hooks.example.com:8443"
+    assert pool_kw["server_hostname"] == pool_kw["assert_hostname"] == "hooks.example.com"
+
+
+def test_worker_survives_a_failing_claim(caplog):
+    import asyncio
+
+    from jobs import JobWorkers
+
+    class FlakyStore:
+        def __init__(self):
+            self.claims = 0
+
+        def claim(self, worker, lease, max_attempts):
+            self.claims += 1
+            if self.claims <= 2:
+                raise OSError("disk I/O error")
+            return None
+
+    async def scenario():
+        store = FlakyStore()
+        pool = JobWorkers(store, run=None, workers=1, poll=0.01)
+        pool.start()
+        await asyncio.sleep(0.2)
+        alive = not pool._tasks[0].done()
+        await pool.stop()
+        return store, pool, alive
+
+    store, pool, alive = asyncio.run(scenario())
+    assert alive and store.claims > 2
+    assert pool.counters["claim_errors"] == 2
+    assert "could not claim a job" in caplog.text
+
+
+def test_job_is_only_shown_to_its_user(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from jobs import JobStore
+
+    monkeypatch.setattr(main, "job_store", JobStore(tmp_path / "jobs.db"))
+    client = TestClient(main.app)
+    submitted = client.post("/jobs", json={"user_id": "alice", "session_id": "s", "message": "hi"}).json()
+    assert client.get(submitted["location"]).json()["user_id"] == "alice"
+    assert client.get(f"/jobs/{submitted['id']}", params={"user_id": "mallory"}).status_code == 404
+    assert client.get(f"/jobs/{submitted['id']}").status_code == 404
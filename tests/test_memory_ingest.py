@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+from memory_ingest import MemoryIngestor
+
+
+def _session(session_id, user_id="u"):
+    return SimpleNamespace(app_name="app", user_id=user_id, id=session_id)
+
+
+def _event(text, timestamp, partial=False):
+    return SimpleNamespace(
+        content=SimpleNamespace(parts=[SimpleNamespace(text=text)]), timestamp=timestamp, partial=partial
+    )
+
+
+class Recorder:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def __call__(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("embedding service down")
+        self.batches.append([(session_id, event.content.parts[0].text) for _, _, session_id, event in events])
+
+
+def test_a_burst_of_turns_is_one_batched_write():
+    async def scenario():
+        write = Recorder()
+        ingestor = MemoryIngestor(write, debounce=0.1, max_delay=1.0, ignore_users={"web_search"})
+        for i in range(3):
+            ingestor.observe(_session("s1"), _event(f"turn {i}", i))
+            await asyncio.sleep(0.01)
+        ingestor.observe(_session("s2"), _event("other", 10))
+        ingestor.observe(_session("s2"), _event("chunk", 11, partial=True))
+        ingestor.observe(_session("s3", user_id="web_search"), _event("search", 12))
+        await asyncio.sleep(0.02)
+        assert write.batches == []      # still within the debounce
+        await asyncio.sleep(0.3)
+        return write, ingestor.stats()
+
+    write, stats = asyncio.run(scenario())
+    assert write.batches == [[("s1", "turn 0"), ("s1", "turn 1"), ("s1", "turn 2"), ("s2", "other")]]
+    assert (stats["batches"], stats["written"], stats["pending_events"]) == (1, 4, 0)
+
+
+def test_written_events_are_not_ingested_again():
+    async def scenario():
+        write = Recorder()
+        ingestor = MemoryIngestor(write, debounce=0.01)
+        ingestor.observe(_session("s"), _event("first", 1))
+        await ingestor.close()
+        # e.g. the session replayed from the store after a restart of the service
+        ingestor.observe(_session("s"), _event("first", 1))
+        ingestor.observe(_session("s"), _event("second", 2))
+        await ingestor.close()
+        return write, ingestor.counters
+
+    write, counters = asyncio.run(scenario())
+    assert write.batches == [[("s", "first")], [("s", "second")]]
+    assert counters["skipped"] == 1
+
+
+def test_failed_write_is_retried_with_what_arrived_since():
+    async def scenario():
+        write = Recorder(failures=1)
+        ingestor = MemoryIngestor(write, debounce=0.02, max_delay=0.5)
+        ingestor.observe(_session("s"), _event("before", 1))
+        await asyncio.sleep(0.03)       # the first write fails now
+        ingestor.observe(_session("s"), _event("after", 2))
+        await asyncio.sleep(0.15)
+        return write, ingestor.counters
+
+    write, counters = asyncio.run(scenario())
+    assert write.batches == [[("s", "before"), ("s", "after")]]
+    assert (counters["write_errors"], counters["dropped"]) == (1, 0)
+
+
+def test_events_are_dropped_after_max_attempts():
+    async def scenario():
+        write = Recorder(failures=10)
+        ingestor = MemoryIngestor(write, debounce=0.01, max_attempts=2)
+        ingestor.observe(_session("s"), _event("lost", 1))
+        await asyncio.sleep(0.1)
+        return write, ingestor.stats()
+
+    write, stats = asyncio.run(scenario())
+    assert write.batches == []
+    assert (stats["write_errors"], stats["dropped"], stats["pending_events"]) == (2, 1, 0)
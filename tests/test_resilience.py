@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from resilience import CircuitOpen, LatencyWindow, Resilience, RetryPolicy, _Pump
+
+
+class APIError(Exception):
+    """Shaped like google.genai's APIError: an HTTP status in `code`."""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def failing(exc):
+    def call():
+        async def gen():
+            raise exc
+            yield  # pragma: no cover
+        return gen()
+    return call
+
+
+def answering(*items):
+    def call():
+        async def gen():
+            for item in items:
+                yield item
+        return gen()
+    return call
+
+
+async def drain(res, call, agent="a"):
+    return [item async for item in res.stream(agent, call)]
+
+
+def no_retry_resilience(**kw):
+    return Resilience(retry=RetryPolicy(attempts=1), hedge=False, **kw)
+
+
+def test_server_errors_open_the_breaker():
+    async def go():
+        res = no_retry_resilience(breaker_threshold=3)
+        for _ in range(3):
+            with pytest.raises(APIError):
+                await drain(res, failing(APIError(503)))
+        with pytest.raises(CircuitOpen):
+            await drain(res, answering("x"))
+        assert res.counters["fast_failures"] == 1
+
+    asyncio.run(go())
+
+
+def test_client_errors_do_not_open_the_breaker():
+    async def go():
+        res = no_retry_resilience(breaker_threshold=2)
+        for _ in range(5):
+            with pytest.raises(APIError):
+                await drain(res, failing(APIError(400)))
+            with pytest.raises(ValueError):
+                await drain(res, failing(ValueError("bad prompt")))
+        assert res.breaker("a").state == "closed"
+        assert await drain(res, answering("ok")) == ["ok"]
+
+    asyncio.run(go())
+
+
+def test_half_open_probe_closes_the_breaker():
+    async def go():
+        res = no_retry_resilience(breaker_threshold=1, breaker_reset=0.05)
+        with pytest.raises(ConnectionError):
+            await drain(res, failing(ConnectionError()))
+        with pytest.raises(CircuitOpen):
+            await drain(res, answering("x"))
+        await asyncio.sleep(0.06)
+        assert await drain(res, answering("probe")) == ["probe"]
+        assert res.breaker("a").state == "closed"
+
+    asyncio.run(go())
+
+
+def test_transient_errors_before_the_first_response_are_retried():
+    async def go():
+        res = Resilience(retry=RetryPolicy(attempts=3, initial_delay=0.001), hedge=False)
+        attempts = []
+
+        def call():
+            attempts.append(1)
+            if len(attempts) < 3:
+                return failing(ConnectionError())()
+            return answering("done")()
+
+        assert await drain(res, call) == ["done"]
+        assert res.counters["retries"] == 2
+
+    asyncio.run(go())
+
+
+def test_slow_call_is_hedged():
+    async def go():
+        res = Resilience(retry=RetryPolicy(attempts=1), hedge_min_samples=1, hedge_budget=1.0)
+        res.latency["a"] = LatencyWindow()
+        res.latency["a"].add(0.01)
+        calls = []
+
+        def call():
+            calls.append(1)
+            delay = 5.0 if len(calls) == 1 else 0.0
+
+            async def gen():
+                await asyncio.sleep(delay)
+                yield f"call {len(calls)}"
+            return gen()
+
+        assert await asyncio.wait_for(drain(res, call), 2) == ["call 2"]
+        assert res.counters["hedges"] == 1
+
+    asyncio.run(go())
+
+
+def test_pump_applies_backpressure():
+    async def go():
+        produced = []
+
+        async def source():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        pump = _Pump(source(), maxsize=4)
+        await pump.first.wait()
+        await asyncio.sleep(0.01)
+        # the queue holds 4, the generator is parked on the 5th put
+        assert len(produced) <= 5
+        items = [item async for item in pump.items()]
+        assert items == list(range(100))
+
+    asyncio.run(go())
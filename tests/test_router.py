@@ -0,0 +1,61 @@
+import pytest
+
+from router import PreRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return PreRouter()
+
+
+@pytest.mark.parametrize(
+    "message, agent",
+    [
+        ("Find me AI internships for class 11 students", "Opportune"),
+        ("I'm feeling overwhelmed and stressed about exams", "MentalLift"),
+        ("My code doesn't work, I get a TypeError", "MistakeMonitor"),
+    ],
+)
+def test_obvious_messages_skip_commandcore(router, message, agent):
+    route = router.classify(message)
+    assert route.agent == agent
+    assert route.confidence >= router.threshold
+
+
+@pytest.mark.parametrize(
+    "message, reason",
+    [
+        ("Based on that, which one should I pick?", "refers to earlier turns"),
+        ("Find me scholarships, I'm so stressed about money", "several intents"),
+        ("hello " * 61, "long message"),
+    ],
+)
+def test_ambiguous_messages_fall_back(router, message, reason):
+    route = router.classify(message)
+    assert route.agent is None
+    assert route.reason.startswith(reason)
+
+
+def test_low_confidence_falls_back():
+    route = PreRouter(threshold=1.01).classify("Find me AI internships for class 11 students")
+    assert route.agent is None and route.reason.startswith("low confidence")
+
+
+def test_message_without_known_words_goes_to_commandcore(router):
+    assert router.classify("???").agent is None
+
+
+def test_route_counts_outcomes():
+    router = PreRouter()
+    router.route("Find me AI internships for class 11 students")
+    router.route("Based on that, which one should I pick?")
+    stats = router.stats()
+    assert stats["routed"] == 1 and stats["fallback"] == 1
+    assert stats["llm_round_trips_saved"] == 2
+    assert stats["routed_by_agent"] == {"Opportune": 1}
+
+
+def test_round_trips_saved_follow_the_passthrough_setting():
+    router = PreRouter(round_trips_saved=1)
+    router.route("Find me AI internships for class 11 students")
+    assert router.stats()["llm_round_trips_saved"] == 1
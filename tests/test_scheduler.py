@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from scheduler import BACKGROUND, INTERACTIVE, ModelScheduler, SchedulerBusy
+
+
+async def _call(scheduler, user_id, served, priority=INTERACTIVE, hold=0.0):
+    with scheduler.context(user_id, priority):
+        async with scheduler.slot():
+            served.append(user_id)
+            await asyncio.sleep(hold)
+
+
+async def _queue_behind_busy_slot(scheduler, calls):
+    """Occupy the only slot, queue `calls` in order, then release it."""
+    served = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = []
+    for user_id, priority in calls:
+        tasks.append(asyncio.create_task(_call(scheduler, user_id, served, priority)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return served
+
+
+def test_waiters_are_served_round_robin_across_users():
+    scheduler = ModelScheduler(max_in_flight=1, rate=0)
+    calls = [("busy", INTERACTIVE)] * 3 + [("quiet", INTERACTIVE)]
+    served = asyncio.run(_queue_behind_busy_slot(scheduler, calls))
+    assert served == ["busy", "quiet", "busy", "busy"]
+
+
+def test_interactive_calls_go_before_background():
+    scheduler = ModelScheduler(max_in_flight=1, rate=0)
+    calls = [("job", BACKGROUND), ("job", BACKGROUND), ("user", INTERACTIVE)]
+    served = asyncio.run(_queue_behind_busy_slot(scheduler, calls))
+    assert served == ["user", "job", "job"]
+
+
+@pytest.mark.parametrize(
+    "limits, reason",
+    [
+        ({"max_queue": 2, "max_queue_per_user": 16}, "queue_full"),
+        ({"max_queue": 16, "max_queue_per_user": 2}, "user_queue_full"),
+    ],
+)
+def test_full_queue_rejects_instead_of_waiting(limits, reason):
+    async def scenario():
+        scheduler = ModelScheduler(max_in_flight=1, rate=0, **limits)
+        served = []
+        holder = asyncio.create_task(_call(scheduler, "u", served, hold=0.05))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(_call(scheduler, "u", served)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy) as busy:
+            await _call(scheduler, "u", served)
+        await asyncio.gather(holder, *waiting)
+        return busy.value, scheduler.counters, served
+
+    busy, counters, served = asyncio.run(scenario())
+    assert busy.reason == reason and busy.retry_after >= 1
+    assert counters["rejected"] == 1 and len(served) == 3
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = ModelScheduler(max_in_flight=1, rate=0)
+        served = []
+        holder = asyncio.create_task(_call(scheduler, "a", served, hold=0.02))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_call(scheduler, "b", served))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await holder
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return scheduler.stats(), served
+
+    stats, served = asyncio.run(scenario())
+    assert served == ["a"]
+    assert stats["queued"] == 0 and stats["in_flight"] == 0 and stats["cancelled_waiting"] == 1
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from search_cache import SearchCache, normalize_query
+
+
+def test_normalize_query_drops_filler_and_plurals():
+    assert normalize_query("Please search for Python internships") == normalize_query("python internship")
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_fetch():
+    calls = []
+
+    async def fetch(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return {"query": query}
+
+    async def scenario():
+        cache = SearchCache(fetch)
+        first = asyncio.create_task(cache.search("python internships"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(cache.search("Python internship"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # the fetch finished for the remaining waiter, so it was cached
+        cached = await cache.search("python internships")
+        return result, cached, cache.counters
+
+    result, cached, counters = asyncio.run(scenario())
+    assert result == cached == {"query": "python internships"}
+    assert calls == ["python internships"]
+    assert (counters["misses"], counters["coalesced"], counters["hits"]) == (1, 1, 1)
+
+
+def test_failed_fetch_reaches_every_waiter_and_is_not_cached():
+    calls = []
+
+    async def fetch(query):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("search backend down")
+        return "ok"
+
+    async def scenario():
+        cache = SearchCache(fetch)
+        results = await asyncio.gather(
+            cache.search("rust jobs"), cache.search("rust jobs"), return_exceptions=True
+        )
+        return results, await cache.search("rust jobs"), cache.counters
+
+    results, retried, counters = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retried == "ok"
+    assert len(calls) == 2 and counters["errors"] == 1
+
+
+def test_fetch_is_cancelled_once_every_waiter_has_gone():
+    started, cancelled = [], []
+
+    async def fetch(query):
+        started.append(query)
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    async def scenario():
+        cache = SearchCache(fetch)
+        waiters = [asyncio.create_task(cache.search("go jobs")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        # a later search for the same key starts over instead of joining the dead fetch
+        again = asyncio.create_task(cache.search("go jobs"))
+        await asyncio.sleep(0.01)
+        again.cancel()
+        await asyncio.gather(again, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cancelled == started == ["go jobs", "go jobs"]
+    assert cache.counters["abandoned"] == 2 and cache.counters["errors"] == 0
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_search_is_charged_to_the_turn_that_missed(monkeypatch):
+    from google.adk.events import Event
+    from google.genai import types
+
+    import A
+    from usage import QuotaExceeded, UsageLedger
+
+    class SearchRunner:
+        async def run_async(self, **kwargs):
+            yield Event(
+                author="SearchAgent",
+                content=types.Content(role="model", parts=[types.Part(text="digest")]),
+                usage_metadata=types.GenerateContentResponseUsageMetadata(
+                    prompt_token_count=30, candidates_token_count=20
+                ),
+            )
+
+    async def arunner(name):
+        return SearchRunner()
+
+    ledger = UsageLedger(user_tokens=60)
+    monkeypatch.setattr(A.registry, "arunner", arunner)
+    monkeypatch.setattr(A, "usage_ledger", ledger)
+
+    async def scenario():
+        with ledger.context("u", "s"):
+            result = await A._search_with_agent("rust jobs")
+            summary = await ledger.session_summary("u", "s")
+            await A._search_with_agent("go jobs")
+            with pytest.raises(QuotaExceeded):
+                await A._search_with_agent("zig jobs")
+        return result, summary
+
+    result, summary = asyncio.run(scenario())
+    assert result["summary"] == "digest"
+    assert (summary["calls"], summary["total_tokens"]) == (1, 50)
@@ -0,0 +1,133 @@
+import asyncio
+import sqlite3
+
+import pytest
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.genai import types
+
+from session_store import BoundedSessionService, SqliteSessionService
+
+APP = "app"
+
+
+def _event(text: str) -> Event:
+    return Event(author="user", content=types.Content(role="user", parts=[types.Part(text=text)]))
+
+
+def _bad_event(key):
+    # NULL timestamp violates the events table's NOT NULL constraint
+    return ("event", key, "{}", None, {}, {}, {})
+
+
+def test_failed_op_rolls_back_alone(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "s.db"))
+        sessions = [
+            await service.create_session(app_name=APP, user_id="u", session_id=f"s{i}") for i in range(4)
+        ]
+        keys = [(APP, "u", s.id) for s in sessions]
+        results = service._commit([
+            ("event", keys[0], _event("a").model_dump_json(), 1.0, {}, {}, {}),
+            _bad_event(keys[1]),
+            ("event", keys[2], _event("c").model_dump_json(), 2.0, {}, {}, {}),
+        ])
+        assert results[0] is None and results[2] is None
+        assert isinstance(results[1], sqlite3.IntegrityError)
+        counts = [
+            len((await service.get_session(app_name=APP, user_id="u", session_id=s.id)).events)
+            for s in sessions
+        ]
+        await service.close()
+        return counts
+
+    assert asyncio.run(scenario()) == [1, 0, 1, 0]
+
+
+def test_failed_write_surfaces_on_its_session_only(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "s.db"))
+        sessions = [
+            await service.create_session(app_name=APP, user_id="u", session_id=f"s{i}") for i in range(3)
+        ]
+        # queued back to back, so the writer commits them as one batch
+        await service.append_event(sessions[0], _event("hi"))
+        await service._enqueue((APP, "u", "s1"), _bad_event((APP, "u", "s1")))
+        await service.append_event(sessions[2], _event("hi"))
+        await service.flush()
+        assert service.counters["write_errors"] == 1
+
+        ok = await service.get_session(app_name=APP, user_id="u", session_id="s0")
+        with pytest.raises(sqlite3.IntegrityError):
+            await service.get_session(app_name=APP, user_id="u", session_id="s1")
+        # reported once, then the session reads normally again
+        again = await service.get_session(app_name=APP, user_id="u", session_id="s1")
+        other = await service.get_session(app_name=APP, user_id="u", session_id="s2")
+        await service.close()
+        return len(ok.events), len(again.events), len(other.events)
+
+    assert asyncio.run(scenario()) == (1, 0, 1)
+
+
+def test_create_raises_when_another_process_created_it(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "s.db")
+        first, second = SqliteSessionService(path), SqliteSessionService(path)
+        await first.create_session(app_name=APP, user_id="u", session_id="dup", state={"owner": "first"})
+        with pytest.raises(AlreadyExistsError):
+            await second.create_session(app_name=APP, user_id="u", session_id="dup", state={"owner": "second"})
+        session = await second.get_session(app_name=APP, user_id="u", session_id="dup")
+        await first.close()
+        await second.close()
+        return session.state
+
+    assert asyncio.run(scenario())["owner"] == "first"
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_get_or_create():
+    async def scenario():
+        service = BoundedSessionService()
+        get_session = service.get_session
+
+        async def slow_get_session(**kwargs):
+            await asyncio.sleep(0.05)
+            return await get_session(**kwargs)
+
+        service.get_session = slow_get_session
+        first = asyncio.create_task(service.get_or_create_session(app_name=APP, user_id="u", session_id="s"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(service.get_or_create_session(app_name=APP, user_id="u", session_id="s"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        session = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return session, service.handle_counters
+
+    session, counters = asyncio.run(scenario())
+    assert session.id == "s"
+    assert counters["misses"] == 1 and counters["created"] == 1
+
+
+def test_cancelled_create_does_not_kill_the_writer(tmp_path):
+    async def scenario():
+        service = SqliteSessionService(str(tmp_path / "s.db"))
+        other = await service.create_session(app_name=APP, user_id="u", session_id="other")
+        # cancelled while it waits for the writer to commit it
+        create = asyncio.create_task(service.create_session(app_name=APP, user_id="u", session_id="gone"))
+        await asyncio.sleep(0)
+        await service.append_event(other, _event("hi"))
+        create.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await create
+
+        await asyncio.wait_for(service.flush_session(app_name=APP, user_id="u", session_id="other"), 2)
+        writer_alive = not service._writer.done()
+        again = await asyncio.wait_for(
+            service.create_session(app_name=APP, user_id="u", session_id="later"), 2
+        )
+        session = await service.get_session(app_name=APP, user_id="u", session_id="other")
+        await service.close()
+        return writer_alive, again.id, len(session.events)
+
+    assert asyncio.run(scenario()) == (True, "later", 1)
@@ -0,0 +1,68 @@
+import asyncio
+import itertools
+import zlib
+
+import pytest
+
+from shared_locks import SharedSessionLocks
+
+# two SharedSessionLocks on one directory stand in for two worker processes:
+# flock(2) locks belong to open files, so they exclude each other in-process too
+STRIPES = 2
+
+
+def _stripe(user_id, session_id):
+    return zlib.crc32(f"{user_id}\x00{session_id}".encode()) % STRIPES
+
+
+def _crossed_sessions():
+    """Parents x, y on different stripes whose sub-sessions hash onto each other's."""
+    for x, y in itertools.permutations((f"s{i}" for i in range(50)), 2):
+        if (
+            _stripe("u", x) != _stripe("u", y)
+            and _stripe("u", f"{x}-PathMatch") == _stripe("u", y)
+            and _stripe("u", f"{y}-PathMatch") == _stripe("u", x)
+        ):
+            return x, y
+    raise AssertionError("no crossed sessions found")
+
+
+def test_nested_sub_session_locks_cannot_deadlock_across_processes(tmp_path):
+    x, y = _crossed_sessions()
+
+    async def turn(locks, parent):
+        async with locks.get("u", parent):
+            await asyncio.sleep(0.02)     # the other worker now holds its parent too
+            async with locks.get("u", f"{parent}-PathMatch", parent):
+                return parent
+
+    async def scenario():
+        first = SharedSessionLocks(tmp_path, stripes=STRIPES, timeout=1)
+        second = SharedSessionLocks(tmp_path, stripes=STRIPES, timeout=1)
+        done = await asyncio.gather(turn(first, x), turn(second, y))
+        return done, first.stats(), second.stats()
+
+    done, first, second = asyncio.run(scenario())
+    assert done == [x, y]
+    # each worker took one lock file for its turn and its specialist
+    assert first["acquired"] == second["acquired"] == 1
+    assert first["timeouts"] == second["timeouts"] == 0
+
+
+def test_waiting_on_another_process_times_out(tmp_path):
+    assert SharedSessionLocks(tmp_path).timeout is not None
+
+    async def scenario():
+        holder = SharedSessionLocks(tmp_path, timeout=1)
+        waiter = SharedSessionLocks(tmp_path, timeout=0.05)
+        async with holder.get("u", "s"):
+            with pytest.raises(TimeoutError):
+                async with waiter.get("u", "s"):
+                    pass
+        # once released, the other process gets it
+        async with waiter.get("u", "s"):
+            pass
+        return waiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["timeouts"] == 1 and stats["held_stripes"] == 0
@@ -0,0 +1,39 @@
+from specialist_cache import SemanticCache
+
+PROMPT = "Find summer AI research internships for class 11 students in Delhi"
+
+
+def _cache():
+    return SemanticCache({"Opportune": 60, "PathMatch": 60}, shared={"Opportune"})
+
+
+def test_similar_prompt_with_different_entities_misses():
+    cache = _cache()
+    cache.put("Opportune", PROMPT, "delhi answer", 1.0, user_id="a")
+    assert cache.get("Opportune", PROMPT.replace("Delhi", "Pune"), "b") is None
+    assert cache.get("Opportune", PROMPT.replace("11", "12"), "b") is None
+    assert cache.get("Opportune", PROMPT.lower() + " please", "b") == "delhi answer"
+
+
+def test_personal_specialists_are_cached_per_user():
+    cache = _cache()
+    cache.put("PathMatch", "which career suits me", "for a", 1.0, user_id="a")
+    assert cache.get("PathMatch", "which career suits me", "b") is None
+    assert cache.get("PathMatch", "which career suits me", "a") == "for a"
+
+
+def test_answers_given_with_history_stay_in_their_conversation():
+    cache = _cache()
+    prompt = "tell me more about the first one"
+    cache.put("Opportune", prompt, "a's first one", 1.0, user_id="a", session_id="a-chat-Opportune")
+    assert cache.get("Opportune", prompt, "b") is None
+    assert cache.get("Opportune", prompt, "b", "b-chat-Opportune") is None
+    assert cache.get("Opportune", prompt, "a", "a-other-Opportune") is None
+    assert cache.get("Opportune", prompt, "a", "a-chat-Opportune") == "a's first one"
+
+
+def test_word_order_matters():
+    cache = _cache()
+    cache.put("Opportune", "python internships not java", "python", 1.0, user_id="a")
+    assert cache.get("Opportune", "java internships not python", "b") is None
+    assert cache.get("Opportune", "python internship, not java", "b") == "python"
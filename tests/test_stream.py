@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import main
+
+
+class StalledRunner:
+    """Runner whose model stream never produces anything."""
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def run_async(self, **kwargs):
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        yield
+
+
+def _frames(chunks):
+    frames = []
+    for chunk in chunks:
+        event, data = chunk.strip().split("\n")
+        frames.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return frames
+
+
+def test_stalled_stream_is_cut_off_at_the_turn_deadline(monkeypatch):
+    runner = StalledRunner()
+
+    async def arunner(name):
+        return runner
+
+    monkeypatch.setattr(main.registry, "arunner", arunner)
+    monkeypatch.setattr(main, "PREROUTER_ENABLED", False)
+    # build the session service (and import google.adk) outside the deadline
+    main.registry.session_service
+
+    async def scenario():
+        chunks = []
+        async for chunk in main.stream_single_turn("hi", "stream-deadline", "u", timeout=0.2):
+            chunks.append(chunk)
+        # the session lock was released with the cancelled runner
+        lock = main.session_locks.get("u", "stream-deadline")
+        await asyncio.wait_for(lock.__aenter__(), 1)
+        await lock.__aexit__(None, None, None)
+        return chunks
+
+    chunks = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert runner.cancelled
+    [(event, data)] = _frames(chunks)
+    assert event == "done" and "time limit" in data["reply"]
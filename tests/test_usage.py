@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import usage
+from usage import QuotaExceeded, SqliteUsageLedger, UsageLedger
+
+
+def _event(prompt=100, completion=50):
+    return SimpleNamespace(
+        partial=False,
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt,
+            tool_use_prompt_token_count=None,
+            candidates_token_count=completion,
+            thoughts_token_count=None,
+            cached_content_token_count=None,
+        ),
+    )
+
+
+def test_spent_user_budget_is_answered_with_429(monkeypatch):
+    ledger = UsageLedger(user_tokens=100, window=3600)
+    asyncio.run(ledger.record("spender", "s", "CommandCore", _event()))
+    monkeypatch.setattr(main, "usage_ledger", ledger)
+
+    response = TestClient(main.app).post("/chat", json={"user_id": "spender", "session_id": "s", "message": "hi"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 3600
+    assert "user token budget spent" in response.json()["detail"]
+
+
+def test_user_budget_resets_with_the_window(monkeypatch):
+    now = [7200.0 + 10]
+    monkeypatch.setattr(usage.time, "time", lambda: now[0])
+    ledger = UsageLedger(user_tokens=100, window=3600)
+
+    async def scenario():
+        await ledger.record("u", "s", "CommandCore", _event())
+        with pytest.raises(QuotaExceeded) as spent:
+            await ledger.check("u", "s")
+        now[0] += 3600
+        await ledger.check("u", "s")
+        return spent.value
+
+    spent = asyncio.run(scenario())
+    assert spent.scope == "user" and spent.retry_after == pytest.approx(3590)
+
+
+def test_spent_session_budget_does_not_reset():
+    ledger = UsageLedger(session_tokens=100)
+
+    async def scenario():
+        await ledger.record("u", "s", "CommandCore", _event())
+        await ledger.check("u", "other")
+        with pytest.raises(QuotaExceeded) as spent:
+            await ledger.check("u", "s")
+        return spent.value
+
+    spent = asyncio.run(scenario())
+    assert spent.scope == "session" and spent.retry_after is None
+
+
+def test_sqlite_ledger_prunes_least_recent_sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(SqliteUsageLedger, "prune_every", 1)
+    ledger = SqliteUsageLedger(tmp_path / "usage.db", max_sessions=3)
+
+    async def scenario():
+        for i in range(5):
+            await ledger.record("u", f"s{i}", "CommandCore", _event())
+        await ledger.record("u", "s1", "CommandCore", _event())
+        await ledger.record("u", "s5", "CommandCore", _event())
+        return await ledger.user_summary("u")
+
+    summary = asyncio.run(scenario())
+    assert sorted(summary["sessions"]) == ["s1", "s4", "s5"]
+    # the user's own totals aren't pruned
+    assert summary["total"]["calls"] == 7
+    assert ledger.stats()["sessions_pruned"] == 4
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import numpy as np
+from google.adk.events import Event
+from google.genai import types
+
+from memory_store import VectorMemoryService
+from vector_index import VectorIndex
+
+
+def _add(index, name):
+    index.add(name, [name], np.eye(1, index.dims), [name])
+
+
+def test_cold_names_least_recently_used_partitions_over_the_cap():
+    index = VectorIndex(dims=8, max_partitions=2, idle_seconds=0)
+    for name in ("a", "b", "c"):
+        _add(index, name)
+    index.search("a", np.eye(1, 8)[0])
+    assert index.cold() == ["b"]
+    assert index.drop("b") and "b" not in index
+    assert index.counters["evicted_lru"] == 1
+
+
+def test_cold_names_idle_partitions():
+    index = VectorIndex(dims=8, max_partitions=0, idle_seconds=0.05)
+    _add(index, "a")
+    time.sleep(0.1)
+    _add(index, "b")
+    assert index.cold() == ["a"]
+
+
+def test_evicted_user_is_reloaded_from_the_store(tmp_path):
+    def event(text):
+        return Event(author="user", content=types.Content(role="user", parts=[types.Part(text=text)]))
+
+    async def scenario():
+        service = VectorMemoryService(str(tmp_path / "m.db"), max_partitions=5, idle_seconds=0)
+        await service.add_events_to_memory(
+            [("app", f"u{i}", "s", event(f"I love robotics club number {i}")) for i in range(20)]
+        )
+        for i in range(20):
+            await service.search_memory(app_name="app", user_id=f"u{i}", query="robotics")
+        partitions = service.index.stats()["partitions"]
+        again = await service.search_memory(app_name="app", user_id="u0", query="robotics club")
+        return partitions, [m.content.parts[0].text for m in again.memories]
+
+    partitions, memories = asyncio.run(scenario())
+    assert partitions <= 5
+    assert memories == ["I love robotics club number 0"]
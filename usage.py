@@ -0,0 +1,403 @@
+# usage.py
+#
+# Token accounting and per-user budgets. serve_turn and query_specialist (and
+# the SSE turn) pass every event their runners yield to UsageLedger.record(),
+# which adds the event's usage_metadata to running totals: overall, per
+# agent, per user, per user and agent, and per session. /usage reads those
+# totals; nothing ever rescans a session.
+#
+# Budgets, checked by ScheduledLlm (scheduler.py) before each model call is
+# queued, for the user and session of the turn it belongs to:
+#
+# * `user_tokens` per user per `window` seconds (fixed windows, e.g. UTC days)
+# * `session_tokens` per session, over its lifetime
+#
+# A spent budget raises QuotaExceeded, which main.py turns into HTTP 429 (with
+# Retry-After at the end of the user's window). A call that starts within
+# budget is allowed to finish, so a budget can be overshot by one call.
+#
+# * UsageLedger       - totals in this process
+# * SqliteUsageLedger - totals in SQLite, shared by every worker on the box
+#   and kept across restarts
+
+import asyncio
+import contextlib
+import contextvars
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+import metrics
+
+TOTALS = ("calls", "prompt_tokens", "cached_tokens", "completion_tokens")
+
+USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_totals (
+    scope             TEXT NOT NULL,    -- total, agent, user, user_agent, session or window
+    owner             TEXT NOT NULL,    -- user id ('' for total and agent)
+    name              TEXT NOT NULL,    -- agent, session id or window start ('' for total and user)
+    calls             INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    cached_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    updated           REAL NOT NULL DEFAULT 0,    -- last added to (time.time())
+    PRIMARY KEY (scope, owner, name)
+);
+"""
+
+# after the column is added to databases created before it existed
+USAGE_INDEXES = """
+CREATE INDEX IF NOT EXISTS usage_totals_updated ON usage_totals (scope, updated);
+"""
+
+# (user_id, session_id) of the turn whose model calls are being made
+_turn: contextvars.ContextVar[Optional[tuple[str, str]]] = contextvars.ContextVar(
+    "pde_usage_turn", default=None
+)
+
+
+class QuotaExceeded(Exception):
+    """A token budget is spent. `retry_after` is None when waiting won't help."""
+
+    def __init__(self, scope: str, used: int, limit: int, retry_after: Optional[float]):
+        when = f", retry after {retry_after:.0f}s" if retry_after is not None else ""
+        super().__init__(f"{scope} token budget spent ({used:,} of {limit:,} tokens){when}")
+        self.scope = scope
+        self.used = used
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def event_usage(event) -> Optional[tuple[int, int, int]]:
+    """(prompt, cached, completion) tokens billed for a runner event, or None."""
+    usage = event.usage_metadata
+    if usage is None or event.partial:
+        # streamed chunks repeat the usage the final event carries
+        return None
+    prompt = (usage.prompt_token_count or 0) + (usage.tool_use_prompt_token_count or 0)
+    completion = (usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0)
+    return prompt, usage.cached_content_token_count or 0, completion
+
+
+class UsageLedger:
+    """
+    Running token totals and the budgets checked against them.
+
+    `prices` are (prompt, cached prompt, completion) per million tokens; they
+    only feed the "cost" figures. 0 as a budget means no limit. At most
+    `max_sessions` sessions are tracked, least recently used dropped first.
+    """
+
+    def __init__(
+        self,
+        user_tokens: int = 0,
+        session_tokens: int = 0,
+        window: float = 86400.0,
+        prices: tuple[float, float, float] = (0.0, 0.0, 0.0),
+        max_sessions: int = 100_000,
+    ):
+        self.user_tokens = user_tokens
+        self.session_tokens = session_tokens
+        self.window = window
+        self.prices = prices
+        self.max_sessions = max_sessions
+        # (scope, owner) -> name -> [calls, prompt, cached, completion]
+        self._totals: dict[tuple[str, str], dict[str, list[int]]] = {}
+        self._sessions: "OrderedDict[tuple[str, str], None]" = OrderedDict()
+        self.counters = {"recorded": 0, "rejected": 0}
+
+    def open(self) -> None:
+        """Open the backing store, if any (nothing to do in memory)."""
+
+    @contextlib.contextmanager
+    def context(self, user_id: str, session_id: str):
+        """Charge model calls made inside this block to `user_id` / `session_id`."""
+        token = _turn.set((user_id, session_id))
+        try:
+            yield
+        finally:
+            with contextlib.suppress(ValueError):
+                _turn.reset(token)
+
+    def turn(self) -> Optional[tuple[str, str]]:
+        """(user_id, session_id) set by context() for the running turn, if any."""
+        return _turn.get()
+
+    def window_start(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        return int(now - now % self.window)
+
+    def _keys(self, user_id: str, session_id: Optional[str], agent: str) -> list[tuple[str, str, str]]:
+        keys = [
+            ("total", "", ""),
+            ("agent", "", agent),
+            ("user", user_id, ""),
+            ("user_agent", user_id, agent),
+            ("window", user_id, str(self.window_start())),
+        ]
+        if session_id:
+            keys.append(("session", user_id, session_id))
+        return keys
+
+    # -- storage (overridden by SqliteUsageLedger) ------------------------------
+
+    async def _add(self, keys: list[tuple[str, str, str]], values: list[int]) -> None:
+        for scope, owner, name in keys:
+            names = self._totals.setdefault((scope, owner), {})
+            if scope == "window" and name not in names:
+                names.clear()       # only the current window counts
+            totals = names.setdefault(name, [0] * len(TOTALS))
+            for i, value in enumerate(values):
+                totals[i] += value
+            if scope == "session":
+                self._sessions[(owner, name)] = None
+                self._sessions.move_to_end((owner, name))
+        while len(self._sessions) > self.max_sessions:
+            owner, name = self._sessions.popitem(last=False)[0]
+            sessions = self._totals.get(("session", owner), {})
+            sessions.pop(name, None)
+            if not sessions:
+                self._totals.pop(("session", owner), None)
+
+    async def _get(self, scope: str, owner: str, name: str) -> list[int]:
+        return list(self._totals.get((scope, owner), {}).get(name, [0] * len(TOTALS)))
+
+    async def _children(self, scope: str, owner: str) -> dict[str, list[int]]:
+        return {name: list(values) for name, values in self._totals.get((scope, owner), {}).items()}
+
+    async def _top_users(self, limit: int) -> list[tuple[str, list[int]]]:
+        users = [(owner, names[""]) for (scope, owner), names in self._totals.items() if scope == "user"]
+        users.sort(key=lambda item: item[1][1] + item[1][3], reverse=True)
+        return [(owner, list(values)) for owner, values in users[:limit]]
+
+    async def _count_users(self) -> int:
+        return sum(1 for scope, _ in self._totals if scope == "user")
+
+    # -- recording and budgets -------------------------------------------------
+
+    async def record(self, user_id: str, session_id: Optional[str], agent: str, event) -> bool:
+        """Add a runner event's token usage to the totals; False if it carried none."""
+        usage = event_usage(event)
+        if usage is None:
+            return False
+        prompt, cached, completion = usage
+        await self._add(self._keys(user_id, session_id, agent), [1, prompt, cached, completion])
+        # pde_tokens_total counts the same tokens per agent (metrics.record_event)
+        self.counters["recorded"] += 1
+        return True
+
+    async def check(self, user_id: Optional[str] = None, session_id: Optional[str] = None) -> None:
+        """
+        Raise QuotaExceeded if the user or session has spent its budget.
+        Without arguments, checks the turn set by context() (if any).
+        """
+        if not (self.user_tokens or self.session_tokens):
+            return
+        if user_id is None:
+            turn = _turn.get()
+            if turn is None:
+                return
+            user_id, session_id = turn
+        if self.user_tokens:
+            start = self.window_start()
+            used = _tokens(await self._get("window", user_id, str(start)))
+            if used >= self.user_tokens:
+                self._reject("user", used, self.user_tokens, start + self.window - time.time())
+        if self.session_tokens and session_id:
+            used = _tokens(await self._get("session", user_id, session_id))
+            if used >= self.session_tokens:
+                self._reject("session", used, self.session_tokens, None)
+
+    def _reject(self, scope: str, used: int, limit: int, retry_after: Optional[float]):
+        self.counters["rejected"] += 1
+        metrics.QUOTA_REJECTED.inc(scope=scope)
+        raise QuotaExceeded(scope, used, limit, None if retry_after is None else max(1.0, retry_after))
+
+    # -- reports ---------------------------------------------------------------
+
+    def _report(self, values: list[int]) -> dict[str, Any]:
+        calls, prompt, cached, completion = values
+        price_prompt, price_cached, price_completion = self.prices
+        cost = ((prompt - cached) * price_prompt + cached * price_cached + completion * price_completion) / 1e6
+        return {**dict(zip(TOTALS, values)), "total_tokens": prompt + completion, "cost": round(cost, 6)}
+
+    def _budget(self, used: int, limit: int) -> dict[str, Any]:
+        return {"used": used, "limit": limit or None, "remaining": max(0, limit - used) if limit else None}
+
+    async def summary(self, top: int = 10) -> dict[str, Any]:
+        """Overall and per-agent totals, and the `top` users by tokens."""
+        agents = await self._children("agent", "")
+        return {
+            "total": self._report(await self._get("total", "", "")),
+            "agents": {agent: self._report(values) for agent, values in sorted(agents.items())},
+            "users": await self._count_users(),
+            "top_users": [
+                {"user_id": user_id, **self._report(values)} for user_id, values in await self._top_users(top)
+            ],
+        }
+
+    async def user_summary(self, user_id: str) -> dict[str, Any]:
+        """A user's totals, per agent and per session, and what's left of their budget."""
+        start = self.window_start()
+        agents = await self._children("user_agent", user_id)
+        sessions = await self._children("session", user_id)
+        window = await self._get("window", user_id, str(start))
+        return {
+            "user_id": user_id,
+            "total": self._report(await self._get("user", user_id, "")),
+            "agents": {agent: self._report(values) for agent, values in sorted(agents.items())},
+            "sessions": {session_id: self._report(values) for session_id, values in sessions.items()},
+            "window": {
+                "start": start,
+                "resets_in": round(start + self.window - time.time(), 1),
+                **self._report(window),
+                **self._budget(_tokens(window), self.user_tokens),
+            },
+        }
+
+    async def session_summary(self, user_id: str, session_id: str) -> dict[str, Any]:
+        values = await self._get("session", user_id, session_id)
+        return {
+            "user_id": user_id,
+            "session_id": session_id,
+            **self._report(values),
+            "budget": self._budget(_tokens(values), self.session_tokens),
+        }
+
+    def stats(self) -> dict:
+        return {**self.counters, "sessions": len(self._sessions)}
+
+
+def _tokens(values: list[int]) -> int:
+    return values[1] + values[3]
+
+
+class SqliteUsageLedger(UsageLedger):
+    """
+    UsageLedger keeping its totals in SQLite (WAL), for multi-worker mode.
+    The database is opened (and created) by `open()` or the first query.
+    Every `prune_every` session writes, session rows beyond `max_sessions`
+    are deleted, least recently added to first.
+    """
+
+    prune_every = 256
+
+    def __init__(self, path: str | Path = "usage.db", **kwargs):
+        super().__init__(**kwargs)
+        self.path = str(path)
+        self._local = threading.local()
+        self._open_lock = threading.Lock()
+        self._opened = False
+        self._session_writes = 0
+        self.counters["sessions_pruned"] = 0
+
+    def open(self) -> None:
+        with self._open_lock:
+            if self._opened:
+                return
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = self._local.conn = self._connect()
+            conn.executescript(USAGE_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(usage_totals)")}
+            if "updated" not in columns:
+                conn.execute("ALTER TABLE usage_totals ADD COLUMN updated REAL NOT NULL DEFAULT 0")
+            conn.executescript(USAGE_INDEXES)
+            self._opened = True
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        if not self._opened:
+            self.open()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _add_rows(self, keys: list[tuple[str, str, str]], values: list[int]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            now = time.time()
+            conn.executemany(
+                f"""INSERT INTO usage_totals (scope, owner, name, {', '.join(TOTALS)}, updated)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (scope, owner, name) DO UPDATE SET
+                       calls = calls + excluded.calls,
+                       prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                       cached_tokens = cached_tokens + excluded.cached_tokens,
+                       completion_tokens = completion_tokens + excluded.completion_tokens,
+                       updated = excluded.updated""",
+                [(*key, *values, now) for key in keys],
+            )
+            for scope, owner, name in keys:
+                if scope == "window":
+                    conn.execute(
+                        "DELETE FROM usage_totals WHERE scope = 'window' AND owner = ? AND name <> ?", (owner, name)
+                    )
+                elif scope == "session":
+                    self._session_writes += 1
+                    if self.max_sessions > 0 and self._session_writes % self.prune_every == 0:
+                        self._prune_sessions(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _prune_sessions(self, conn: sqlite3.Connection) -> None:
+        # like the in-memory ledger's LRU, but in one statement every so often
+        pruned = conn.execute(
+            """DELETE FROM usage_totals WHERE rowid IN (
+                   SELECT rowid FROM usage_totals WHERE scope = 'session' ORDER BY updated, rowid
+                   LIMIT max(0, (SELECT COUNT(*) FROM usage_totals WHERE scope = 'session') - ?)
+               )""",
+            (self.max_sessions,),
+        ).rowcount
+        self.counters["sessions_pruned"] += pruned
+
+    def _select(self, sql: str, args: tuple) -> list[tuple]:
+        return self._conn().execute(sql, args).fetchall()
+
+    async def _add(self, keys: list[tuple[str, str, str]], values: list[int]) -> None:
+        await asyncio.to_thread(self._add_rows, keys, values)
+
+    async def _get(self, scope: str, owner: str, name: str) -> list[int]:
+        rows = await asyncio.to_thread(
+            self._select,
+            f"SELECT {', '.join(TOTALS)} FROM usage_totals WHERE scope = ? AND owner = ? AND name = ?",
+            (scope, owner, name),
+        )
+        return list(rows[0]) if rows else [0] * len(TOTALS)
+
+    async def _children(self, scope: str, owner: str) -> dict[str, list[int]]:
+        rows = await asyncio.to_thread(
+            self._select,
+            f"SELECT name, {', '.join(TOTALS)} FROM usage_totals WHERE scope = ? AND owner = ?",
+            (scope, owner),
+        )
+        return {name: list(values) for name, *values in rows}
+
+    async def _top_users(self, limit: int) -> list[tuple[str, list[int]]]:
+        rows = await asyncio.to_thread(
+            self._select,
+            f"SELECT owner, {', '.join(TOTALS)} FROM usage_totals WHERE scope = 'user'"
+            " ORDER BY prompt_tokens + completion_tokens DESC LIMIT ?",
+            (limit,),
+        )
+        return [(owner, list(values)) for owner, *values in rows]
+
+    async def _count_users(self) -> int:
+        rows = await asyncio.to_thread(self._select, "SELECT COUNT(*) FROM usage_totals WHERE scope = 'user'", ())
+        return rows[0][0]
+
+    def stats(self) -> dict:
+        return {**self.counters}
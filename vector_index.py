@@ -0,0 +1,273 @@
+# vector_index.py
+#
+# Local vector index behind long-term memory (see memory_store.
+# VectorMemoryService). Pure NumPy, no model calls.
+#
+# * HashingEmbedder turns text into fixed-size vectors by feature hashing
+#   unigrams and bigrams, so every process embeds the same text the same way
+# * VectorIndex keeps one partition per user: a search only ever scans the
+#   asking user's memories, however large the whole store gets
+# * a partition is searched exactly (one matrix-vector product) until it
+#   holds `ivf_threshold` vectors; from then on it is an IVF index - spherical
+#   k-means lists, retrained whenever the partition doubles - and a search
+#   scans only the lists closest to the query. IVF trades recall for speed,
+#   and on short hashed texts it trades a lot of it (see benchmarks/memory.py),
+#   so the default threshold keeps ordinary users on exact search
+# * partitions are a cache: at most `max_partitions` are kept and ones idle
+#   for `idle_seconds` are let go (cold()/drop(), least recently used first),
+#   so memory follows the users active lately, not every user ever served
+
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+from specialist_cache import tokenize
+
+
+class HashingEmbedder:
+    """Signed feature hashing of unigrams + bigrams, sublinear tf, unit length."""
+
+    def __init__(self, dims: int = 256):
+        self.dims = dims
+
+    def features(self, text: str) -> list[str]:
+        tokens = tokenize(text)
+        return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: dict[int, float] = {}
+            for feature in self.features(text):
+                # crc32 rather than hash(): str hashes are salted per process
+                h = zlib.crc32(feature.encode())
+                slot = h % self.dims
+                counts[slot] = counts.get(slot, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+            for slot, count in counts.items():
+                vectors[row, slot] = np.sign(count) * (1.0 + np.log(abs(count))) if count else 0.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class _Partition:
+    def __init__(self, dims: int):
+        self.vectors = np.empty((64, dims), dtype=np.float32)
+        self.size = 0
+        self.payloads: list[Any] = []
+        self.keys: set[Hashable] = set()
+        self.centroids: Optional[np.ndarray] = None
+        # rows [bounds[c], bounds[c + 1]) are list c as of the last training;
+        # rows added since are in overflow[c]
+        self.bounds: Optional[np.ndarray] = None
+        self.overflow: list[list[int]] = []
+        self._overflow_arrays: dict[int, np.ndarray] = {}
+        self.trained_at = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def overflow_of(self, cluster: int) -> np.ndarray:
+        array = self._overflow_arrays.get(cluster)
+        if array is None:
+            array = self._overflow_arrays[cluster] = np.asarray(self.overflow[cluster], dtype=np.int64)
+        return array
+
+
+class VectorIndex:
+    """
+    Unit vectors with payloads, partitioned by key (e.g. user) and searched
+    by cosine similarity.
+
+    Partitions switch from exact search to IVF at `ivf_threshold` vectors,
+    with about sqrt(size) lists; a query scans the closest `probe_fraction`
+    of them, but at least `nprobe`.
+    Adding a key that is already in the partition is a no-op.
+
+    `cold()` names the partitions beyond `max_partitions` (least recently
+    used first) and those idle for over `idle_seconds`; the owner drops them
+    with `drop()` once it has what it needs to load them again (0 disables
+    either limit).
+    """
+
+    def __init__(
+        self,
+        dims: int = 256,
+        ivf_threshold: int = 100_000,
+        nprobe: int = 8,
+        probe_fraction: float = 0.5,
+        train_iterations: int = 6,
+        max_partitions: int = 10_000,
+        idle_seconds: float = 3600.0,
+    ):
+        self.dims = dims
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.probe_fraction = probe_fraction
+        self.train_iterations = train_iterations
+        self.max_partitions = max_partitions
+        self.idle_seconds = idle_seconds
+        # least recently used first
+        self._partitions: "OrderedDict[Hashable, _Partition]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"added": 0, "searches": 0, "trainings": 0, "evicted_lru": 0, "evicted_idle": 0}
+
+    def _partition(self, name: Hashable, create: bool = True) -> Optional[_Partition]:
+        with self._lock:
+            partition = self._partitions.get(name)
+            if partition is None:
+                if not create:
+                    return None
+                partition = self._partitions[name] = _Partition(self.dims)
+            partition.last_used = time.monotonic()
+            self._partitions.move_to_end(name)
+        return partition
+
+    def cold(self) -> list[Hashable]:
+        """Partitions to let go: idle too long, or beyond `max_partitions`, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            over = max(0, len(self._partitions) - self.max_partitions) if self.max_partitions > 0 else 0
+            names = []
+            for name, partition in self._partitions.items():
+                if len(names) < over:
+                    names.append(name)
+                elif self.idle_seconds > 0 and now - partition.last_used > self.idle_seconds:
+                    names.append(name)
+                else:
+                    break
+            return names
+
+    def drop(self, name: Hashable) -> bool:
+        """Forget partition `name` (its vectors must be kept elsewhere to get it back)."""
+        now = time.monotonic()
+        with self._lock:
+            partition = self._partitions.pop(name, None)
+            if partition is None:
+                return False
+            idle = self.idle_seconds > 0 and now - partition.last_used > self.idle_seconds
+            self.counters["evicted_idle" if idle else "evicted_lru"] += 1
+            return True
+
+    def __contains__(self, name: Hashable) -> bool:
+        return name in self._partitions
+
+    def has_key(self, name: Hashable, key: Hashable) -> bool:
+        partition = self._partitions.get(name)
+        return partition is not None and key in partition.keys
+
+    def add(self, name: Hashable, keys: list[Hashable], vectors: np.ndarray, payloads: list[Any]) -> int:
+        """Add vectors (rows of `vectors`, unit length) and return how many were new."""
+        partition = self._partition(name)
+        with partition.lock:
+            fresh = [i for i, key in enumerate(keys) if key not in partition.keys]
+            if not fresh:
+                return 0
+            vectors = np.asarray(vectors, dtype=np.float32)[fresh]
+            start, end = partition.size, partition.size + len(fresh)
+            if end > len(partition.vectors):
+                grown = np.empty((max(end, 2 * len(partition.vectors)), self.dims), dtype=np.float32)
+                grown[:start] = partition.vectors[:start]
+                partition.vectors = grown
+            partition.vectors[start:end] = vectors
+            partition.size = end
+            for i in fresh:
+                partition.keys.add(keys[i])
+                partition.payloads.append(payloads[i])
+
+            if partition.size >= self.ivf_threshold and partition.size >= 2 * partition.trained_at:
+                self._train(partition)
+            elif partition.centroids is not None:
+                clusters = np.argmax(vectors @ partition.centroids.T, axis=1)
+                for offset, cluster in enumerate(clusters):
+                    partition.overflow[cluster].append(start + offset)
+                    partition._overflow_arrays.pop(int(cluster), None)
+        self.counters["added"] += len(fresh)
+        return len(fresh)
+
+    def _train(self, partition: _Partition) -> None:
+        """Spherical k-means on a sample, then sort every vector into its list."""
+        n = partition.size
+        nlist = max(16, int(np.sqrt(n)))
+        rng = np.random.default_rng(n)
+        vectors = partition.vectors[:n]
+        sample = vectors[rng.choice(n, min(n, nlist * 32), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # an emptied list keeps its old centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        labels = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            labels[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        # store each list contiguously so a probe is a slice, not a gather
+        order = np.argsort(labels, kind="stable")
+        partition.vectors[:n] = vectors[order]
+        partition.payloads = [partition.payloads[i] for i in order]
+        partition.bounds = np.searchsorted(labels[order], np.arange(nlist + 1))
+        partition.overflow = [[] for _ in range(nlist)]
+        partition._overflow_arrays = {}
+        partition.centroids = centroids
+        partition.trained_at = n
+        self.counters["trainings"] += 1
+
+    def search(self, name: Hashable, query: np.ndarray, k: int = 5, exact: bool = False) -> list[tuple[float, Any]]:
+        """Top `k` (score, payload) of partition `name` for a unit `query`, best first."""
+        partition = self._partition(name, create=False)
+        if partition is None or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).ravel()
+        with partition.lock:
+            if partition.size == 0:
+                return []
+            if partition.centroids is None or exact:
+                scores = partition.vectors[:partition.size] @ query
+                rows = None
+            else:
+                nlist = len(partition.centroids)
+                nprobe = min(nlist, max(self.nprobe, int(nlist * self.probe_fraction)))
+                closest = np.argpartition(-(partition.centroids @ query), nprobe - 1)[:nprobe]
+                score_parts, row_parts = [], []
+                for cluster in closest:
+                    lo, hi = partition.bounds[cluster], partition.bounds[cluster + 1]
+                    if hi > lo:
+                        score_parts.append(partition.vectors[lo:hi] @ query)
+                        row_parts.append(np.arange(lo, hi))
+                    extra = partition.overflow_of(int(cluster))
+                    if len(extra):
+                        score_parts.append(partition.vectors[extra] @ query)
+                        row_parts.append(extra)
+                if not score_parts:
+                    return []
+                scores = np.concatenate(score_parts)
+                rows = np.concatenate(row_parts)
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+            results = [
+                (float(scores[i]), partition.payloads[i if rows is None else rows[i]]) for i in top
+            ]
+        self.counters["searches"] += 1
+        return results
+
+    def size(self, name: Optional[Hashable] = None) -> int:
+        if name is not None:
+            partition = self._partitions.get(name)
+            return partition.size if partition is not None else 0
+        return sum(p.size for p in self._partitions.values())
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "partitions": len(self._partitions),
+            "vectors": self.size(),
+            "ivf_partitions": sum(1 for p in self._partitions.values() if p.centroids is not None),
+        }